@@ -1,13 +1,22 @@
+import ast
+import base64
 import importlib
+import json
 import os
 import sys
 import traceback
+from concurrent.futures import ThreadPoolExecutor
 from copy import copy
+from threading import Lock
+from time import monotonic
 
 from zpui_lib.apps import ZeroApp
 from zpui_lib.helpers import setup_logger, zpui_running_as_service
 from zpui_lib.ui import Printer, Menu, HelpOverlay, GridMenu, Entry, Canvas, MockOutput, \
                GridMenuLabelOverlay, GridMenuSidebarOverlay, GridMenuNavOverlay, open_image, invert_image
+from PIL import Image
+
+from startup_profiler import profiler
 
 if sys.version_info < (3, 10):
     from importlib_metadata import entry_points
@@ -38,6 +47,9 @@ class AppManager(object):
     }
     """
     ordering_cache = {}
+    # in lazy mode, apps that define these still get loaded at boot, since they
+    # need to hook into ZPUI before they're opened, or decide if they're shown at all
+    eager_hooks = ("set_context", "execute_after_contexts", "can_load")
 
     def __init__(self, app_directory, context_manager, zpui, config=None, default_plugins=True):
         self.subdir_menus = {}
@@ -54,6 +66,12 @@ class AppManager(object):
         self.i, self.o = self.cm.get_io_for_context("main")
         self.orig_o = self.o
         self.config = config if config else {}
+        self.lazy_load = self.config.get("lazy_load", False)
+        self.lazy_load_lock = Lock()
+        self.load_times = {}
+        self.load_threads = self.config.get("load_threads", 4)
+        manifest_path = self.config.get("manifest_cache", self.get_default_manifest_path())
+        self.manifest = AppManifest(manifest_path) if manifest_path else None
         self.has_status_bar = False
         if "status_bar_height" in self.config:
             # status bar provider
@@ -73,6 +91,14 @@ class AppManager(object):
         if default_plugins and self.config.get("default_overlays", True):
             self.register_default_plugins()
 
+    def get_default_manifest_path(self):
+        """
+        The manifest is kept in the app directory, next to the apps it describes. A relative
+        app directory is taken relative to the ZPUI directory, not to the CWD.
+        """
+        zpui_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        return os.path.join(zpui_dir, self.app_directory, "app_manifest.json")
+
     def after_load(self):
         if self.has_status_bar:
             provider = self.zpui.cm.get_provider("status_bar")
@@ -95,26 +121,52 @@ class AppManager(object):
         self.canvas.paste(image, (0, self.status_bar_height))
         self.canvas.display()
 
+    def cached(self, key, compute, depends_on):
+        """
+        Gets a value from the app manifest cache, or calls ``compute`` to get it and puts it
+        into the cache. ``depends_on`` is a list of paths which, when changed, invalidate
+        the cache - it's read after ``compute`` is called, so ``compute`` can fill it.
+        """
+        if self.manifest is None:
+            return compute()
+        return self.manifest.get_or_compute(key, compute, depends_on)
+
+    def get_icons(self, dir):
+        """Returns a dictionary of decoded icon images from ``dir``, by icon name."""
+        icon_paths = [dir]
+        def load_icons():
+            icons = {}
+            for f in sorted(os.listdir(dir)):
+                if not f.endswith(".png"):
+                    continue
+                path = os.path.join(dir, f)
+                icon_paths.append(path)
+                image = open_image(path)
+                image.load()
+                icons[f.rsplit('.', 1)[0]] = encode_image(image)
+            return icons
+        icons = self.cached("icons:"+dir, load_icons, icon_paths)
+        return {name:decode_image(data) for name, data in icons.items()}
+
     def create_main_menu(self, menu_name, contents):
         dir = "resources/icons/"
-        icons = [f for f in os.listdir(dir) if f.endswith(".png")]
-        icon_paths = {f.rsplit('.', 1)[0]:os.path.join(dir, f) for f in icons}
+        icons = self.get_icons(dir)
         used_icons = []
         for entry in contents:
-            for icon_name, icon_path in icon_paths.items():
+            for icon_name, icon in icons.items():
                 if entry.basename.startswith(icon_name):
-                    entry.icon = open_image(icon_path)
+                    entry.icon = icon
                     used_icons.append(icon_name)
                     break
             else:
-                try:
-                    entry.icon = open_image(os.path.join(dir, "placeholder.png"))
-                except:
-                    logger.exception("Failed to load placeholder, continuing icon-less")
+                if "placeholder" in icons:
+                    entry.icon = icons["placeholder"]
+                else:
+                    logger.error("Failed to load placeholder, continuing icon-less")
         if zpui_running_as_service():
-            exit_entry = Entry("Restart ZPUI", "exit", icon=open_image(icon_paths["exit"]))
+            exit_entry = Entry("Restart ZPUI", "exit", icon=icons["exit"])
         else:
-            exit_entry = Entry("Exit", "exit", icon=open_image(icon_paths["exit"]))
+            exit_entry = Entry("Exit", "exit", icon=icons["exit"])
         #print([x for x, y, in icon_paths if x not in used_icons])
         font = ("Fixedsys62.ttf", 16)
         menu = GridMenu(contents, self.i, self.o, font=font, name="Main menu", exitable=False, navigation_wrap=False)
@@ -154,7 +206,8 @@ class AppManager(object):
             if subdir_path == base_subdir:
                 continue
             parent_path = os.path.split(subdir_path)[0]
-            menu_name = self.get_subdir_menu_name(subdir_path)
+            menu_name = self.cached("menu_name:"+subdir_path, lambda: self.get_subdir_menu_name(subdir_path), \
+                                    [os.path.join(subdir_path, "__init__.py")])
             subdir_entry = Entry(menu_name, type="dir", path=subdir_path)
             self.subdir_menu_contents[parent_path].append(subdir_entry)
         subdir_menu_paths = self.subdir_menu_contents.keys()
@@ -194,7 +247,7 @@ class AppManager(object):
         if empty_dirs:
             logger.info("Removed empty directories: {}".format(", ".join(empty_dirs)))
         for path, subdir_contents in self.subdir_menu_contents.items():
-            ordering = self.get_ordering(path)
+            ordering = self.cached("ordering:"+path, lambda: self.get_ordering(path), [os.path.join(path, "__init__.py")])
             unordered_contents = self.prepare_menu_contents_for_ordering(subdir_contents)
             menu_contents = self.order_contents_by_ordering(unordered_contents, ordering)
             creator = self.subdir_menu_creators.get(path, self.create_subdir_menu)
@@ -231,44 +284,56 @@ class AppManager(object):
         self.subdir_paths.append(self.app_directory.rstrip("/"))
         # apps having an "execute_after_contexts" hook
         after_contexts_apps = {}
+        if self.manifest:
+            self.manifest.load()
+        pool = ThreadPoolExecutor(max_workers=max(1, self.load_threads), thread_name_prefix="App loader")
+        # scanning for entrypoint-based apps in the background, it takes a while
+        entry_points_scan = pool.submit(lambda: list(entry_points(group='zpui_app.3rdparty')))
         # first: directory-based discovery
-        for path, subdirs, modules in app_walk(self.app_directory):
+        walked_dirs = []
+        walk_results = self.cached("walk:"+self.app_directory, lambda: app_walk(self.app_directory, walked_dirs), walked_dirs)
+        app_paths = []
+        for path, subdirs, modules in walk_results:
             for subdir in subdirs:
                 subdir_path = os.path.join(path, subdir)
                 self.subdir_paths.append(subdir_path)
             for _module in modules:
                 module_path = os.path.join(path, _module)
-                try:
-                    if module_path in apps_blocked_in_config:
-                        logger.warning("App {} blocked from config; not loading".format(module_path))
+                if module_path in apps_blocked_in_config:
+                    logger.warning("App {} blocked from config; not loading".format(module_path))
+                    continue
+                if self.lazy_load:
+                    metadata = self.cached("metadata:"+module_path, lambda: get_app_metadata(module_path), \
+                                           [os.path.join(module_path, "main.py")])
+                    if not self.app_needs_eager_loading(module_path, metadata):
+                        self.add_lazy_app(module_path, metadata)
                         continue
-                    app = self.load_app_by_path(module_path)
-                    has_loaded = True; s = ""
-                    if hasattr(app, "can_load"):
-                        result = app.can_load()
-                        if result != True: # likely, a list of things has been returned
-                            if result == None:
-                                logger.warning("App {} returned None from can_load! Assuming True".format(module_path))
-                            else:
-                                has_loaded, s = result
-                    if has_loaded:
-                        logger.info("Loaded app {}".format(module_path))
-                        self.app_list[module_path] = app
-                        menu_name = self.get_app_name(app, module_path)
-                        self.bind_context(app, module_path, menu_name)
-                        if self.app_has_after_contexts_hook(app):
-                            after_contexts_apps[module_path] = app
-                    else:
-                        self.mark_app_as_nonloaded(app, module_path, s)
-                except:
-                    logger.exception("Failed to load app {}".format(module_path))
-                    self.failed_apps[module_path] = traceback.format_exc()
-            if interactive:
-                if self.failed_apps:
-                    failed_app_names = [os.path.split(p)[1] for p in self.failed_apps.keys()]
-                    Printer(["Failed to load:"]+failed_app_names, self.i, self.orig_o, 0.5)
+                app_paths.append(module_path)
+        for module_path, app, has_loaded, s in self.load_apps_by_paths(app_paths, pool):
+            try:
+                if has_loaded:
+                    logger.info("Loaded app {}".format(module_path))
+                    self.app_list[module_path] = app
+                    menu_name = self.get_app_name(app, module_path)
+                    self.bind_context(app, module_path, menu_name)
+                    if self.app_has_after_contexts_hook(app):
+                        after_contexts_apps[module_path] = app
+                else:
+                    self.mark_app_as_nonloaded(app, module_path, s)
+            except:
+                logger.exception("Failed to load app {}".format(module_path))
+                self.failed_apps[module_path] = traceback.format_exc()
+        if interactive:
+            if self.failed_apps:
+                failed_app_names = [os.path.split(p)[1] for p in self.failed_apps.keys()]
+                Printer(["Failed to load:"]+failed_app_names, self.i, self.orig_o, 0.5)
         # second: entrypoint-based and config-file-based app loading
-        discovered_apps = list(entry_points(group='zpui_app.3rdparty'))
+        try:
+            discovered_apps = entry_points_scan.result()
+        except:
+            logger.exception("Failed to scan entrypoints for external apps")
+            discovered_apps = []
+        pool.shutdown(wait=False)
         # workaround for systems where entrypoints don't work for one reason or another
         manual_apps = self.config.get("app_paths", [])
         for app_ep in discovered_apps + manual_apps:
@@ -336,13 +401,127 @@ class AppManager(object):
                 logger.exception("Failed to execute 'after all contexts' hook for {}".format(app_path))
             else:
                 logger.debug("Executed 'after all contexts' hook for {}".format(app_path))
-        base_menu = self.create_menu_structure()
+        with profiler.span("create_menu_structure"):
+            base_menu = self.create_menu_structure()
         self.register_hooks()
+        if self.manifest:
+            self.manifest.save()
         return base_menu
 
+    def load_apps_by_paths(self, app_paths, pool):
+        """
+        Loads apps, importing them and running their ``can_load`` checks on a thread pool.
+        Contexts are created and apps are initialized on the current thread, in the order
+        the apps are given in. Yields ``(path, app, has_loaded, reason)`` tuples in the same
+        order, skipping apps that failed to load (those go into ``self.failed_apps``).
+        Per-app load times end up in ``self.load_times``.
+        """
+        def timed(name, module_path, func, *args):
+            start = monotonic()
+            result = func(*args)
+            end = monotonic()
+            profiler.add_span("{} {}".format(name, module_path), start, end, "apps", app=module_path)
+            return result, end - start
+        imports = [(path, pool.submit(timed, "import", path, importlib.import_module, path.replace('/', '.') + '.main')) for path in app_paths]
+        initialized = []
+        for module_path, future in imports:
+            try:
+                module, import_time = future.result()
+                app, init_time = timed("init", module_path, self.load_app, module, module_path)
+            except:
+                logger.exception("Failed to load app {}".format(module_path))
+                self.failed_apps[module_path] = traceback.format_exc()
+                continue
+            self.load_times[module_path] = {"import":import_time, "init":init_time}
+            initialized.append((module_path, app, pool.submit(timed, "can_load", module_path, self.check_can_load, app, module_path)))
+        for module_path, app, future in initialized:
+            try:
+                (has_loaded, s), can_load_time = future.result()
+            except:
+                logger.exception("Failed to load app {}".format(module_path))
+                self.failed_apps[module_path] = traceback.format_exc()
+                continue
+            self.load_times[module_path]["can_load"] = can_load_time
+            yield module_path, app, has_loaded, s
+        slowest = sorted(self.load_times.items(), key=lambda x: -sum(x[1].values()))[:5]
+        for module_path, times in slowest:
+            logger.info("App {} took {:.3f}s to load ({})".format(module_path, sum(times.values()), \
+                        ", ".join(["{} {:.3f}s".format(k, v) for k, v in times.items()])))
+
+    def check_can_load(self, app, module_path):
+        """Calls the app's ``can_load`` if it has one, returns a ``(has_loaded, reason)`` tuple."""
+        has_loaded = True; s = ""
+        if hasattr(app, "can_load"):
+            result = app.can_load()
+            if result != True: # likely, a list of things has been returned
+                if result == None:
+                    logger.warning("App {} returned None from can_load! Assuming True".format(module_path))
+                else:
+                    has_loaded, s = result
+        return has_loaded, s
+
+    def app_needs_eager_loading(self, module_path, metadata):
+        """
+        In lazy mode, tells whether the app still has to be loaded at boot - if the config
+        says so, if the app sets ``load_eagerly``, or if the app has hooks that need to run
+        before it's opened. Apps that couldn't be parsed are loaded at boot, too.
+        """
+        if module_path in self.config.get("eager_load", []):
+            return True
+        if metadata is None:
+            return True
+        if metadata["load_eagerly"] is not None:
+            return bool(metadata["load_eagerly"])
+        return any([name in metadata["functions"] for name in self.eager_hooks])
+
+    def add_lazy_app(self, module_path, metadata):
+        """
+        Adds an app to the menu without importing it - the app is only imported and initialized
+        once the user opens it, see ``load_lazy_app``.
+        """
+        logger.info("Deferred loading app {}".format(module_path))
+        app = LazyApp(self, module_path, metadata["menu_name"])
+        self.cm.create_context(module_path.replace('/', '.'))
+        self.app_list[module_path] = app
+        self.bind_context(app, module_path, self.get_app_name(app, module_path))
+
+    def load_lazy_app(self, module_path):
+        """
+        Imports and initializes an app that was added with ``add_lazy_app``, and makes
+        its context point to the app itself from now on. Returns the app, or None
+        if the app failed to load or refused to load - telling the user about it.
+        """
+        with self.lazy_load_lock:
+            app = self.app_list.get(module_path)
+            if not isinstance(app, LazyApp):
+                return app # loaded already
+            menu_name = self.get_app_name(app, module_path)
+            i, o = self.cm.get_io_for_context(module_path.replace('/', '.'))
+            try:
+                loaded_app = self.load_app_by_path(module_path)
+                has_loaded, s = self.check_can_load(loaded_app, module_path)
+            except:
+                logger.exception("Failed to load app {}".format(module_path))
+                self.failed_apps[module_path] = traceback.format_exc()
+                Printer(["Failed to load:", menu_name], i, o, 1)
+                return None
+            if not has_loaded:
+                self.mark_app_as_nonloaded(loaded_app, module_path, s)
+                Printer(["Can't load:", menu_name, str(s)], i, o, 1)
+                return None
+            logger.info("Loaded app {}".format(module_path))
+            if not hasattr(loaded_app, "menu_name"):
+                loaded_app.menu_name = menu_name
+            self.app_list[module_path] = loaded_app
+            self.bind_context(loaded_app, module_path, loaded_app.menu_name)
+            return loaded_app
+
     def nonloaded_apps_provider(self):
         return copy(self.nonloaded_apps)
 
+    def load_times_provider(self):
+        return copy(self.load_times)
+
     def failed_apps_provider(self):
         return copy(self.failed_apps)
 
@@ -351,6 +530,7 @@ class AppManager(object):
             main_context = self.cm.contexts["main"]
             main_context.set_provider("appmanager_nonloaded", self.nonloaded_apps_provider)
             main_context.set_provider("appmanager_failed", self.failed_apps_provider)
+            main_context.set_provider("appmanager_load_times", self.load_times_provider)
         except:
             logger.exception("Failed to register app hooks")
 
@@ -408,7 +588,10 @@ class AppManager(object):
 
     def load_app(self, app, app_path=None, threaded=True):
         app_path = app_path.replace('/', '.') # just in case lol
-        context = self.cm.create_context(app_path)
+        # lazily loaded apps already have a context
+        context = self.cm.contexts.get(app_path)
+        if context is None:
+            context = self.cm.create_context(app_path)
         context.threaded = threaded
         i, o = self.cm.get_io_for_context(app_path)
         if is_class_based_module(app):
@@ -496,7 +679,132 @@ class AppManager(object):
         return ordering
 
 
-def app_walk(base_dir):
+class AppManifest(object):
+    """
+    A cache for things the app manager finds out at boot - where the apps are,
+    directory menu names and orderings, app metadata and decoded icons. Each cached
+    value is stored together with modification times of files and directories it was
+    derived from; if any of them changed (or disappeared), the whole cache is discarded
+    on load and rebuilt as the values are requested again.
+    """
+
+    version = 1
+
+    def __init__(self, path):
+        self.path = path
+        self.entries = {}
+        self.mtimes = {}
+        self.changed = False
+
+    def load(self):
+        """Loads the cache from disk, returns False if it's not there or out of date."""
+        self.entries = {}
+        self.mtimes = {}
+        self.changed = True
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return False
+        if not isinstance(data, dict) or data.get("version") != self.version:
+            return False
+        for path, mtime in data["mtimes"].items():
+            try:
+                if os.stat(path).st_mtime_ns != mtime:
+                    logger.info("{} changed, rebuilding the app manifest".format(path))
+                    return False
+            except OSError:
+                return False
+        self.entries = data["entries"]
+        self.mtimes = data["mtimes"]
+        self.changed = False
+        return True
+
+    def get_or_compute(self, key, compute, depends_on):
+        if key in self.entries:
+            return self.entries[key]
+        value = compute()
+        for path in depends_on:
+            try:
+                self.mtimes[path] = os.stat(path).st_mtime_ns
+            except OSError:
+                pass # doesn't exist, not much to check
+        self.entries[key] = value
+        self.changed = True
+        return value
+
+    def save(self):
+        if not self.changed:
+            return
+        try:
+            with open(self.path, 'w') as f:
+                json.dump({"version":self.version, "mtimes":self.mtimes, "entries":self.entries}, f)
+        except (OSError, TypeError, ValueError):
+            logger.exception("Couldn't save the app manifest to {}".format(self.path))
+        else:
+            self.changed = False
+
+
+def encode_image(image):
+    return {"mode":image.mode, "size":image.size, "data":base64.b64encode(image.tobytes()).decode("ascii")}
+
+def decode_image(data):
+    return Image.frombytes(data["mode"], tuple(data["size"]), base64.b64decode(data["data"]))
+
+
+class LazyApp(object):
+    """
+    Stands in for an app that hasn't been imported yet. Its callback is the
+    context target until the app is opened for the first time; it then loads
+    the app and runs it.
+    """
+
+    def __init__(self, app_manager, module_path, menu_name=None):
+        self.app_manager = app_manager
+        self.module_path = module_path
+        if menu_name:
+            self.menu_name = menu_name
+
+    def callback(self):
+        app = self.app_manager.load_lazy_app(self.module_path)
+        if app is None:
+            return
+        if hasattr(app, "on_start") and callable(app.on_start):
+            return app.on_start()
+        return app.callback()
+
+
+def get_app_metadata(app_path):
+    """
+    Gets what the app manager needs to know about an app without importing it,
+    by parsing its main.py - ``menu_name`` and ``load_eagerly`` (if set as literals,
+    on module or class level), and names of module-level functions and class methods.
+    Returns None if main.py can't be parsed.
+    """
+    try:
+        with open(os.path.join(app_path, "main.py")) as f:
+            tree = ast.parse(f.read())
+    except (OSError, SyntaxError, ValueError):
+        logger.exception("Can't parse main.py of app {}".format(app_path))
+        return None
+    metadata = {"menu_name":None, "load_eagerly":None, "functions":[]}
+    bodies = [tree.body] + [node.body for node in tree.body if isinstance(node, ast.ClassDef)]
+    for body in bodies:
+        for node in body:
+            if isinstance(node, ast.Assign):
+                for target in node.targets:
+                    if isinstance(target, ast.Name) and target.id in ("menu_name", "load_eagerly") \
+                      and metadata[target.id] is None:
+                        try:
+                            metadata[target.id] = ast.literal_eval(node.value)
+                        except ValueError:
+                            pass # not a literal
+            elif isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+                metadata["functions"].append(node.name)
+    return metadata
+
+
+def app_walk(base_dir, listed_dirs=None):
     """Example of app_walk(directory):
     [('./apps', ['ee_apps', 'media_apps', 'test', 'system_apps', 'skeleton', 'network_apps'], ['__init__.pyc', '__init__.py']),
     ('./apps/ee_apps', ['i2ctools'], ['__init__.pyc', '__init__.py']),
@@ -508,12 +816,16 @@ def app_walk(base_dir):
     walk_results = []
     modules = []
     subdirs = []
+    if listed_dirs is not None:
+        listed_dirs.append(base_dir)
     for element in os.listdir(base_dir):
         full_path = os.path.join(base_dir, element)
         if os.path.isdir(full_path):
+            if listed_dirs is not None:
+                listed_dirs.append(full_path)
             if is_subdir(full_path):
                 subdirs.append(element)
-                results = app_walk(full_path)
+                results = app_walk(full_path, listed_dirs)
                 for result in results:
                     walk_results.append(result)
             elif is_module_dir(full_path):
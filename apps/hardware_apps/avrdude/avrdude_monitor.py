@@ -0,0 +1,204 @@
+"""
+Runs avrdude and follows its progress without polling - the output is read as it arrives
+(through a selector, from a pseudo-terminal, since avrdude only shows progress bars on
+a terminal), parsed into statuses that ``AvrdudeProcess.get_interactive_status`` would
+return, and passed to a callback - progress updates at most every ``min_interval`` seconds.
+
+Can also replay a recorded avrdude output, for tests and benchmarks without hardware::
+
+    python3 avrdude_monitor.py --replay fixtures/write_flash.json [--speed 10]
+"""
+
+import os
+import pty
+import re
+import selectors
+import subprocess
+from time import monotonic
+
+from zpui_lib.libs.pyavrdude import pyavrdude
+from zpui_lib.helpers import setup_logger
+
+logger = setup_logger(__name__, "warning")
+
+progress_re = re.compile(r"^(Reading|Writing) \| #* *\| (\d+)% (\d+\.\d+s)(.*)$")
+
+
+class OutputParser(object):
+    """
+    Parses avrdude output chunk by chunk, no matter where the chunks are split.
+    ``respond`` is called with the text to send to avrdude when it asks a question.
+    """
+
+    default_yn_response = 'n'
+
+    def __init__(self, respond=None, fuse_changeback_response='n'):
+        self.respond = respond
+        self.fuse_changeback_response = fuse_changeback_response
+        self.buffer = ""
+        self.output = []
+        self.is_verifying = False
+        self.status = {"status":"started"}
+
+    def get_full_output(self):
+        return "".join(self.output)
+
+    def feed(self, data):
+        """Parses a chunk of output, returns a list of statuses it resulted in (if any)."""
+        self.output.append(data)
+        statuses = []
+        # progress lines start with \r and get overwritten, so \r ends a line, too
+        lines = re.split("[\r\n]", self.buffer + data)
+        self.buffer = lines.pop()
+        for line in lines:
+            self.process_line(line, statuses)
+        if self.buffer.rstrip().endswith("[y/n]"):
+            # questions don't end with a newline, avrdude waits for an answer
+            self.process_line(self.buffer, statuses)
+            self.buffer = ""
+        return statuses
+
+    def set_status(self, status, statuses):
+        if status != self.status:
+            self.status = status
+            statuses.append(status)
+
+    def process_line(self, line, statuses):
+        match = progress_re.match(line)
+        if match:
+            operation, percentage, time, info = match.groups()
+            if info.strip().startswith("***failed"):
+                self.set_status({"status":"failure"}, statuses)
+                return
+            operation = operation.lower()
+            if operation == "reading" and self.is_verifying:
+                operation = "verifying"
+            self.set_status({"status":"in progress", "operation":operation, "progress":int(percentage), "time":time}, statuses)
+        elif line.strip().endswith("[y/n]"):
+            if "Would you like this fuse to be changed back?" in line:
+                self.send(self.fuse_changeback_response)
+                self.set_status({"status":"in progress", "operation":"restoring fuses"}, statuses)
+            else:
+                # a question we don't know about - answering, otherwise avrdude would wait forever
+                logger.warning("Unknown question from avrdude: {}".format(line))
+                self.send(self.default_yn_response)
+        elif "avrdude: erasing chip" in line:
+            self.set_status({"status":"in progress", "operation":"erasing"}, statuses)
+        elif "avrdude: " in line and "verified" in line and "bytes of" in line:
+            self.is_verifying = False
+        elif "avrdude: " in line and "verifying" in line:
+            self.is_verifying = True
+
+    def send(self, response):
+        if self.respond:
+            self.respond(response+'\n')
+
+
+class AvrdudeMonitor(object):
+    """
+    Runs an avrdude command (say, ``AvrdudeProcess.command``), blocking until it finishes,
+    and calls ``callback`` with each new status. Statuses that only update the progress
+    of an operation are passed on at most every ``min_interval`` seconds; the others
+    (and the final ``success``/``failure`` status) are passed on right away.
+    """
+
+    def __init__(self, command, callback=None, min_interval=0.1, fuse_changeback_response='n'):
+        self.command = command
+        self.callback = callback
+        self.min_interval = min_interval
+        self.parser = OutputParser(respond=self.write, fuse_changeback_response=fuse_changeback_response)
+        self.process = None
+        self.terminal = None
+        self.pending = None
+        self.last_sent = None
+        self.last_sent_at = 0
+        self.statuses_sent = 0
+
+    def write(self, data):
+        os.write(self.terminal, data.encode("ascii"))
+
+    def run(self):
+        """Runs the command and monitors it, returns its exit code."""
+        self.terminal, child_terminal = pty.openpty()
+        try:
+            self.process = subprocess.Popen(self.command, stdin=child_terminal, stdout=child_terminal, stderr=child_terminal, close_fds=True)
+        finally:
+            # otherwise, we wouldn't notice the process closing its end
+            os.close(child_terminal)
+        self.send_status(self.parser.status, force=True)
+        selector = selectors.DefaultSelector()
+        selector.register(self.terminal, selectors.EVENT_READ)
+        try:
+            while True:
+                timeout = None
+                if self.pending is not None:
+                    timeout = max(0, self.last_sent_at + self.min_interval - monotonic())
+                if selector.select(timeout):
+                    try:
+                        data = os.read(self.terminal, 4096)
+                    except OSError: # EIO - the process has exited and closed the terminal
+                        data = b""
+                    if not data:
+                        break
+                    for status in self.parser.feed(data.decode("utf-8", errors="replace")):
+                        self.send_status(status)
+                if self.pending is not None and monotonic() - self.last_sent_at >= self.min_interval:
+                    self.send_status(self.pending, force=True)
+        finally:
+            selector.close()
+            os.close(self.terminal)
+        returncode = self.process.wait()
+        self.send_status({"status":"success"} if returncode == 0 else {"status":"failure"}, force=True)
+        return returncode
+
+    def send_status(self, status, force=False):
+        last = self.last_sent
+        progress_only = last is not None and status.get("operation") == last.get("operation") \
+                        and status["status"] == last["status"]
+        if progress_only and not force and monotonic() - self.last_sent_at < self.min_interval:
+            self.pending = status
+            return
+        self.pending = None
+        self.last_sent = status
+        self.last_sent_at = monotonic()
+        self.statuses_sent += 1
+        if self.callback:
+            self.callback(status)
+
+    def get_status(self):
+        """
+        Full status of the finished process, the same as ``AvrdudeProcess.get_status`` returns
+        (to be passed to ``heuristics`` functions).
+        """
+        status = {"result":None, "exitcode":0, "errors":[], "output":[], "full_output":None, "other":[]}
+        status["commandline"] = self.command
+        status["exitcode"] = self.process.returncode
+        if self.process.returncode is None:
+            status["result"] = "ongoing"
+        else:
+            status["result"] = "success" if self.process.returncode == 0 else "failed"
+        status["full_output"] = self.parser.get_full_output()
+        return pyavrdude.parse_output_into_status(status)
+
+
+def replay(path, speed=1):
+    """Writes avrdude output recorded in ``path`` to stdout, with the same pauses between chunks."""
+    import json
+    import sys
+    from time import sleep
+    with open(path) as f:
+        chunks = json.load(f)
+    for delay, data in chunks:
+        if delay:
+            sleep(delay / speed)
+        sys.stdout.write(data)
+        sys.stdout.flush()
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="replays recorded avrdude output")
+    parser.add_argument("--replay", required=True, metavar="PATH", help="JSON file with [delay, output] pairs")
+    parser.add_argument("--speed", type=float, default=1, help="replay this many times faster")
+    args = parser.parse_args()
+    replay(args.replay, args.speed)
@@ -11,6 +11,7 @@ from subprocess import call
 from zpui_lib.libs.pyavrdude import pyavrdude, heuristics
 
 import graphics
+import avrdude_monitor
 
 class AvrdudeApp(ZeroApp):
     menu_name = "Avrdude"
@@ -311,6 +312,28 @@ class AvrdudeApp(ZeroApp):
 
     # 6. Avrdude process monitor state machine
 
+    def update_process_status(self, s):
+        """
+        Updates the loading indicators with a new status of the avrdude process
+        (in ``AvrdudeProcess.get_interactive_status`` format).
+        """
+        if s["status"] == "started":
+            self.read_write_bar.pause()
+            self.erase_restore_indicator.background_if_inactive()
+            self.erase_restore_indicator.message = "Started"
+        elif s["status"] == "in progress":
+            if s["operation"] in ["reading", "writing", "verifying"]:
+                self.erase_restore_indicator.pause()
+                self.read_write_bar.background_if_inactive()
+                self.read_write_bar.message = s["operation"].capitalize()
+                self.read_write_bar.message += " " + s["time"]
+                self.read_write_bar.progress = s["progress"]
+            elif s["operation"] in ["erasing", "restoring fuses"]:
+                self.read_write_bar.pause()
+                self.erase_restore_indicator.message = s["operation"].capitalize()
+        elif s["status"] in ["success", "failure"]:
+            pass # The result is shown once the process is over
+
     def run_and_monitor_process(self):
         """
         Starts and monitors the avrdude process; updating the user
@@ -319,34 +342,13 @@ class AvrdudeApp(ZeroApp):
         will also allow sending bugreports about yet-unknown failures during
         the process.
         """
-        self.p.run()
-        previous_s = {"status": "not received yet"}
-        while previous_s['status'] not in ["success", "failure"]:
-            self.p.poll()
-            s = self.p.get_interactive_status()
-            if s != previous_s:
-                # Status changed, updating
-                if s["status"] == "started":
-                    self.read_write_bar.pause()
-                    self.erase_restore_indicator.background_if_inactive()
-                    self.erase_restore_indicator.message = "Started"
-                elif s["status"] == "in progress":
-                    if s["operation"] in ["reading", "writing", "verifying"]:
-                        self.erase_restore_indicator.pause()
-                        self.read_write_bar.background_if_inactive()
-                        self.read_write_bar.message = s["operation"].capitalize()
-                        self.read_write_bar.message += " " + s["time"]
-                        self.read_write_bar.progress = s["progress"]
-                    elif s["operation"] in ["erasing", "restoring fuses"]:
-                        self.read_write_bar.pause()
-                        self.erase_restore_indicator.message = s["operation"].capitalize()
-                elif s["status"] in ["success", "failure"]:
-                    pass # Is going to fail/succeed anyway once it goes through all the lines
-                previous_s = s
+        monitor = avrdude_monitor.AvrdudeMonitor(self.p.command, callback=self.update_process_status, \
+                                                 fuse_changeback_response=self.p.fuse_changeback_response)
+        monitor.run()
         # Process is over, showing the result
         self.read_write_bar.stop()
         self.erase_restore_indicator.stop()
-        status = self.p.get_status()
+        status = monitor.get_status()
         hrs = heuristics.get_human_readable_status(status)
         self.display_status(hrs, success_message = "Done!", delay=1)
         #if hrs == ['Failure', 'Unknown error']:
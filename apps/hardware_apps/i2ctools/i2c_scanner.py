@@ -0,0 +1,217 @@
+"""
+I2C bus scanner - scans several buses at once (one thread per bus), probing addresses
+the same way ``i2cdetect`` does by default, and keeps the last scan of each bus around.
+"""
+
+import errno
+from collections import OrderedDict
+from threading import Thread, Lock, Event
+from time import time
+
+import smbus
+
+from zpui_lib.helpers import setup_logger
+
+logger = setup_logger(__name__, "warning")
+
+# statuses of scans that were stopped early, with no usable results
+error_statuses = ("permission denied", "bus stuck", "no such bus", "scan failed")
+
+
+def get_probe_method(address, mode="auto"):
+    """
+    Returns the SMBus method name to probe an address with. Just like ``i2cdetect``,
+    in ``auto`` mode, reads are used for EEPROM-like address ranges (a quick write can
+    corrupt some EEPROMs), and quick writes are used for everything else
+    (a read can lock up some write-only chips).
+
+    >>> get_probe_method(0x50), get_probe_method(0x3c), get_probe_method(0x3c, "read")
+    ('read_byte', 'write_quick', 'read_byte')
+    """
+    if mode == "read":
+        return "read_byte"
+    elif mode == "quick":
+        return "write_quick"
+    if 0x30 <= address <= 0x37 or 0x50 <= address <= 0x5f:
+        return "read_byte"
+    return "write_quick"
+
+
+class ScanStopped(Exception):
+    pass
+
+
+class ScanResult(object):
+    """
+    Results of a single bus scan, filled in while the scan is running. ``status``
+    is "scanning" until the scan finishes, then "ok", "timeout" or one of ``error_statuses``.
+    """
+
+    def __init__(self, bus):
+        self.bus = bus
+        self.devices = OrderedDict()
+        self.status = "scanning"
+        self.started = time()
+        self.finished = None
+        self.done = Event()
+        self.listeners = []
+
+    def is_done(self):
+        return self.done.is_set()
+
+    def wait(self, timeout=None):
+        return self.done.wait(timeout)
+
+    def get_age(self):
+        """Seconds since the scan finished (``None`` if it hasn't yet)."""
+        return time() - self.finished if self.finished is not None else None
+
+    def to_dict(self):
+        """
+        Results in the format ``scan_i2c_bus`` used to return: an error string if the scan
+        failed, otherwise, a dictionary of addresses and states (with a "status":"timeout"
+        entry if the scan timed out before it could probe all addresses).
+        """
+        if self.status in error_statuses:
+            return self.status
+        devices = OrderedDict(self.devices)
+        if self.status == "timeout":
+            devices["status"] = "timeout"
+        return devices
+
+    def add_device(self, address, state):
+        self.devices[address] = state
+        self.notify(address, state)
+
+    def finish(self, status):
+        self.status = status
+        self.finished = time()
+        self.done.set()
+        self.notify(None, None)
+
+    def notify(self, address, state):
+        for listener in self.listeners:
+            try:
+                listener(self, address, state)
+            except:
+                logger.exception("Scan result listener {} failed!".format(listener))
+
+
+class I2CScanner(object):
+    """
+    Runs bus scans and keeps the results of the last scan of each bus. ``bus_class``
+    is what's used to open buses - ``smbus.SMBus`` unless replaced (say, for tests).
+    """
+
+    def __init__(self, bus_class=smbus.SMBus):
+        self.bus_class = bus_class
+        self.results = {}
+        self.lock = Lock()
+
+    def scan(self, buses, scan_range, timeout=3, mode="auto", callback=None):
+        """
+        Starts scanning ``buses``, one thread per bus, and returns a dictionary of
+        ``ScanResult`` objects right away. If a bus is already being scanned, returns the
+        ongoing scan's results instead of starting a new one. ``callback`` is called from
+        the scanning threads as ``callback(result, address, state)`` for each device found,
+        then as ``callback(result, None, None)`` once the bus scan finishes.
+        ``timeout`` applies to each bus separately.
+        """
+        results = OrderedDict()
+        with self.lock:
+            for bus in buses:
+                result = self.results.get(bus)
+                if result is not None and not result.is_done():
+                    if callback:
+                        result.listeners.append(callback)
+                    results[bus] = result
+                    continue
+                result = ScanResult(bus)
+                if callback:
+                    result.listeners.append(callback)
+                self.results[bus] = result
+                results[bus] = result
+                t = Thread(target=self.scan_bus, args=(result, scan_range, timeout, mode), name="I2C bus {} scan".format(bus))
+                t.daemon = True
+                t.start()
+        return results
+
+    def scan_and_wait(self, buses, scan_range, timeout=3, mode="auto"):
+        """Scans ``buses`` and returns the results once all of them are scanned."""
+        results = self.scan(buses, scan_range, timeout, mode)
+        for result in results.values():
+            result.wait()
+        return results
+
+    def get_cached(self, bus, max_age=None):
+        """
+        Returns the last finished scan of ``bus``, if there is one - and, if ``max_age``
+        is set, if it finished no more than ``max_age`` seconds ago. Otherwise, returns ``None``.
+        """
+        with self.lock:
+            result = self.results.get(bus)
+        if result is None or not result.is_done():
+            return None
+        if max_age is not None and result.get_age() > max_age:
+            return None
+        return result
+
+    def scan_bus(self, result, scan_range, timeout, mode):
+        status = "ok"
+        try:
+            bus = self.bus_class(result.bus)
+        except OSError as e:
+            logger.exception("Can't open I2C bus {}!".format(result.bus))
+            result.finish("permission denied" if e.errno == errno.EACCES else "no such bus")
+            return
+        deadline = time() + timeout
+        try:
+            for address in range(*scan_range):
+                state = self.probe(bus, address, mode)
+                if state is not None:
+                    result.add_device(address, state)
+                if time() > deadline:
+                    status = "timeout"
+                    break
+        except ScanStopped as e:
+            status = str(e)
+        except:
+            logger.exception("I2C bus {} scan failed!".format(result.bus))
+            status = "scan failed"
+        finally:
+            try:
+                bus.close()
+            except:
+                pass
+            result.finish(status)
+
+    def probe(self, bus, address, mode):
+        """
+        Probes an address, returns its state ("ok", "busy" if a kernel driver
+        is bound to it, or an error description) or ``None`` if nothing's there.
+        Raises ``ScanStopped`` if the scan can't continue.
+        """
+        method = get_probe_method(address, mode)
+        try:
+            getattr(bus, method)(address)
+        except PermissionError as e:
+            if e.errno == errno.EACCES:
+                logger.error("Error {}, permission denied, stopping scan! {}".format(e.errno, repr(e)))
+                raise ScanStopped("permission denied")
+            logger.error("Errno {} unknown - can be used? {}".format(e.errno, repr(e)))
+            return "permerr_{}".format(e.errno)
+        except IOError as e:
+            if e.errno == errno.EBUSY:
+                return "busy"
+            elif e.errno in (errno.EIO, errno.EREMOTEIO):
+                return None
+            elif e.errno == errno.ETIMEDOUT:
+                # bus crashout, scan isn't worth continuing
+                logger.error("Error {}, bus crashout, stopping scan! {}".format(e.errno, repr(e)))
+                raise ScanStopped("bus stuck")
+            elif e.errno == errno.EOPNOTSUPP and method == "write_quick" and mode == "auto":
+                # the adapter can't do quick writes, falling back to reads
+                return self.probe(bus, address, "read")
+            logger.error("Errno {} unknown - can be used? {}".format(e.errno, repr(e)))
+            return "ioerr_{}".format(e.errno)
+        return "ok"
@@ -3,13 +3,14 @@ menu_name = "I2C tools"
 from zpui_lib.ui import Menu, Printer, PrettyPrinter, DialogBox, LoadingIndicator, UniversalInput, Refresher, IntegerAdjustInput, fvitg, Listbox
 from zpui_lib.helpers import setup_logger, read_or_create_config, local_path_gen, write_config, get_platform
 
-from collections import OrderedDict
 from subprocess import check_output
 from time import sleep, time
 from copy import copy
 
 import smbus
 
+from i2c_scanner import I2CScanner
+
 local_path = local_path_gen(__name__)
 logger = setup_logger(__name__, "warning")
 default_config = '{"recent_devices":[], "scan_range":"conservative", "default_bus":1, "timeout":3}'
@@ -20,6 +21,7 @@ def save_config(config):
     write_config(config, config_path)
 
 current_bus = None
+scanner = I2CScanner()
 i = None
 o = None
 
@@ -37,52 +39,23 @@ def get_current_bus_num():
 def get_current_bus():
     return smbus.SMBus(get_current_bus_num())
 
-def scan_i2c_bus():
-    Printer("Scanning:", i, o, 0)
-    try:
-        bus = get_current_bus()
-    except PermissionError as e:
-         if e.errno == 13: # permission denied
-             logger.exception("Error {}, permission denied, stopping scan! {}".format(e.errno, repr(e)))
-             return "permission denied"
-         else:
-             raise e
-    found_devices = OrderedDict()
+def get_scan_range():
     scan_range = config.get("scan_range", "conservative")
     if scan_range not in scan_ranges.keys(): #unknown scan range - config edited manually?
       scan_range = "conservative"
-    scan_range_args = scan_ranges[scan_range]
-    timeout = config.get("timeout", 3)
-    start_time = time()
-    for device in range(*scan_range_args):
-      try: #If you try to read and it answers, it's there
-         bus.read_byte(device)
-      except PermissionError as e:
-         if e.errno == 13: # permission denied
-             logger.exception("Error {}, permission denied, stopping scan! {}".format(e.errno, repr(e)))
-             return "permission denied"
-         else:
-             found_devices[device] = "permerr_{}".format(e.errno)
-             logger.error("Errno {} unknown - can be used? {}".format(e.errno, repr(e)))
-      except IOError as e:
-         if e.errno == 16:
-             found_devices[device] = "busy"
-         elif e.errno in (5, 121):
-             pass
-         elif e.errno == 110:
-             # bus crashout, scan isn't worth continuing
-             logger.exception("Error {}, bus crashout, stopping scan! {}".format(e.errno, repr(e)))
-             return "bus stuck"
-             break
-         else:
-             found_devices[device] = "ioerr_{}".format(e.errno)
-             logger.error("Errno {} unknown - can be used? {}".format(e.errno, repr(e)))
-      else:
-        found_devices[device] = "ok"
-      if time() > start_time+timeout:
-          found_devices["status"] = "timeout" # in-band signaling lolsob
-          return found_devices
-    return found_devices
+    return scan_ranges[scan_range]
+
+def scan_buses(buses, callback=None):
+    """Starts scanning ``buses`` in background, returns ``ScanResult`` objects for each of them."""
+    return scanner.scan(buses, get_scan_range(), timeout=config.get("timeout", 3), \
+                        mode=config.get("probe_mode", "auto"), callback=callback)
+
+def scan_i2c_bus(bus=None):
+    if bus is None:
+        bus = get_current_bus_num()
+    result = scan_buses([bus])[bus]
+    result.wait()
+    return result.to_dict()
 
 device_notes = { # order defines first bus picked
     # "default" bus can vary depending on which CPU board is used!
@@ -141,62 +114,92 @@ def get_notes(zconfig=None, platform=None):
             notes.update(notes_entry)
             return notes
 
-def scan_i2c_device_api():
-    devices = scan_i2c_bus()
+def scan_i2c_device_api(bus=None, max_age=None):
+    """
+    Scans an I2C bus (the current one by default) and returns the devices found, with notes
+    on what the devices likely are. If ``max_age`` is set, the last scan of that bus is used
+    instead, as long as it finished no more than ``max_age`` seconds ago.
+    """
+    if bus is None:
+        bus = get_current_bus_num()
+    result = scanner.get_cached(bus, max_age) if max_age is not None else None
+    devices = result.to_dict() if result else scan_i2c_bus(bus)
     if isinstance(devices, str):
         return devices
     if not devices: return {}
-    all_notes = get_notes()
-    current_bus_num = get_current_bus_num()
-    notes = all_notes.get(current_bus_num, {})
+    notes = (get_notes() or {}).get(bus, {})
     for dev, state in copy(devices).items():
         if dev in notes:
             description = notes[dev]
             devices[dev] = f"{state}-{description}"
     return devices
 
-def scan_i2c_devices():
-    try:
-        with LoadingIndicator(i, o, message="Scanning I2C bus"):
-            devices = scan_i2c_bus()
-    except:
-        logger.exception("I2C scan failed!")
-        PrettyPrinter("I2C scan failed!", i, o, 3)
-        return
-    if isinstance(devices, str):
-        PrettyPrinter("I2C scan failed! ({})".format(devices.capitalize()), i, o, 3)
-        return
-    if not devices:
-        Printer("No devices found", i, o, 2)
+def scan_i2c_devices(all_buses=False):
+    """
+    Scans the current bus (or all buses), showing the devices found in a menu as soon
+    as they're found.
+    """
+    if all_buses:
+        buses = sorted(get_buses().keys())
+        if not buses:
+            Printer("No buses found", i, o, 2)
+            return
     else:
-        # user-friendly disambiguations for scan results
-        all_notes = get_notes()
-        current_bus_num = get_current_bus_num()
-        notes = all_notes.get(current_bus_num, {})
-        def ch():
-            device_menu_contents = []
-            has_timeouted = devices.pop("status", False) == "timeout"
-            for dev, state in devices.items():
+        buses = [get_current_bus_num()]
+    show_scan_results(lambda callback: scan_buses(buses, callback=callback))
+
+def show_last_scan():
+    result = scanner.get_cached(get_current_bus_num())
+    if result is not None:
+        show_scan_results(lambda callback: {result.bus: result})
+
+def show_scan_results(get_results):
+    """
+    Shows scan results in a menu, updating it while the scan is ongoing.
+    ``get_results`` gets a callback to be called on each update, and returns ``ScanResult`` objects.
+    """
+    # user-friendly disambiguations for scan results
+    all_notes = get_notes() or {}
+    menu = None
+    def update(result, address, state):
+        if menu is not None and menu.in_foreground:
+            menu.trigger_contents_hook()
+            menu.refresh()
+    results = get_results(update)
+    def ch():
+        device_menu_contents = []
+        for bus, result in results.items():
+            notes = all_notes.get(bus, {})
+            if len(results) > 1:
+                device_menu_contents.append(["Bus {}:".format(bus)])
+            for dev, state in list(result.devices.items()):
                 if dev in notes:
                     description = notes[dev]
-                    device_menu_contents.append(["{} ({}) - {}".format(hex(dev), description, state), lambda x=dev: i2c_device_menu(x)])
+                    device_menu_contents.append(["{} ({}) - {}".format(hex(dev), description, state), lambda x=dev, b=bus: i2c_device_menu(x, b)])
                 else:
-                    device_menu_contents.append(["{} - {}".format(hex(dev), state), lambda x=dev: i2c_device_menu(x)])
-            if has_timeouted:
+                    device_menu_contents.append(["{} - {}".format(hex(dev), state), lambda x=dev, b=bus: i2c_device_menu(x, b)])
+            if result.status == "scanning":
+                device_menu_contents.append(["Scanning..."])
+            elif result.status == "timeout":
                 device_menu_contents.append(["Timeouted!"])
-            return device_menu_contents
-        Menu([], i, o, contents_hook=ch, name="I2C tools app, scan results menu").activate()
-
-def i2c_device_menu(addr):
-    m_c = [["Simple read", lambda: i2c_read_ui(addr)],
+            elif result.status != "ok":
+                device_menu_contents.append(["Failed: {}".format(result.status)])
+            elif not result.devices:
+                device_menu_contents.append(["No devices found"])
+        return device_menu_contents
+    menu = Menu([], i, o, contents_hook=ch, name="I2C tools app, scan results menu")
+    menu.activate()
+
+def i2c_device_menu(addr, bus=None):
+    m_c = [["Simple read", lambda: i2c_read_ui(addr, bus=bus)],
            #["Simple write", lambda: i2c_write_ui(addr)],
-           ["Register read", lambda: i2c_read_ui(addr, reg=True)]]
+           ["Register read", lambda: i2c_read_ui(addr, reg=True, bus=bus)]]
            #["Register write", lambda: i2c_write_ui(addr, reg=True)]]
     Menu(m_c, i, o, "I2C tools app, device menu for address {}".format(hex(addr))).activate()
 
 last_values = []
 
-def i2c_read_ui(address, reg=None):
+def i2c_read_ui(address, reg=None, bus=None):
     global last_values
 
     if reg == True:
@@ -209,7 +212,7 @@ def i2c_read_ui(address, reg=None):
     last_values = []
 
     try:
-        bus = get_current_bus()
+        bus = smbus.SMBus(bus) if bus is not None else get_current_bus()
     except PermissionError as e:
          if e.errno == 13: # permission denied
              logger.exception("Error {}, permission denied, stopping scan! {}".format(e.errno, repr(e)))
@@ -293,6 +296,12 @@ def callback():
     def ch():
         contents = [
             ["Scan bus (bus {})".format(get_current_bus_num()), scan_i2c_devices],
+            ["Scan all buses", lambda: scan_i2c_devices(all_buses=True)],
+        ]
+        last_scan = scanner.get_cached(get_current_bus_num())
+        if last_scan is not None:
+            contents.append(["Last scan ({}s ago)".format(int(last_scan.get_age())), show_last_scan])
+        contents += [
             ["Set bus", set_bus],
             ["Settings", change_settings],
         ]
@@ -1,12 +1,14 @@
 from time import sleep, strftime, localtime
 from textwrap import wrap
-from threading import Event
+from bisect import bisect_right
+from threading import Event, Lock
 
 from zpui_lib.apps import ZeroApp
 from zpui_lib.ui import Listbox, PrettyPrinter as Printer, NumpadCharInput, Menu, LoadingIndicator, TextReader, UniversalInput, MessagesMenu, rfa, MenuExitException
 from zpui_lib.helpers import setup_logger, read_or_create_config, local_path_gen, save_config_method_gen, BackgroundRunner
 
 from client import Client, MatrixRequestError
+from message_store import RoomMessages, MessageCache
 
 local_path = local_path_gen(__name__)
 
@@ -17,6 +19,7 @@ class MatrixClientApp(ZeroApp):
     menu_name = "Matrix Client"
     default_config = '{"server":"matrix.org", "user_id":"", "token":"", "your_other_usernames":[], "show_join_leave_messages":"True"}'
     config_filename = "config.json"
+    cache_filename = "messages.db"
 
     client = None
 
@@ -28,6 +31,8 @@ class MatrixClientApp(ZeroApp):
         self.save_config = save_config_method_gen(self, local_path(self.config_filename))
 
         self.server = self.config.get("server", "matrix.org")
+        self.max_stored_messages = self.config.get("max_stored_messages", 200)
+        self.message_cache = MessageCache(local_path(self.cache_filename), max_messages=self.max_stored_messages)
         self.login_runner = BackgroundRunner(self.background_login)
         self.login_runner.run()
 
@@ -36,8 +41,11 @@ class MatrixClientApp(ZeroApp):
     def init_vars(self):
         self.stored_messages = {}
         self.messages_menu = None
+        # timestamps of messages shown in messages_menu, to find where new messages go
+        self.messages_menu_timestamps = []
         self.active_room = ""
-        self.seen_events = []
+        # Held while adding messages and while switching the active room
+        self.messages_lock = Lock()
         self.has_processed_new_events = Event()
 
     def on_start(self):
@@ -137,10 +145,12 @@ class MatrixClientApp(ZeroApp):
         # Add a listener for new events to all rooms the user is in
         for room_name in self.rooms:
             self.rooms[room_name].add_listener(self._on_message)
-            self.stored_messages[room_name] = {}
-
-            # Used to store data for each event
-            self.stored_messages[room_name]["events"] = []
+            room_messages = RoomMessages(max_messages=self.max_stored_messages)
+            # Messages from the previous sessions, so that the room isn't empty until backfilled
+            for message in self.message_cache.load(room_name):
+                room_messages.check_seen(message["id"])
+                room_messages.add(message)
+            self.stored_messages[room_name] = room_messages
 
         # Start a new thread for the listeners, waiting for events to happen
         self.client.matrix_client.start_listener_thread()
@@ -153,7 +163,7 @@ class MatrixClientApp(ZeroApp):
             current_room = self.rooms[r]
 
             # Count the amount of backfilled messages for each room
-            self.stored_messages[current_room.room_id]["backfilled"] = 0
+            self.stored_messages[current_room.room_id].backfilled = 0
 
             # Get the last 10 messages for each room and update stored_messages
             for e in reversed(current_room.get_events()):
@@ -197,6 +207,7 @@ class MatrixClientApp(ZeroApp):
         self.config["token"] = ''
         self.config["username"] = ''
         self.save_config()
+        self.message_cache.clear()
         self.init_vars()
 
         raise MenuExitException
@@ -224,17 +235,22 @@ class MatrixClientApp(ZeroApp):
         room_name = rfa(room.display_name)
         logger.debug(u"Viewing room: {}".format(room_name))
 
-        # Set the currently active room to this room, important for adding messages and refreshing the menu
-        self.active_room = room.room_id
-
         cb = lambda x=room: self._handle_messages_top(x)
 
-        # Create a menu to display the messages
-        self.messages_menu = MessagesMenu(self._get_messages_menu_contents(room.room_id), self.i, self.o, name="Matrix MessageMenu for {}".format(room_name),
-            entry_height=1, load_more_callback=lambda x=room: self._handle_messages_top(x))
+        with self.messages_lock:
+            # Create a menu to display the messages
+            self.messages_menu = MessagesMenu(self._get_messages_menu_contents(room.room_id), self.i, self.o, name="Matrix MessageMenu for {}".format(room_name),
+                entry_height=1, load_more_callback=lambda x=room: self._handle_messages_top(x))
+            # Set the currently active room to this room, important for adding messages to the menu
+            self.active_room = room.room_id
 
         self.messages_menu.activate()
 
+        with self.messages_lock:
+            self.active_room = ""
+            # Messages could only be dropped from history while the room isn't shown
+            self.stored_messages[room.room_id].trim()
+
     # Displays a single message fully with additional information (author, time)
     def display_single_message(self, msg, author, unix_time):
         full_msg = "{0}\n{1}\n\n".format(strftime("%m-%d %H:%M", localtime(unix_time / 1000)), rfa(author))
@@ -247,10 +263,9 @@ class MatrixClientApp(ZeroApp):
 
     # Used as callback for the room listeners
     def _on_message(self, room, event):
-        if event["event_id"] in self.seen_events:
+        if self.stored_messages[room.room_id].check_seen(event["event_id"]):
             logger.debug("Event {} seen, ignoring".format(event["event_id"]))
             return
-        self.seen_events.append(event["event_id"])
         logger.debug(u"New event: {}".format(event['type']))
         event_type = event.get('type', "not_a_defined_event")
         # Check if a user joined the room
@@ -309,36 +324,53 @@ class MatrixClientApp(ZeroApp):
         elif event_type == "not_a_defined_event":
             logger.warning("Unknown event: {}".format(event))
 
-        # Update the current view if required
-        if self.active_room == room.room_id:
-            self.messages_menu.set_contents(self._get_messages_menu_contents(room.room_id))
-            self.messages_menu.refresh()
         # Setting flag - if not already set
         if not self.has_processed_new_events.is_set():
             logger.debug("New event processed, setting flag")
         self.has_processed_new_events.set()
 
     def _add_new_message(self, room_id, new_message):
-        # Check whether it's a duplicate - shouldn't trigger because of the deduplication
-        for m in self.stored_messages[room_id]['events']:
-            if m['id'] == new_message['id']:
-                logger.error("Message ID check triggered despite deduplication")
-                return
-
-        self.stored_messages[room_id]['events'].append(new_message)
+        with self.messages_lock:
+            # The history of the room that's shown can't be trimmed - there's no way to remove menu entries
+            index = self.stored_messages[room_id].add(new_message, trim=self.active_room != room_id)
+            if index is None:
+                return # Older than the whole stored history
+            self.message_cache.add(room_id, new_message)
+            # Update the current view if required
+            if self.active_room == room_id and self._is_shown(new_message):
+                self._insert_menu_entry(new_message)
+
+    def _is_shown(self, message):
+        return self.config["show_join_leave_messages"] or message["type"] != "m.room.member"
+
+    def _make_menu_entry(self, message):
+        content = rfa(message["content"])
+        return [content, lambda c=content, s=rfa(message['sender']), t=message['timestamp']: self.display_single_message(c, s, t)]
+
+    # Inserts a new message into the messages menu that's currently shown, in timestamp order
+    def _insert_menu_entry(self, message):
+        menu = self.messages_menu
+        index = bisect_right(self.messages_menu_timestamps, message['timestamp'])
+        self.messages_menu_timestamps.insert(index, message['timestamp'])
+        position = index
+        if menu.contents and menu.contents[0] == menu.load_more_marker:
+            position += 1
+        contents = list(menu.contents)
+        contents.insert(position, self._make_menu_entry(message))
+        # Keeping the same entry selected - unless the menu is loading more messages,
+        # in which case it moves the pointer by the amount of entries loaded itself
+        if position <= menu.pointer and menu.load_more_allow_refresh.is_set():
+            menu.pointer += 1
+        menu.set_contents(contents)
+        menu.refresh()
 
     # Uses stored_messages to create a suitable list of menu entries for MessagesMenu
     def _get_messages_menu_contents(self, room_id):
-        # Sort messages by their timestamp
-        sorted_messages = sorted(self.stored_messages[room_id]['events'], key=lambda k: k['timestamp'])
-
-        menu_contents = []
+        # Messages are stored sorted by their timestamp
+        messages = [m for m in self.stored_messages[room_id].get_messages() if self._is_shown(m)]
+        self.messages_menu_timestamps = [m['timestamp'] for m in messages]
 
-        for message in sorted_messages:
-            if not self.config["show_join_leave_messages"] and message["type"] == "m.room.member":
-                continue
-            content = rfa(message["content"])
-            menu_contents.append([content, lambda c=content, s=rfa(message['sender']), t=message['timestamp']: self.display_single_message(c, s, t)])
+        menu_contents = [self._make_menu_entry(message) for message in messages]
 
         menu_contents.append(["Write message", lambda r=self.rooms[room_id]: self.write_message(r)])
 
@@ -349,8 +381,8 @@ class MatrixClientApp(ZeroApp):
         messages_to_load = 5
         self.has_processed_new_events.clear()
         try:
-            room.backfill_previous_messages(limit=self.stored_messages[room.room_id]["backfilled"]+messages_to_load, reverse=True, num_of_messages=messages_to_load)
-            self.stored_messages[room.room_id]["backfilled"] += messages_to_load
+            room.backfill_previous_messages(limit=self.stored_messages[room.room_id].backfilled+messages_to_load, reverse=True, num_of_messages=messages_to_load)
+            self.stored_messages[room.room_id].backfilled += messages_to_load
         except:
             logger.exception("Couldn't load previous messages!")
             return False
@@ -0,0 +1,123 @@
+"""
+Message storage for the Matrix app - per-room message lists kept in timestamp order,
+and an on-disk cache of recent messages, so that rooms don't start out empty.
+"""
+
+import sqlite3
+from bisect import bisect_right
+from collections import OrderedDict
+from threading import Lock
+
+from zpui_lib.helpers import setup_logger
+
+logger = setup_logger(__name__, "warning")
+
+
+class RoomMessages(object):
+    """
+    Messages of a single room, sorted by timestamp. Also remembers IDs of the last
+    ``max_seen`` events received, so that events that are received twice (say, once
+    from the sync and once from backfilling) are only processed once.
+    """
+
+    def __init__(self, max_messages=200, max_seen=1000):
+        self.max_messages = max_messages
+        self.max_seen = max_seen
+        self.messages = []
+        self.timestamps = []
+        self.seen = OrderedDict()
+        self.backfilled = 0
+        self.lock = Lock()
+
+    def check_seen(self, event_id):
+        """Returns ``True`` if an event has been seen before, marks it as seen otherwise."""
+        with self.lock:
+            if event_id in self.seen:
+                self.seen.move_to_end(event_id)
+                return True
+            self.seen[event_id] = True
+            if len(self.seen) > self.max_seen:
+                self.seen.popitem(last=False)
+            return False
+
+    def add(self, message, trim=True):
+        """
+        Inserts a message in timestamp order, returns the index it's been inserted at.
+        If ``trim`` is set, drops the oldest messages if there's more than ``max_messages``
+        (returning ``None`` if the new message is one of them).
+        """
+        with self.lock:
+            index = bisect_right(self.timestamps, message["timestamp"])
+            self.timestamps.insert(index, message["timestamp"])
+            self.messages.insert(index, message)
+            if trim:
+                index -= self._trim()
+            return index if index >= 0 else None
+
+    def trim(self):
+        with self.lock:
+            self._trim()
+
+    def _trim(self):
+        excess = len(self.messages) - self.max_messages
+        if excess <= 0:
+            return 0
+        del self.messages[:excess]
+        del self.timestamps[:excess]
+        return excess
+
+    def get_messages(self):
+        with self.lock:
+            return list(self.messages)
+
+
+class MessageCache(object):
+    """
+    Keeps up to ``max_messages`` recent messages of each room in an SQLite database.
+    Can be used from multiple threads.
+    """
+
+    fields = ("id", "timestamp", "type", "sender", "content", "membership")
+    # how many messages can be added to a room before old ones are cleaned up
+    trim_interval = 50
+
+    def __init__(self, path, max_messages=200):
+        self.path = path
+        self.max_messages = max_messages
+        self.lock = Lock()
+        self.added_since_trim = {}
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        with self.lock, self.db:
+            self.db.execute("CREATE TABLE IF NOT EXISTS messages (room_id TEXT, id TEXT, timestamp INTEGER, type TEXT, "
+                            "sender TEXT, content TEXT, membership TEXT, PRIMARY KEY (room_id, id))")
+            self.db.execute("CREATE INDEX IF NOT EXISTS messages_by_time ON messages (room_id, timestamp)")
+
+    def add(self, room_id, message):
+        values = [room_id] + [message.get(field, None) for field in self.fields]
+        with self.lock, self.db:
+            self.db.execute("INSERT OR IGNORE INTO messages VALUES (?, ?, ?, ?, ?, ?, ?)", values)
+            self.added_since_trim[room_id] = self.added_since_trim.get(room_id, 0) + 1
+            if self.added_since_trim[room_id] >= self.trim_interval:
+                self._trim(room_id)
+
+    def load(self, room_id):
+        """Returns the cached messages of a room, oldest first."""
+        with self.lock, self.db:
+            self._trim(room_id)
+            rows = self.db.execute("SELECT {} FROM messages WHERE room_id = ? ORDER BY timestamp".format(", ".join(self.fields)), (room_id,)).fetchall()
+        messages = []
+        for row in rows:
+            message = dict(zip(self.fields, row))
+            if message["membership"] is None:
+                message.pop("membership")
+            messages.append(message)
+        return messages
+
+    def _trim(self, room_id):
+        self.db.execute("DELETE FROM messages WHERE room_id = ? AND id NOT IN (SELECT id FROM messages WHERE room_id = ? "
+                        "ORDER BY timestamp DESC LIMIT ?)", (room_id, room_id, self.max_messages))
+        self.added_since_trim[room_id] = 0
+
+    def clear(self):
+        with self.lock, self.db:
+            self.db.execute("DELETE FROM messages")
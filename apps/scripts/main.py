@@ -1,9 +1,12 @@
 import os
+import shutil
+import tempfile
 from datetime import datetime
-from subprocess import check_output, CalledProcessError, STDOUT
 
 from zpui_lib.helpers import read_or_create_config, local_path_gen, save_config_gen, setup_logger
-from zpui_lib.ui import Menu, Printer, PrettyPrinter, DialogBox, PathPicker, UniversalInput, TextReader
+from zpui_lib.ui import Menu, Printer, PrettyPrinter, DialogBox, PathPicker, UniversalInput, TextReader, Refresher, RefresherExitException
+
+from script_runner import ScriptRunner
 
 menu_name = "Scripts"  # App name as seen in main menu while using the system
 i = None
@@ -54,9 +57,16 @@ def call_external(script_list, shell=False):
         script_path = os.path.split(script_list[0])[1]
     Printer("Calling {}".format(script_path), i, o, 1)
 
-    output = None
+    do_autosave = config.get("autosave_output", False)
+    if do_autosave:
+        output_path = get_autosave_path(script_list)
+    else:
+        # the output is streamed into a temporary file, in case the user wants to save it later
+        fd, output_path = tempfile.mkstemp(prefix="zpui-script-output-")
+        os.close(fd)
+    runner = ScriptRunner(script_list, shell=shell, output_path=output_path)
     try:
-        output = check_output(script_list, stderr=STDOUT, shell=shell)
+        runner.start()
     except OSError as e:
         if e.errno == 2:
             Printer("File not found!", i, o, 1)
@@ -67,23 +77,22 @@ def call_external(script_list, shell=False):
         else:
             error_message = "Unknown error! \n \n {}".format(e)
             PrettyPrinter(error_message, i, o, 3)
-        output = ""
-    except CalledProcessError as e:
-        Printer(["Failed with", "code {}".format(e.returncode)], i, o, 1)
-        output = e.output
-    else:
-        Printer("Success!", i, o, 1)
-    finally:
+        # with autosave, the file is only created once the command starts
+        if os.path.exists(output_path):
+            os.remove(output_path)
+        return
+    try:
+        show_output_tail(runner)
+        returncode = runner.wait()
+        if runner.cancelled:
+            Printer("Cancelled", i, o, 1)
+        elif returncode != 0:
+            Printer(["Failed with", "code {}".format(returncode)], i, o, 1)
+        else:
+            Printer("Success!", i, o, 1)
+        output = runner.get_output()
         if not output:
             return
-        if isinstance(output, bytes): output = output.decode("ascii")
-        do_autosave = config.get("autosave_output", False)
-        if do_autosave:
-            try:
-                save_output(script_list, output)
-            except: # damn this needs better processing huh
-                # but this will do for now, to avoid the funny bug where a command isn't saved in history
-                logger.exception("Failed to save command output!")
         do_autoshow = config.get("autoshow_output", False)
         if not do_autoshow:
             answer = DialogBox("yn", i, o, message="Show output?").activate()
@@ -103,38 +112,64 @@ def call_external(script_list, shell=False):
                         do_show = False
             if answer and not do_autosave: # gotta avoid saving the output
                 try:
-                    save_output(script_list, output)
+                    save_output(script_list, output_path)
                 except: # damn this needs better processing huh
                     # but this will do for now, to avoid the funny bug where a command isn't saved in history
                     logger.exception("Failed to save command output!")
+    finally:
+        # the output file might not exist if the reader thread couldn't create it
+        if os.path.exists(output_path) and (not do_autosave or os.path.getsize(output_path) == 0):
+            os.remove(output_path)
 
+def show_output_tail(runner):
+    """
+    Shows the last lines of the command's output while it's running; exits once
+    the command exits. KEY_LEFT offers to stop the command.
+    """
+    def get_tail():
+        if not runner.is_running():
+            raise RefresherExitException
+        lines = [line.expandtabs(4)[:o.cols] for line in runner.get_tail(o.rows)]
+        return lines if lines else ["Running..."]
+    def cancel():
+        answer = DialogBox("yn", i, o, message="Stop script?").activate()
+        if answer:
+            runner.cancel()
+    Refresher(get_tail, i, o, 0.2, keymap={"KEY_LEFT":cancel}, name="Scripts app output tail").activate()
 
-def save_output(command, output):
+def get_output_filename(command):
     if not isinstance(command, basestring):
         command = " ".join(command)
     command = command.lstrip("/").replace("/", "_")
     now = datetime.now()
     filename = "log-{}-{}".format(command, now.strftime("%y%m%d-%H%M%S"))
     logger.info("Output filename: {}".format(filename))
-    old_dir = config["output_dir"]
-    if not os.path.exists(old_dir) or not os.path.isdir(old_dir):
-        logger.error("{} not found or not dir, using '/' instead".format(old_dir))
-        old_dir = "/" #fallback
-    do_autosave = config.get("autosave_output", False)
-    if not do_autosave:
-        # we do not need to ask the user for the directory if the app is set to autosave output
-        dir = PathPicker(old_dir, i, o, dirs_only=True).activate()
-        if not dir:
-            return
-        # Saving the path into the config
-        config["output_dir"] = dir
-    else:
-        dir = old_dir
+    return filename
+
+def get_output_dir():
+    dir = config["output_dir"]
+    if not os.path.exists(dir) or not os.path.isdir(dir):
+        logger.error("{} not found or not dir, using '/' instead".format(dir))
+        dir = "/" #fallback
+    return dir
+
+def get_autosave_path(command):
+    path = os.path.join(get_output_dir(), get_output_filename(command))
+    logger.info("Saving output into {}".format(path))
+    return path
+
+def save_output(command, output_path):
+    # we do not need to ask the user for the directory if the app is set to autosave output,
+    # since the output is already saved by then
+    dir = PathPicker(get_output_dir(), i, o, dirs_only=True).activate()
+    if not dir:
+        return
+    # Saving the path into the config
+    config["output_dir"] = dir
     save_config(config)
-    path = os.path.join(dir, filename)
+    path = os.path.join(dir, get_output_filename(command))
     logger.info("Saving output into {}".format(path))
-    with open(path, "w") as f:
-        f.write(output)
+    shutil.copyfile(output_path, path)
 
 def call_by_path():
     path = PathPicker("/", i, o).activate()
@@ -0,0 +1,145 @@
+"""
+Runs a command in background, reading its output as it's produced - keeps the last
+``max_lines`` lines in memory (for showing on the screen) and, optionally, writes the
+whole output into a file as it arrives. The command can be cancelled at any time.
+"""
+
+import os
+import codecs
+import signal
+import subprocess
+from collections import deque
+from threading import Thread, Lock
+
+from zpui_lib.helpers import setup_logger
+
+logger = setup_logger(__name__, "warning")
+
+
+class ScriptRunner(object):
+    """
+    Runs ``command`` (a list, or a string if ``shell`` is set) with stderr merged into
+    stdout, like ``check_output(command, stderr=STDOUT)`` would, but without blocking
+    and without keeping more than ``max_lines`` lines of output in memory.
+    """
+
+    read_size = 4096
+
+    def __init__(self, command, shell=False, max_lines=500, output_path=None):
+        self.command = command
+        self.shell = shell
+        self.output_path = output_path
+        self.lines = deque(maxlen=max_lines)
+        self.partial_line = ""
+        self.line_count = 0
+        self.lock = Lock()
+        self.process = None
+        self.thread = None
+        self.cancelled = False
+
+    def start(self):
+        """
+        Starts the command and the thread reading its output. Raises ``OSError``
+        if the command can't be started (same as ``subprocess.Popen``).
+        """
+        # a separate process group, so that cancelling a script also stops the commands it started
+        self.process = subprocess.Popen(self.command, stdin=subprocess.DEVNULL, stdout=subprocess.PIPE, \
+                                        stderr=subprocess.STDOUT, shell=self.shell, start_new_session=True)
+        self.thread = Thread(target=self.read_output, name="Output reader for {}".format(self.command))
+        self.thread.daemon = True
+        self.thread.start()
+
+    def read_output(self):
+        decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        output_file = None
+        fd = self.process.stdout.fileno()
+        try:
+            if self.output_path:
+                try:
+                    output_file = open(self.output_path, "w")
+                except (IOError, OSError):
+                    # the output still has to be read, or the command will block once the pipe is full
+                    logger.exception("Can't open {} to write the output of {} into".format(self.output_path, self.command))
+            while True:
+                # os.read returns as soon as there's something to read, unlike file.read
+                data = os.read(fd, self.read_size)
+                text = decoder.decode(data, final=not data)
+                if text:
+                    self.add_output(text)
+                    if output_file:
+                        output_file.write(text)
+                        output_file.flush()
+                if not data:
+                    break
+        except:
+            logger.exception("Error while reading output of {}".format(self.command))
+        finally:
+            self.process.stdout.close()
+            if output_file:
+                output_file.close()
+
+    def add_output(self, text):
+        lines = (self.partial_line + text).split("\n")
+        with self.lock:
+            self.partial_line = lines.pop()
+            self.lines.extend(lines)
+            self.line_count += len(lines)
+
+    def is_running(self):
+        return self.process is not None and (self.process.poll() is None or self.thread.is_alive())
+
+    @property
+    def returncode(self):
+        return self.process.returncode if self.process else None
+
+    def wait(self, timeout=None):
+        """Waits until the command exits and all of its output is read, returns the exit code."""
+        self.process.wait(timeout)
+        self.thread.join(timeout)
+        return self.process.returncode
+
+    def cancel(self, timeout=3):
+        """
+        Stops the command - sends SIGTERM, and if the command doesn't exit
+        within ``timeout`` seconds, SIGKILL.
+        """
+        if self.process is None or self.process.poll() is not None:
+            return
+        self.cancelled = True
+        self.send_signal(signal.SIGTERM)
+        try:
+            self.process.wait(timeout)
+        except subprocess.TimeoutExpired:
+            logger.warning("{} didn't exit after SIGTERM, killing".format(self.command))
+            self.send_signal(signal.SIGKILL)
+            self.process.wait()
+        self.thread.join(timeout)
+
+    def send_signal(self, sig):
+        try:
+            os.killpg(self.process.pid, sig)
+        except OSError: # already exited
+            pass
+
+    def get_tail(self, count):
+        """Returns the last ``count`` lines of output, including the unfinished one."""
+        with self.lock:
+            lines = list(self.lines)
+            if self.partial_line:
+                lines.append(self.partial_line)
+        return lines[-count:] if count else []
+
+    def get_output(self):
+        """
+        Returns the output kept in memory, as a string - if some of the
+        output didn't fit, says how many lines were left out.
+        """
+        with self.lock:
+            lines = list(self.lines)
+            skipped = self.line_count - len(lines)
+            output = "\n".join(lines)
+            if self.partial_line:
+                output = output + "\n" + self.partial_line if lines else self.partial_line
+        if skipped:
+            output = "({} lines not shown)\n".format(skipped) + output
+        return output
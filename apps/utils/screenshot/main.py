@@ -1,9 +1,8 @@
 menu_name = "Screenshots"
 
 import os
-from copy import copy
-from time import sleep
 from datetime import datetime
+from threading import Event
 
 from zpui_lib.helpers import setup_logger, BackgroundRunner, BooleanEvent, \
                              read_or_create_config, local_path_gen, save_config_gen
@@ -12,7 +11,7 @@ from zpui_lib.actions import BackgroundAction as Action
 
 logger = setup_logger(__name__, "info")
 
-from PIL import ImageChops
+from screen_recording import Recorder, file_extension
 
 i = None
 o = None
@@ -50,52 +49,40 @@ def toggle_record():
         runner = BackgroundRunner(record)
         runner.run()
     else:
-        recording_ongoing.set(False)
-
-def imgs_are_equal(i1, i2):
-    return ImageChops.difference(i1, i2).getbbox() is None
+        stop_recording.set()
 
 recording_ongoing = BooleanEvent()
 recording_ongoing.set(False)
-
-def log_recording(filename, imgpath):
-    path = os.path.join(screenshot_folder, filename)
-    with open(path, 'a') as f:
-        f.write(imgpath+'\n')
+# set to make record() stop
+stop_recording = Event()
 
 def record():
+    """
+    Records every frame shown on the screen into a single file, as the frames
+    are shown - see ``screen_recording.py`` for the format, and for converting
+    recordings into GIFs and videos.
+    """
+    stop_recording.clear()
     recording_ongoing.set(True)
-    log_filename = "recording-{}.log".format(datetime.now().strftime("%y%m%d-%H%M%S"))
-    logger.info(f"Recording starting into {log_filename}")
-    prev_image = None
-    while recording_ongoing:
-        try:
-            c = context.get_current_context()
-            image = copy(context.get_context_image(c))
-            if image: # not doing anything if the current image isn't at least truthy
-                if prev_image:
-                    if not imgs_are_equal(image, prev_image):
-                        path = save_image(image)
-                        logger.info("Image changed, saved to {}!".format(path))
-                        log_recording(log_filename, path)
-                        prev_image = image
-                    else:
-                        pass
-                else:
-                    #print("prev image not set!")
-                    prev_image = image
-            else:
-                pass #print("not image")
-            if not recording_ongoing:
-                logger.info("Recording stopped")
-                recording_ongoing.set(False)
-                return True
-            sleep(0.01)
-        except:
-            logger.exception("Recording failed!")
-            recording_ongoing.set(False)
-            return False
-    logger.info("Recording stopped")
+    filename = "recording-{}{}".format(datetime.now().strftime("%y%m%d-%H%M%S"), file_extension)
+    path = os.path.join(screenshot_folder, filename)
+    logger.info("Recording starting into {}".format(path))
+    try:
+        recorder = Recorder(path)
+    except:
+        logger.exception("Recording failed!")
+        recording_ongoing.set(False)
+        return False
+    # the screen won't tell us about the frame that's already shown
+    recorder.push(context.get_context_image(context.get_current_context()))
+    context.add_frame_listener(recorder.push)
+    try:
+        # frames are pushed by the listener, there's nothing to do until we're told to stop
+        stop_recording.wait()
+    finally:
+        context.remove_frame_listener(recorder.push)
+        recorder.stop()
+    logger.info("Recording stopped, {} frames ({} bytes) written".format(recorder.frames, recorder.bytes_written))
     recording_ongoing.set(False)
     return True
 
@@ -105,7 +92,7 @@ def set_context(received_context):
     def menu_name_cb():
         return "Stop recording screen" if recording_ongoing else "Record screen"
     context.register_action(Action("screenshot", take_screenshot, menu_name="Screenshot", description="Takes a screenshot from previous app"))
-    context.register_action(Action("record_screen", toggle_record, menu_name=menu_name_cb, description="Records the screen from currently shown app (as series of screenshots)"))
+    context.register_action(Action("record_screen", toggle_record, menu_name=menu_name_cb, description="Records the screen from currently shown app"))
 
     if not recording_ongoing and config["auto_record"]:
         toggle_record()
@@ -114,7 +101,6 @@ def show_screenshot(path):
     GraphicsPrinter(path, i, o, 5, invert=False)
 
 def list_screenshots():
-    # TODO exclude recording-produced screenshots
     mc = []
     screenshots = [file for file in os.listdir(screenshot_folder) if file.endswith('.png')]
     for filename in screenshots:
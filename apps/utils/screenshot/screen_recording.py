@@ -0,0 +1,192 @@
+"""
+Screen recordings, stored in a single append-only file. Each changed frame is stored
+as a record: a header with the frame's timestamp, mode and size, followed by zlib-compressed
+pixel data - either the full frame (a keyframe), or the frame XOR-ed with the previous one,
+which is mostly zeroes and compresses really well. A keyframe is stored every
+``keyframe_interval`` frames and whenever the frame's mode or size changes, so a recording
+that's cut short (say, by a power loss) can still be read up to the last complete record.
+
+Can be run to convert a recording into a GIF (using PIL) or a video (using OpenCV)::
+
+    python3 apps/utils/screenshot/screen_recording.py recording-XXX.zrec recording.gif [--fps 30]
+"""
+
+import struct
+import zlib
+from queue import Queue
+from threading import Thread
+from time import time
+
+from PIL import Image
+
+magic = b"ZREC\x01"
+# timestamp, is keyframe, mode, width, height, payload length
+record_header = struct.Struct("<d?4sHHI")
+
+file_extension = ".zrec"
+
+
+def xor_bytes(a, b):
+    """
+    XORs two byte strings of the same length - big integers are a surprisingly fast way
+    to do that without numpy.
+
+    >>> xor_bytes(b"\\x0f\\xf0", b"\\xff\\xff")
+    b'\\xf0\\x0f'
+    """
+    return (int.from_bytes(a, "little") ^ int.from_bytes(b, "little")).to_bytes(len(a), "little")
+
+
+class Recorder(object):
+    """
+    Writes frames passed to ``push`` into a recording file, skipping frames that are
+    the same as the previous one. Frames are compressed and written from a separate
+    thread, so ``push`` can be used as a frame listener on the output path.
+    """
+
+    def __init__(self, path, keyframe_interval=100, compression_level=6):
+        self.path = path
+        self.keyframe_interval = keyframe_interval
+        self.compression_level = compression_level
+        self.queue = Queue()
+        self.last_frame = None
+        self.frames = 0
+        self.bytes_written = 0
+        self.file = open(self.path, "ab")
+        if self.file.tell() == 0:
+            self.file.write(magic)
+        self.thread = Thread(target=self.run, name="Screen recorder for {}".format(path))
+        self.thread.daemon = True
+        self.thread.start()
+
+    def push(self, image):
+        """
+        Adds a frame to the recording, unless it's the same as the last one.
+        ``None`` means the screen was cleared, and is recorded as a blank frame.
+        """
+        if image is None:
+            if self.last_frame is None:
+                return # no idea what size the screen is
+            mode, size, _ = self.last_frame
+            image = Image.new(mode, size)
+        frame = (image.mode, image.size, image.tobytes())
+        if frame == self.last_frame:
+            return
+        self.last_frame = frame
+        self.queue.put((time(),) + frame)
+
+    def run(self):
+        previous = None
+        since_keyframe = 0
+        while True:
+            item = self.queue.get()
+            if item is None:
+                break
+            timestamp, mode, size, data = item
+            is_keyframe = previous is None or previous[:2] != (mode, size) or since_keyframe >= self.keyframe_interval
+            payload = data if is_keyframe else xor_bytes(data, previous[2])
+            payload = zlib.compress(payload, self.compression_level)
+            header = record_header.pack(timestamp, is_keyframe, mode.encode("ascii"), size[0], size[1], len(payload))
+            self.file.write(header + payload)
+            self.frames += 1
+            self.bytes_written += len(header) + len(payload)
+            since_keyframe = 0 if is_keyframe else since_keyframe + 1
+            previous = (mode, size, data)
+        self.file.close()
+
+    def stop(self):
+        """Writes the remaining frames and closes the file."""
+        self.queue.put(None)
+        self.thread.join()
+
+
+def read_recording(path):
+    """
+    Yields ``(timestamp, image)`` for each frame in a recording. Stops at the first
+    incomplete record, so recordings that are still being written can be read, too.
+    """
+    with open(path, "rb") as f:
+        if f.read(len(magic)) != magic:
+            raise ValueError("{} is not a screen recording".format(path))
+        previous = None
+        while True:
+            header = f.read(record_header.size)
+            if len(header) < record_header.size:
+                return
+            timestamp, is_keyframe, mode, width, height, length = record_header.unpack(header)
+            payload = f.read(length)
+            if len(payload) < length:
+                return
+            mode = mode.rstrip(b"\x00").decode("ascii")
+            data = zlib.decompress(payload)
+            if not is_keyframe:
+                if previous is None:
+                    continue # no keyframe to apply the delta to
+                data = xor_bytes(data, previous)
+            previous = data
+            yield timestamp, Image.frombytes(mode, (width, height), data)
+
+
+def get_frame_counts(timestamps, fps):
+    """
+    For a fixed-framerate output, returns how many output frames each recorded frame
+    should be shown for - the last frame is shown once.
+
+    >>> get_frame_counts([0, 0.1, 0.15, 0.3], 20)
+    [2, 1, 3, 1]
+    """
+    counts = []
+    shown = 0
+    for i, timestamp in enumerate(timestamps[:-1]):
+        # rounding the end of each frame, not its duration, so that errors don't add up
+        end = int(round((timestamps[i+1] - timestamps[0]) * fps))
+        counts.append(max(0, end - shown))
+        shown += counts[-1]
+    return counts + [1] if timestamps else []
+
+
+def convert(path, output_path, fps=30, scale=1):
+    """
+    Converts a recording into a GIF (if ``output_path`` ends with ``.gif``)
+    or a video (using OpenCV, which needs to be installed). Returns the amount of frames read.
+    """
+    frames = []
+    for timestamp, image in read_recording(path):
+        image = image.convert("RGB")
+        if scale != 1:
+            image = image.resize((image.width * scale, image.height * scale), Image.NEAREST)
+        frames.append((timestamp, image))
+    if not frames:
+        raise ValueError("No frames found in {}".format(path))
+    if output_path.lower().endswith(".gif"):
+        # GIFs can show each frame for however long it needs to be shown
+        timestamps = [t for t, _ in frames]
+        durations = [int((b - a) * 1000) for a, b in zip(timestamps, timestamps[1:])] + [1000]
+        images = [image for _, image in frames]
+        images[0].save(output_path, save_all=True, append_images=images[1:], duration=durations, loop=0)
+    else:
+        import cv2
+        import numpy
+        width, height = frames[-1][1].size
+        video = cv2.VideoWriter(output_path, cv2.VideoWriter_fourcc(*"MJPG"), fps, (width, height))
+        counts = get_frame_counts([t for t, _ in frames], fps)
+        for (_, image), count in zip(frames, counts):
+            if image.size != (width, height):
+                image = image.resize((width, height))
+            frame = cv2.cvtColor(numpy.array(image), cv2.COLOR_RGB2BGR)
+            for _ in range(count):
+                video.write(frame)
+        video.release()
+    return len(frames)
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="converts ZPUI screen recordings into GIFs or videos")
+    parser.add_argument("recording", help="path to a .zrec file")
+    parser.add_argument("output", help="output path - .gif, or a video file (.avi) if OpenCV is installed")
+    parser.add_argument("--fps", type=int, default=30, help="framerate, for videos")
+    parser.add_argument("--scale", type=int, default=1, help="scale the frames up this many times")
+    args = parser.parse_args()
+    count = convert(args.recording, args.output, fps=args.fps, scale=args.scale)
+    print("{} frames written to {}".format(count, args.output))
@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+"""
+Benchmarks the avrdude app's output parser and process monitor on recorded avrdude
+output, so no hardware is needed. Run from the ZPUI directory:
+
+    python3 benchmarks/avrdude_parser.py [-f FIXTURE] [-n REPEAT] [-c CHUNK] [-s SPEED]
+
+First, parses the whole recording ``REPEAT`` times, fed in ``CHUNK``-sized pieces;
+then, replays it through a process (``SPEED`` times faster than it was recorded) and
+reports how much CPU time monitoring it took, and how many status updates were sent.
+"""
+import os
+import sys
+import json
+import argparse
+import resource
+from time import monotonic
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from apps.hardware_apps.avrdude import avrdude_monitor
+
+default_fixture = os.path.join(os.path.dirname(avrdude_monitor.__file__), "fixtures", "write_flash.json")
+
+
+def get_cpu_time():
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage.ru_utime + usage.ru_stime
+
+
+def bench_parser(output, repeat, chunk):
+    statuses = 0
+    start = monotonic()
+    for _ in range(repeat):
+        parser = avrdude_monitor.OutputParser()
+        for position in range(0, len(output), chunk):
+            statuses += len(parser.feed(output[position:position+chunk]))
+    return monotonic() - start, statuses
+
+
+def bench_monitor(fixture, speed, min_interval):
+    command = [sys.executable, avrdude_monitor.__file__, "--replay", fixture, "--speed", str(speed)]
+    monitor = avrdude_monitor.AvrdudeMonitor(command, min_interval=min_interval)
+    cpu_start = get_cpu_time()
+    start = monotonic()
+    returncode = monitor.run()
+    return monotonic() - start, get_cpu_time() - cpu_start, monitor.statuses_sent, returncode
+
+
+def main():
+    parser = argparse.ArgumentParser(description="avrdude output parser benchmark")
+    parser.add_argument("-f", "--fixture", default=default_fixture, help="recorded avrdude output, as [delay, output] pairs")
+    parser.add_argument("-n", "--repeat", type=int, default=1000, help="how many times to parse the output")
+    parser.add_argument("-c", "--chunk", type=int, default=64, help="size of chunks the output is fed in")
+    parser.add_argument("-s", "--speed", type=float, default=10, help="replay the output this many times faster")
+    parser.add_argument("-i", "--interval", type=float, default=0.1, help="minimum interval between progress updates, seconds")
+    args = parser.parse_args()
+    with open(args.fixture) as f:
+        output = "".join(data for _, data in json.load(f))
+    duration, statuses = bench_parser(output, args.repeat, args.chunk)
+    print("parser: {:.1f} MB/s, {:.3f} ms per recording, {} statuses per recording".format( \
+          len(output) * args.repeat / duration / 1000000, duration / args.repeat * 1000, statuses // args.repeat))
+    duration, cpu_time, sent, returncode = bench_monitor(args.fixture, args.speed, args.interval)
+    print("monitor: {:.2f} s, {:.3f} s CPU time ({:.1f}%), {} status updates sent, exit code {}".format( \
+          duration, cpu_time, cpu_time / duration * 100, sent, returncode))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+Measures how long ``output/drivers/framebuffer_lib.py`` takes to convert a frame
+into the framebuffer's pixel format, for every ``(mode, bpp)`` pair it supports,
+and how long ``Framebuffer.show`` takes to write a frame where only a few rows
+changed (into a temporary file instead of ``/dev/fbN``). Run from the ZPUI directory:
+
+    python3 benchmarks/framebuffer_convert.py [-n FRAMES] [--legacy]
+
+``--legacy`` also times the per-pixel converters that were used before, for comparison.
+"""
+import os
+import sys
+import mmap
+import argparse
+import tempfile
+from time import perf_counter
+
+import numpy
+from PIL import Image, ImageDraw
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from output.drivers.framebuffer_lib import Framebuffer, _CONVERTER
+
+sizes = ((240, 240), (400, 240))
+
+
+def legacy_convert(image, bpp):
+    # per-pixel converters as they were before numpy, kept here for comparison
+    if image.mode == "1":
+        pixels = [255 if p else 0 for p in image.getdata()]
+        layout = {16: lambda p: (p, p), 24: lambda p: (p, p, p), 32: lambda p: (255, p, p, p)}[bpp]
+        return bytes([x for p in pixels for x in layout(p)])
+    if bpp == 16:
+        return bytes([x for r, g, b in image.convert("RGB").getdata()
+                      for x in ((g & 0x1c) << 3 | (b >> 3), r & 0xf8 | (g >> 5))])
+    if bpp == 32 and image.mode == "RGB":
+        return bytes([x for r, g, b in image.getdata() for x in (255, r, g, b)])
+    return image.tobytes()
+
+
+def make_image(mode, size):
+    image = Image.new("RGB", size)
+    draw = ImageDraw.Draw(image)
+    draw.ellipse(((0, 0), size), fill="blue", outline="red")
+    draw.text((10, 10), "ZPUI benchmark", fill="white")
+    return image.convert(mode)
+
+
+def make_framebuffer(size, bpp):
+    # a Framebuffer that's mapped onto a temporary file instead of /dev/fbN
+    fb = Framebuffer.__new__(Framebuffer)
+    fb.size = size
+    fb.bits_per_pixel = bpp
+    fb.stride = bpp // 8 * size[0]
+    f = tempfile.TemporaryFile()
+    f.truncate(fb.stride * size[1])
+    fb.path = None
+    fb.mmap = mmap.mmap(f.fileno(), fb.stride * size[1])
+    fb.pixels = numpy.frombuffer(fb.mmap, dtype=numpy.uint8).reshape(size[1], fb.stride)
+    return fb, f
+
+
+def timeit(func, count):
+    start = perf_counter()
+    for _ in range(count):
+        func()
+    return (perf_counter() - start) / count * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description="framebuffer conversion benchmark")
+    parser.add_argument("-n", "--frames", type=int, default=50, help="number of frames to convert")
+    parser.add_argument("--legacy", action="store_true", help="also time the old per-pixel converters")
+    args = parser.parse_args()
+    print("{:>9} {:>5} {:>4} {:>10} {:>10} {:>10}".format("size", "mode", "bpp", "convert", "show", "legacy"))
+    for size in sizes:
+        for (mode, bpp), converter in sorted(_CONVERTER.items(), key=lambda i: (i[0][1], i[0][0])):
+            image = make_image(mode, size)
+            convert_ms = timeit(lambda: converter(image), args.frames)
+            fb, f = make_framebuffer(size, bpp)
+            fb.show(image)
+            # a clock-sized change in the corner, alternating between two frames
+            images = [image, image.copy()]
+            ImageDraw.Draw(images[1]).rectangle((0, 0, 40, 12), fill="white" if mode == "1" else "green")
+            frames = iter(images * args.frames)
+            show_ms = timeit(lambda: fb.show(next(frames)), args.frames)
+            f.close()
+            legacy = "{:.2f} ms".format(timeit(lambda: legacy_convert(image, bpp), max(1, args.frames // 10))) if args.legacy else "-"
+            print("{:>9} {:>5} {:>4} {:>7.2f} ms {:>7.2f} ms {:>10}".format("{}x{}".format(*size), mode, bpp, convert_ms, show_ms, legacy))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""
+Runs an app the same way ``main.py --app`` does, but with the headless output
+driver and the scripted input driver, then reports frames per second,
+keypress-to-frame latency and the amount of image data rendered. Run from the ZPUI directory:
+
+    python3 benchmarks/headless_app.py APP_PATH [-k KEYS] [-n REPEAT] [-i INTERVAL] [-r WIDxHEI] [-m MODE] [--record DIR]
+
+``KEYS`` is a comma-separated list of key names, ``KEY_`` prefix optional -
+by default, the app's first screen is scrolled up and down. ``--record`` saves
+every frame as a PNG into ``DIR``. Latency is measured from the moment a key
+is sent by the input driver to the first frame the output driver receives after it;
+keys that didn't cause a new frame before the next key was sent aren't counted.
+"""
+import os
+import sys
+import argparse
+from threading import Thread
+from time import sleep
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.chdir(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import main as main_py
+from apps.app_manager import AppManager
+
+default_keys = ["KEY_DOWN"]*8 + ["KEY_UP"]*8
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    index = min(len(values) - 1, int(round(pct / 100.0 * (len(values) - 1))))
+    return values[index]
+
+
+def get_latencies(sent_keys, frame_times):
+    frame_times = sorted(frame_times)
+    latencies = []
+    for index, (sent_at, key) in enumerate(sent_keys):
+        next_key_at = sent_keys[index+1][0] if index+1 < len(sent_keys) else None
+        frame_at = next((t for t in frame_times if t >= sent_at), None)
+        if frame_at is None or (next_key_at is not None and frame_at >= next_key_at):
+            continue
+        latencies.append(frame_at - sent_at)
+    return latencies
+
+
+def run(app_path, keys, repeat, interval, resolution, mode, record_dir, settle):
+    width, height = resolution
+    output_kwargs = {"width":width, "height":height, "mode":mode, "backlight_interval":0}
+    if record_dir:
+        output_kwargs["record_dir"] = record_dir
+    input_kwargs = {"script":keys, "interval":interval, "repeat":repeat, "start_delay":settle, "autostart":False}
+    zpui = main_py.zpui
+    zpui.config = {"input":[{"driver":"scripted", "kwargs":input_kwargs}],
+                   "output":[{"driver":"headless", "kwargs":output_kwargs}]}
+    if height >= 240:
+        zpui.config["app_manager"] = {"status_bar_height":30}
+    i, o = main_py.init()
+    screen = zpui.screen
+    driver = list(zpui.input_processor.initial_drivers.values())[0]
+    zpui.app_man = AppManager('apps', zpui.cm, zpui, config=zpui.config.get("app_manager", {}))
+    context_name, app = zpui.app_man.load_single_app_by_path(app_path.rstrip('/'), threaded=False)
+    zpui.cm.switch_to_context(context_name)
+    runner = app.on_start if hasattr(app, "on_start") else app.callback
+    t = Thread(target=runner, name="Benchmarked app")
+    t.daemon = True
+    t.start()
+    driver.start_script()
+    driver.finished.wait()
+    sleep(settle)
+    zpui.input_processor.atexit()
+    return driver.sent_keys, list(screen.frame_times), screen.get_stats()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="headless app UI throughput benchmark")
+    parser.add_argument("app_path", help="app path, as accepted by main.py --app")
+    parser.add_argument("-k", "--keys", default=None, help="comma-separated keys to send")
+    parser.add_argument("-n", "--repeat", type=int, default=5, help="how many times to send the key sequence")
+    parser.add_argument("-i", "--interval", type=float, default=0.05, help="pause between keypresses, seconds")
+    parser.add_argument("-r", "--resolution", default="128x64", help="screen resolution, WIDxHEI")
+    parser.add_argument("-m", "--mode", default="1", help="screen mode - 1 or RGB")
+    parser.add_argument("-s", "--settle", type=float, default=1, help="pause before and after the keys are sent, seconds")
+    parser.add_argument("--record", default=None, metavar="DIR", help="save frames as PNG files into DIR")
+    args = parser.parse_args()
+    if args.keys:
+        keys = [key if key.startswith("KEY_") else "KEY_"+key for key in args.keys.upper().split(",")]
+    else:
+        keys = default_keys
+    resolution = tuple(map(int, args.resolution.lower().split("x")))
+    sent_keys, frame_times, stats = run(args.app_path, keys, args.repeat, args.interval, \
+                                        resolution, args.mode, args.record, args.settle)
+    frame_times = [t for t in frame_times if t >= sent_keys[0][0]] if sent_keys else []
+    duration = (frame_times[-1] - sent_keys[0][0]) if frame_times else 0
+    print("keys sent: {}, frames: {} ({} skipped as duplicates), bytes rendered: {}".format( \
+          len(sent_keys), stats["frames"], stats["skipped_frames"], stats["bytes_rendered"]))
+    if duration:
+        print("frames/sec while sending keys: {:.1f}".format(len(frame_times) / duration))
+    latencies = get_latencies(sent_keys, frame_times)
+    print("keys that caused a frame: {}/{}".format(len(latencies), len(sent_keys)))
+    if latencies:
+        for name, pct in (("min", 0), ("p50", 50), ("p90", 90), ("p99", 99), ("max", 100)):
+            print("{}: {:.3f} ms".format(name, percentile(latencies, pct) * 1000))
+    # the app's thread can't be stopped, and it's not a daemon thread in some apps
+    os._exit(0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+"""
+Measures the time it takes for a key to get from ``InputProcessor.receive_key``
+(the entry point used by all input drivers) to the callback set on the current
+``InputProxy``. Run from the ZPUI directory:
+
+    python3 benchmarks/input_latency.py [-n KEYS] [-i INTERVAL]
+
+``INTERVAL`` is the pause between keypresses - the first keypress after idle
+is what the event loop latency is mostly about, so keep it non-zero.
+"""
+import os
+import sys
+import argparse
+from threading import Event
+from time import perf_counter, sleep
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from zpui_lib import hacks
+from zpui_lib.helpers import KEY_PRESSED
+
+from input.input import InputProcessor, InputProxy
+
+hacks.basestring_hack()
+
+
+def measure(count, interval):
+    i = InputProcessor([], None)
+    p = InputProxy("benchmark")
+    received = Event()
+    p.set_callback("KEY_ENTER", received.set)
+    i.attach_proxy(p)
+    i.listen()
+    results = []
+    try:
+        for _ in range(count):
+            sleep(interval)
+            received.clear()
+            start = perf_counter()
+            i.receive_key("KEY_ENTER", KEY_PRESSED)
+            if not received.wait(1):
+                raise RuntimeError("callback wasn't called in a second!")
+            results.append(perf_counter() - start)
+    finally:
+        i.atexit()
+    return results
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    index = min(len(values) - 1, int(round(pct / 100.0 * (len(values) - 1))))
+    return values[index]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="InputProcessor keypress-to-callback latency benchmark")
+    parser.add_argument("-n", "--keys", type=int, default=200, help="number of keypresses to send")
+    parser.add_argument("-i", "--interval", type=float, default=0.01, help="pause between keypresses, seconds")
+    args = parser.parse_args()
+    results = measure(args.keys, args.interval)
+    print("keys: {}, interval: {} ms".format(len(results), args.interval * 1000))
+    for name, pct in (("min", 0), ("p50", 50), ("p90", 90), ("p99", 99), ("max", 100)):
+        print("{}: {:.3f} ms".format(name, percentile(results, pct) * 1000))
+
+
+if __name__ == "__main__":
+    main()
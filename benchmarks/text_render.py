@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+"""
+Measures how long ``lines_to_image`` from ``output/output.py`` takes to draw a
+screenful of menu lines, drawing the text with ``ImageDraw.text`` every time
+versus pasting lines from the line cache. Uses the same fonts that
+``get_default_font`` picks for 128x64, 240x240 and 400x240 screens. Run from the ZPUI directory:
+
+    python3 benchmarks/text_render.py [-n FRAMES]
+
+The menu is scrolled by one line every frame, like it would be if you held a key.
+"""
+import os
+import sys
+import argparse
+from time import perf_counter
+
+from PIL import Image, ImageDraw
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from zpui_lib import hacks
+hacks.basestring_hack()
+
+import output.output as output_py
+from output.output import get_default_font, lines_to_image, get_line_mask
+
+screens = ((128, 64, "1"), (240, 240, "RGB"), (400, 240, "RGB"))
+
+menu = ["Settings", "Wireless", "Bluetooth", "Phone", "Contacts", "Messages", "Clock",
+        "Flashlight", "Scripts", "System info", "Update ZPUI", "I2C tools", "Shutdown"]
+
+
+def render(size, mode, font, font_size, frames, cached):
+    char_height, char_width = font_size
+    rows = size[1] // char_height
+    start = perf_counter()
+    for frame in range(frames):
+        lines = [menu[(frame + i) % len(menu)] for i in range(rows)]
+        image = Image.new(mode, size)
+        d = ImageDraw.Draw(image)
+        lines_to_image(d, lines, font, char_height, char_width, "white", (0, 0), (0, 0), \
+                       image=image if cached else None)
+    return (perf_counter() - start) / frames * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description="char-mode text rendering benchmark")
+    parser.add_argument("-n", "--frames", type=int, default=500, help="number of frames to draw")
+    args = parser.parse_args()
+    print("{:>9} {:>4} {:>10} {:>10} {:>10}".format("size", "mode", "ImageDraw", "cold", "cached"))
+    for width, height, mode in screens:
+        # get_default_font only picks the font once, resetting it
+        output_py.current_font = None
+        font, font_size = get_default_font(width, height)
+        size = (width, height)
+        uncached_ms = render(size, mode, font, font_size, args.frames, False)
+        get_line_mask.cache_clear()
+        cold_ms = render(size, mode, font, font_size, 1, True)
+        cached_ms = render(size, mode, font, font_size, args.frames, True)
+        print("{:>9} {:>4} {:>7.3f} ms {:>7.3f} ms {:>7.3f} ms".format("{}x{}".format(*size), mode, uncached_ms, cold_ms, cached_ms))
+
+
+if __name__ == "__main__":
+    main()
@@ -2,8 +2,11 @@ from input.input import InputProxy
 from output.output import OutputProxy
 from action_manager import ActionManager
 
+from collections import deque
+from copy import copy
 from functools import wraps
 from threading import Thread, Lock
+from time import monotonic
 
 from zpui_lib.actions import ContextSwitchAction
 from zpui_lib.helpers import setup_logger
@@ -231,6 +234,16 @@ class Context(object):
         """
         return self.event_cb(self.name, "get_context_image", context_alias)
 
+    def add_frame_listener(self, callback):
+        """
+        Makes ``callback(image)`` be called with every frame shown on the screen,
+        no matter which context it comes from - i.e. for screen recording.
+        """
+        return self.event_cb(self.name, "add_frame_listener", callback)
+
+    def remove_frame_listener(self, callback):
+        return self.event_cb(self.name, "remove_frame_listener", callback)
+
     def register_action(self, action):
         """
         Allows an app to register an 'action' that can be used by other apps -
@@ -305,6 +318,8 @@ class ContextManager(object):
         self.providers = {}
         self.provider_providers = {}
         self.switching_contexts = Lock()
+        # timings of the last context switches, see unsafe_switch_to_context()
+        self.switch_timings = deque(maxlen=50)
         self.am = ActionManager(self)
 
     def init_io(self, input_processor, screen):
@@ -323,6 +338,7 @@ class ContextManager(object):
         for context_alias in self.initial_contexts:
             c = self.create_context(context_alias)
             c.threaded = False
+        self.set_provider("main", "contextmanager_switch_timings", self.get_switch_timings)
 
     def switch_to_start_context(self):
         """
@@ -383,9 +399,11 @@ class ContextManager(object):
         logger.info("Switching to {} context".format(context_alias))
         previous_context = self.current_context
         self.current_context = context_alias
+        timings = {"from":previous_context, "to":context_alias, "first_frame":None}
+        start = monotonic()
         # First, activating IO - if it fails, restoring the previous context's IO
         try:
-            self.activate_context_io(context_alias)
+            self.activate_context_io(context_alias, timings=timings)
         except:
             logger.exception("Switching to the {} context failed - couldn't activate IO!".format(context_alias))
             try:
@@ -399,10 +417,17 @@ class ContextManager(object):
             # Passing the exception back to the caller
             if do_raise:
                 raise
+        # Whatever the context draws next is the first frame it shows after the switch
+        def first_frame_drawn():
+            timings["first_frame"] = monotonic() - start
+        proxy_o = self.contexts[context_alias].o
+        proxy_o.first_frame_callback = first_frame_drawn
         # Activating the context - restoring everything if it fails
+        thread_start = monotonic()
         try:
             self.contexts[context_alias].activate(start_thread=start_thread, func=func)
         except:
+            proxy_o.first_frame_callback = None
             logger.exception("Switching to the {} context failed - couldn't activate the context!".format(context_alias))
             # Activating IO of the previous context
             try:
@@ -425,7 +450,10 @@ class ContextManager(object):
             if do_raise:
                 raise
         else:
-            logger.debug("Switched to {} context!".format(context_alias))
+            timings["thread_start"] = monotonic() - thread_start
+            timings["total"] = monotonic() - start
+            self.switch_timings.append(timings)
+            logger.debug("Switched to {} context! Timings: {}".format(context_alias, timings))
 
     def failsafe_switch_to_fallback_context(self):
         """
@@ -441,16 +469,35 @@ class ContextManager(object):
         self.contexts[self.current_context].activate()
         logger.info("Fallback switched to {} - proceed with caution".format(self.current_context))
 
-    def activate_context_io(self, context_alias):
+    def activate_context_io(self, context_alias, timings=None):
         """
         This method activates input and output objects associated with a context.
+        If a ``timings`` dictionary is passed, saves how long attaching input
+        (``io_attach``) and redrawing the context's last image (``redraw``) took,
+        and whether the redraw was skipped because the image was already shown.
         """
         logger.debug("Activating IO for {} context".format(context_alias))
         proxy_i, proxy_o = self.contexts[context_alias].get_io()
         if not isinstance(proxy_i, InputProxy) or not isinstance(proxy_o, OutputProxy):
             raise ContextError("Non-proxy IO objects for the context {}".format(context_alias))
+        start = monotonic()
         self.input_processor.attach_new_proxy(proxy_i)
-        self.screen.attach_new_proxy(proxy_o)
+        io_attached = monotonic()
+        redrawn = self.screen.attach_new_proxy(proxy_o)
+        if timings is not None:
+            timings["io_attach"] = io_attached - start
+            timings["redraw"] = monotonic() - io_attached
+            timings["redraw_skipped"] = redrawn is False
+
+    def get_switch_timings(self):
+        """
+        Returns timings (in seconds) for the last context switches, oldest first,
+        as well as the amount of redraws skipped because the image was already shown.
+        ``first_frame`` is the time from the switch start to the first frame drawn
+        by the new context, ``None`` if it hasn't drawn anything yet.
+        """
+        return {"switches":[copy(t) for t in self.switch_timings],
+                "skipped_redraws":getattr(self.screen, "skipped_redraws", 0)}
 
     def create_context(self, context_alias):
         """
@@ -559,6 +606,11 @@ class ContextManager(object):
             return self.contexts[context].get_io()[1].get_current_image()
         elif event == "is_active":
             return context_alias == self.current_context
+        elif event == "add_frame_listener":
+            logger.info("Context {} added a frame listener".format(context_alias))
+            self.screen.add_frame_listener(args[0])
+        elif event == "remove_frame_listener":
+            self.screen.remove_frame_listener(args[0])
         elif event == "register_action":
             action = args[0]
             action.full_name = "{}-{}".format(context_alias, action.name)
@@ -15,12 +15,15 @@ hardcoded values in EmulatorProxy =)
 """
 
 from multiprocessing import Process, Pipe, Lock as MLock, Queue as MQueue # m'lock... m'queue
-from threading import Lock
+from multiprocessing import shared_memory
+from threading import Lock, Thread
+import struct
 from time import sleep
 
 import luma.emulator.device
 import pygame
 from luma.core.render import canvas
+from PIL import Image
 
 from zpui_lib.helpers import setup_logger, KEY_PRESSED, KEY_RELEASED, KEY_HELD
 from output.output import GraphicalOutputDevice, CharacterOutputDevice, get_default_font, lines_to_image
@@ -39,6 +42,66 @@ def get_emulator(width=128, height=64, mode="1", scale=2):
     return __EMULATOR_PROXY
 
 
+class SharedFrameBuffer(object):
+    """
+    A frame store in shared memory, so that frames don't have to be pickled
+    and pushed through a Queue. It's a seqlock: the header holds a sequence
+    counter that the writer makes odd before writing a frame and even once the
+    frame is written. There's only one writer (the main process); the reader
+    copies the frame out and only accepts the copy if the counter was even
+    and didn't change while copying - otherwise, the frame was torn, and is re-read.
+    Frames are numbered starting from 1, frame number ``n`` is published
+    when the counter reaches ``2*n``.
+    """
+    header = struct.Struct("<Q")
+
+    def __init__(self, frame_size, name=None):
+        self.frame_size = frame_size
+        if name is None:
+            self.shm = shared_memory.SharedMemory(create=True, size=self.header.size + frame_size)
+            self.header.pack_into(self.shm.buf, 0, 0)
+        else:
+            try:
+                # the creating process is the one responsible for unlinking it
+                self.shm = shared_memory.SharedMemory(name=name, track=False)
+            except TypeError: # Python < 3.13
+                self.shm = shared_memory.SharedMemory(name=name)
+        self.name = self.shm.name
+        self.data = slice(self.header.size, self.header.size + frame_size)
+
+    @property
+    def sequence(self):
+        return self.header.unpack_from(self.shm.buf, 0)[0]
+
+    def write(self, data):
+        """Writes a frame and publishes it, returns its frame number."""
+        sequence = self.sequence
+        # odd - a write is in progress
+        self.header.pack_into(self.shm.buf, 0, sequence + 1)
+        self.shm.buf[self.data] = data
+        self.header.pack_into(self.shm.buf, 0, sequence + 2)
+        return (sequence + 2)//2
+
+    def read(self):
+        """Returns a ``(frame number, data)`` tuple for the latest published frame."""
+        while True:
+            sequence = self.sequence
+            if sequence % 2 == 0:
+                data = bytes(self.shm.buf[self.data])
+                if self.sequence == sequence:
+                    return sequence//2, data
+            # the writer is in the middle of a frame, letting it finish
+            sleep(0)
+
+    def close(self, unlink=False):
+        if self.shm is None:
+            return
+        self.shm.close()
+        if unlink:
+            self.shm.unlink()
+        self.shm = None
+
+
 class EmulatorProxy(object):
 
     device_mode = "1"
@@ -65,12 +128,29 @@ class EmulatorProxy(object):
         self.rows = self.width//self.char_width
         self.__base_classes__ = (GraphicalOutputDevice, CharacterOutputDevice)
         self.current_image = None
+        self.frame_lock = Lock()
+        frame_size = len(Image.new(self.mode, (self.width, self.height)).tobytes())
+        self.frames = SharedFrameBuffer(frame_size)
         self.start_process()
 
     def start_process(self):
-        self.proc = Process(target=Emulator, args=(self.child_conn, self.child_queue, self.o_lock), kwargs={"mode":self.mode, "width":self.width, "height":self.height, "scale":self.scale, "default_font":self.default_font, "font_size":(self.char_height, self.char_width)})
+        self.proc = Process(target=Emulator, args=(self.child_conn, self.child_queue, self.o_lock), kwargs={"mode":self.mode, "width":self.width, "height":self.height, "scale":self.scale, "default_font":self.default_font, "font_size":(self.char_height, self.char_width), "frame_buffer":(self.frames.name, self.frames.frame_size)})
         self.proc.start()
 
+    def display_image(self, image, **kwargs):
+        """
+        Puts the image into the shared framebuffer and only sends the
+        emulator process the frame's sequence number. Images that don't
+        match the emulated display's mode and size are sent as-is.
+        """
+        if image == None:
+            raise ValueError("None passed to display_image! Did you forget a return statement somewhere?")
+        if image.mode != self.mode or image.size != (self.width, self.height):
+            return DummyCallableRPCObject(self.child_queue, 'display_image', self.o_lock)(image)
+        with self.frame_lock:
+            sequence = self.frames.write(image.tobytes())
+            DummyCallableRPCObject(self.child_queue, 'display_shared_frame', self.o_lock)(sequence)
+
     def poll_input(self, timeout=1):
         if self.parent_conn.poll(timeout) is True:
             return self.parent_conn.recv()
@@ -93,7 +173,7 @@ class EmulatorProxy(object):
         draw = canvas(self.device)
         d = draw.__enter__()
         lines_to_image(d, args, font, self.char_height, self.char_width, self.default_color, \
-                       cursor_position, cursor_position)
+                       cursor_position, cursor_position, image=draw.image)
         return draw.image
 
     def quit(self):
@@ -102,6 +182,7 @@ class EmulatorProxy(object):
             self.proc.join()
         except AttributeError:
             pass
+        self.frames.close(unlink=True)
 
     def __getattr__(self, name):
         # Raise an exception if the attribute being called
@@ -141,10 +222,14 @@ class Emulator(object):
     for any future visitors:
     this runs in a whole different process
     """
-    def __init__(self, child_conn, child_queue, o_lock, mode="1", width=128, height=64, default_color="white", default_font=None, scale=2, font_size=None):
+    def __init__(self, child_conn, child_queue, o_lock, mode="1", width=128, height=64, default_color="white", default_font=None, scale=2, font_size=None, frame_buffer=None):
         self.child_conn = child_conn
         self.child_queue = child_queue
         self.o_lock = o_lock
+        self.frames = SharedFrameBuffer(frame_buffer[1], name=frame_buffer[0]) if frame_buffer else None
+        self.shown_sequence = 0
+
+        self.mode = mode
 
         self.width = width
         self.height = height
@@ -186,6 +271,7 @@ class Emulator(object):
         Device = getattr(luma.emulator.device, self.emulator_attributes['display'])
         self.device = Device(**self.emulator_attributes)
         pygame.key.set_repeat(self.key_delay, self.key_interval)
+        self.call_event = pygame.event.custom_type()
 
     def runner(self):
         try:
@@ -197,9 +283,10 @@ class Emulator(object):
             raise
         finally:
             self.child_conn.close()
+            if self.frames:
+                self.frames.close()
 
-    def _poll_input(self):
-        event = pygame.event.poll()
+    def _process_input(self, event):
         if event.type in [pygame.KEYDOWN, pygame.KEYUP]:
             key = event.key
             state = {pygame.KEYDOWN: KEY_PRESSED, \
@@ -215,25 +302,39 @@ class Emulator(object):
                     self.pressed_keys.remove(key)
             self.child_conn.send({'key': key, 'state':state})
 
-    def _poll_parent(self):
-        if not self.child_queue.empty():
+    def _receive_calls(self):
+        # SDL input can't be waited on together with a pipe, so calls from the
+        # parent are moved into the pygame event queue, and the event loop
+        # only has to block on that
+        while True:
             try:
-                event = self.child_queue.get()
-            except:
-                import traceback; traceback.print_exc()
+                call = self.child_queue.get()
+            except (EOFError, OSError):
                 return
-            #with self.o_lock: # no more writing while the current arg is being processed? aaaaaaaaaaa lmao
-            func = getattr(self, event['func_name'])
-            try:
-                func(*event['args'], **event['kwargs'])
             except:
                 import traceback; traceback.print_exc()
+                continue
+            pygame.event.post(pygame.event.Event(self.call_event, call=call))
+            if call['func_name'] == 'quit':
+                return
+
+    def _process_call(self, call):
+        func = getattr(self, call['func_name'])
+        try:
+            func(*call['args'], **call['kwargs'])
+        except:
+            import traceback; traceback.print_exc()
 
     def _event_loop(self):
+        receiver = Thread(target=self._receive_calls, name="Emulator RPC receiver")
+        receiver.daemon = True
+        receiver.start()
         while self._quit is False:
-            self._poll_parent()
-            self._poll_input()
-            sleep(0.001)
+            event = pygame.event.wait()
+            if event.type == self.call_event:
+                self._process_call(event.call)
+            else:
+                self._process_input(event)
 
     def setCursor(self, row, col):
         self.cursor_pos = [
@@ -263,6 +364,18 @@ class Emulator(object):
             self.current_image = image
             self._display_image(image)
 
+    def display_shared_frame(self, sequence):
+        """
+        Displays the latest frame from the shared framebuffer. Calls for
+        frames that were already shown (because a newer frame was put into
+        the framebuffer in the meantime, and that one was shown) are skipped.
+        """
+        if sequence <= self.shown_sequence:
+            return
+        self.shown_sequence, data = self.frames.read()
+        image = Image.frombytes(self.mode, (self.width, self.height), data)
+        self.display_image(image)
+
     def _display_image(self, image):
         self.device.display(image)
 
@@ -289,7 +402,7 @@ class Emulator(object):
         draw = canvas(self.device)
         d = draw.__enter__()
         lines_to_image(d, args, font, char_height, char_width, color, \
-                       cursor_pos, cursor_position)
+                       cursor_pos, cursor_position, image=draw.image)
         return draw.image
 
     def set_color(self, color):
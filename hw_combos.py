@@ -43,6 +43,17 @@ def set_status_bar_height(config, height):
     else:
         logger.info("Tried to set status bar height to {}, but it's already {}".format(height, config["app_manager"]["status_bar_height"]))
 
+def set_input_queue_policy(config, policy):
+    # see InputQueue in input/input.py for the available options
+    if "input_queue" not in config:
+        config["input_queue"] = policy
+        logger.info("Set input queue policy to {}".format(policy))
+    else:
+        logger.info("Tried to set input queue policy to {}, but it's already {}".format(policy, config["input_queue"]))
+
+# HID keyboards auto-repeat keys, and the framebuffer redraws on those devices can't always keep up
+hid_keyboard_queue_policy = {"coalesce_keys":True, "held_deadline":0.5, "max_size":32}
+
 def update_config(config, input_config, output_config):
     # looking out for modifications to the proposed config
     if "input" in config:
@@ -184,6 +195,7 @@ def config_beepy(config):
         io[0]["bus"] = int(config.get("i2c", 1))
     io[0] = [io[0]]
     io[0].append({"driver":"beepy_hid"})
+    set_input_queue_policy(config, dict(hid_keyboard_queue_policy))
     set_status_bar_height(config, 30)
     return io
     # once all known Blepises are migrated to use `device: blepis`, remove above block:
@@ -205,6 +217,7 @@ def config_blepis(config):
         io[0]["bus"] = int(config.get("i2c", 1))
     io[0] = [io[0]]
     io[0].append({"driver":"beepy_hid"})
+    set_input_queue_policy(config, dict(hid_keyboard_queue_policy))
     set_status_bar_height(config, 30)
     return io
 
@@ -212,6 +225,7 @@ def config_colorberry(config):
     io = [{"driver":"beepy_hid"}, {"driver":"beepy_fb", "fb_num":1, "force_color":True}]
     if "fb_num" in config:
         io[1]["fb_num"] = config.get("fb_num", 1)
+    set_input_queue_policy(config, dict(hid_keyboard_queue_policy))
     set_status_bar_height(config, 30)
     return io
 
@@ -471,6 +485,18 @@ class TestCombination(unittest.TestCase):
         assert(i == {'driver': 'beepy_hid'})
         assert(o == {'driver': 'beepy_fb', 'fb_num': 1, "force_color":True})
 
+    def test_input_queue_policy(self):
+        """tests that devices set an input queue policy, unless the user config already has one"""
+        config = {"device":"beepy"}
+        get_io_configs(config)
+        assert(config["input_queue"] == hid_keyboard_queue_policy)
+        config = {"device":"beepy", "input_queue":{"max_size":8}}
+        get_io_configs(config)
+        assert(config["input_queue"] == {"max_size":8})
+        config = {"device":"emulator"}
+        get_io_configs(config)
+        assert("input_queue" not in config)
+
     #io = [{"driver":"beepy_hid"}, {"driver":"beepy_fb", "fb_num":1}]
 
 if __name__ == '__main__':
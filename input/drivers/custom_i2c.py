@@ -44,14 +44,21 @@ class InputDevice(InputSkeleton):
     supports_held_state = True
     state_mapping = {0:KEY_PRESSED, 1:KEY_HELD, 2:KEY_RELEASED}
 
-    def __init__(self, addr = 0x12, bus = 1, int_pin = 16, **kwargs):
+    # interrupt mode: how often to check stop_flag while waiting for an edge
+    edge_timeout = 1000 # ms
+    # polling mode: the interval goes down to min right after a key, and doubles up to max while idle
+    min_poll_interval = 0.01
+    max_poll_interval = 0.16
+
+    def __init__(self, addr = 0x12, bus = 1, int_pin = 16, block_size = 8, **kwargs):
         """Initialises the ``InputDevice`` object.
 
         Kwargs:
 
             * ``bus``: I2C bus number.
             * ``addr``: I2C address of the device.
-            * ``int_pin``: GPIO pin for interrupt mode.
+            * ``int_pin``: GPIO pin for interrupt mode. If ``None``, the keypad is polled.
+            * ``block_size``: how many keycodes to read in one I2C transaction. Set to 1 to read them one by one.
 
         """
         self.bus_num = bus
@@ -59,6 +66,7 @@ class InputDevice(InputSkeleton):
             addr = int(addr, 16)
         self.addr = addr
         self.int_pin = int_pin
+        self.block_size = block_size
         InputSkeleton.__init__(self, **kwargs)
 
     def init_hw(self):
@@ -70,7 +78,7 @@ class InputDevice(InputSkeleton):
         """Runs either interrupt-driven or polling loop."""
         self.stop_flag = False
         if self.int_pin is None:
-            self.loop_polling() # Actually... it's not implemented =D
+            self.loop_polling()
         else:
             self.loop_interrupts()
 
@@ -84,50 +92,88 @@ class InputDevice(InputSkeleton):
                 # Looping while the device is not found
                 sleep(self.connection_check_sleep)
                 continue
-            while GPIO.input(self.int_pin) == False and self.enabled:
-                logger.debug("GPIO low, reading data")
-                if self.suspended:
-                    sleep(0.01)
-                    continue
-                try:
-                    data = self.bus.read_byte(self.addr)
-                    logger.debug("Received {:#010b}".format(data))
-                except IOError:
-                    if self.connected.is_set():
-                        logger.error("Can't get data from keypad!")
-                        self.connected.clear()
+            if GPIO.input(self.int_pin):
+                # Nothing to read, sleeping until the keypad pulls INT low.
+                # Checking the level first, so that an edge that happened
+                # while we were reading isn't missed.
+                GPIO.wait_for_edge(self.int_pin, GPIO.FALLING, timeout=self.edge_timeout)
+                continue
+            if self.suspended or not self.enabled:
+                sleep(0.1)
+                continue
+            logger.debug("GPIO low, reading data")
+            if self.read_keys() == 0:
+                logger.warning("Received 0 or other data from keypad though the interrupt has been triggered!")
+                sleep(0.1)
+
+    def loop_polling(self):
+        """Polling loop, for when the INT pin isn't connected. Stops when ``stop_flag`` is set to True."""
+        interval = self.min_poll_interval
+        while not self.stop_flag:
+            if not self.check_connection():
+                sleep(self.connection_check_sleep)
+                continue
+            if not self.suspended and self.enabled and self.read_keys():
+                interval = self.min_poll_interval
+            else:
+                interval = min(interval*2, self.max_poll_interval)
+            sleep(interval)
+
+    def read_keys(self):
+        """
+        Reads all the keycodes the keypad has buffered, ``block_size`` keycodes per I2C
+        transaction, and sends the keys. Returns the amount of keycodes received,
+        or None if the keypad couldn't be read.
+        """
+        count = 0
+        # bounded, in case the keypad misbehaves and never returns an empty buffer
+        for i in range(8):
+            try:
+                if self.block_size > 1:
+                    data = self.bus.read_i2c_block_data(self.addr, 0, self.block_size)
                 else:
-                    if not self.connected.is_set():
-                        logger.info("Receiving data from keypad again!")
-                        self.connected.set()
-                    # Valid format: 8 bits
-                    # [0, state, state, key, key, key, key, key]
-                    # Parsing data into bits
-                    data_7 = data >> 7           # Bit  7
-                    data_65 = (data >> 5) & 0x7  # Bits 6 and 5
-                    data_43210 = data & 0x1f     # Bits 4,3,2,1,0
-                    #print("{} {} {} {}".format( *map(bin, (data, data_7, data_65, data_43210)) ))
-                    if data_7 == 0 \
-                      and data_65 in self.state_mapping.keys() \
-                      and data_43210 != 0:
-                        # data_7 should be 0, other reserved for future
-                        # data_65 in (0, 1, 2): (pressed, released, held), 3 is reserved
-                        # data_43210 != 0: 0x00 is returned when I2C buffer is empty (no keys to be read)
-                        key_num = data_43210 - 1
-                        if key_num in range(len(self.mapping)):
-                            key_name = self.mapping[key_num]
-                            state = data_65
-                            logger.debug("Maps to valid key: {}, state: {}".format(key_name, state))
-                            self.map_and_send_key(key_name, state=self.state_mapping[state])
-                        else:
-                            logger.warning("Non-mappable key data arrived: {}".format(key_num))
-                    else:
-                        if data == 0:
-                            logger.warning("Received 0 or other data from keypad though the interrupt has been triggered!")
-                            sleep(0.1)
-                        else:
-                            logger.info("Non-key data arrived: {}".format(bin(data)))
-            sleep(0.1)
+                    data = [self.bus.read_byte(self.addr)]
+            except IOError:
+                if self.connected.is_set():
+                    logger.error("Can't get data from keypad!")
+                    self.connected.clear()
+                return None
+            if not self.connected.is_set():
+                logger.info("Receiving data from keypad again!")
+                self.connected.set()
+            for byte in data:
+                # 0x00 is returned when I2C buffer is empty (no keys to be read)
+                if byte == 0:
+                    return count
+                count += 1
+                self.process_data(byte)
+            # the whole block was keycodes, there might be more
+        return count
+
+    def process_data(self, data):
+        logger.debug("Received {:#010b}".format(data))
+        # Valid format: 8 bits
+        # [0, state, state, key, key, key, key, key]
+        # Parsing data into bits
+        data_7 = data >> 7           # Bit  7
+        data_65 = (data >> 5) & 0x7  # Bits 6 and 5
+        data_43210 = data & 0x1f     # Bits 4,3,2,1,0
+        #print("{} {} {} {}".format( *map(bin, (data, data_7, data_65, data_43210)) ))
+        if data_7 == 0 \
+          and data_65 in self.state_mapping.keys() \
+          and data_43210 != 0:
+            # data_7 should be 0, other reserved for future
+            # data_65 in (0, 1, 2): (pressed, released, held), 3 is reserved
+            key_num = data_43210 - 1
+            if key_num in range(len(self.mapping)):
+                key_name = self.mapping[key_num]
+                state = data_65
+                logger.debug("Maps to valid key: {}, state: {}".format(key_name, state))
+                self.map_and_send_key(key_name, state=self.state_mapping[state])
+            else:
+                logger.warning("Non-mappable key data arrived: {}".format(key_num))
+        else:
+            logger.info("Non-key data arrived: {}".format(bin(data)))
 
 
 if __name__ == "__main__":
@@ -1,5 +1,7 @@
 from evdev import InputDevice as HID, list_devices, ecodes
-from time import sleep
+from threading import Thread, Lock
+import select
+import os
 
 from zpui_lib.helpers import setup_logger
 from input.drivers.skeleton import InputSkeleton
@@ -16,9 +18,28 @@ def get_input_devices():
             pass
     return devices
 
+def get_indexed_devices():
+    """
+    Returns the list of device info dictionaries from the hotplug device index
+    if it's running, so that the devices don't have to be opened; otherwise, None.
+    """
+    try:
+        from input import hotplug
+    except ImportError:
+        return None
+    if hotplug.device_index is None:
+        return None
+    return hotplug.device_index.get_devices()
+
 def get_path_by_name(name):
     """Gets HID device path by name, returns None if not found."""
     path = None
+    devices = get_indexed_devices()
+    if devices is not None:
+        for dev in devices:
+            if dev["name"] == name:
+                path = dev["path"]
+        return path
     for dev in get_input_devices():
         if dev.name == name:
             try:
@@ -30,6 +51,12 @@ def get_path_by_name(name):
 def get_name_by_path(path):
     """Gets HID device path by name, returns None if not found."""
     name = None
+    devices = get_indexed_devices()
+    if devices is not None:
+        for dev in devices:
+            if dev["path"] == path:
+                name = dev["name"]
+        return name
     for dev in get_input_devices():
         try:
             dev_path = dev.path
@@ -40,6 +67,105 @@ def get_name_by_path(path):
     return name
 
 
+class HIDReactor(object):
+    """
+    Waits for events from all HID devices in a single thread, using ``epoll``,
+    instead of each driver polling its device in a thread of its own. Devices
+    that aren't connected are re-checked every ``connection_check_sleep`` seconds;
+    other than that, the thread only wakes up when there are events to read.
+    The thread is started when the first driver is added, and exits once
+    there are no drivers left.
+    """
+
+    def __init__(self):
+        self.epoll = select.epoll()
+        self.drivers = {} # fd: driver
+        self.waiting = [] # drivers that don't have a device connected
+        self.lock = Lock()
+        self.thread = None
+        # lets other threads interrupt epoll.poll() when drivers are added or removed
+        self.wakeup_r, self.wakeup_w = os.pipe()
+        os.set_blocking(self.wakeup_r, False)
+        self.epoll.register(self.wakeup_r, select.EPOLLIN)
+
+    def add(self, driver):
+        with self.lock:
+            self.waiting.append(driver)
+            if self.thread is None:
+                self.thread = Thread(target=self.run, name="HID reactor thread")
+                self.thread.daemon = True
+                self.thread.start()
+        self.wakeup()
+
+    def remove(self, driver):
+        with self.lock:
+            if driver in self.waiting:
+                self.waiting.remove(driver)
+            for fd, d in list(self.drivers.items()):
+                if d is driver:
+                    self.unregister(fd)
+        self.wakeup()
+
+    def wakeup(self):
+        os.write(self.wakeup_w, b"\x00")
+
+    def unregister(self, fd):
+        self.drivers.pop(fd)
+        try:
+            self.epoll.unregister(fd)
+        except (OSError, ValueError):
+            pass # fd already closed
+
+    def connect_waiting(self):
+        for driver in list(self.waiting):
+            if driver.stop_flag:
+                self.waiting.remove(driver)
+                continue
+            if not driver.check_connection():
+                continue
+            try:
+                fd = driver.device.fileno()
+            except (AttributeError, OSError):
+                continue
+            self.waiting.remove(driver)
+            self.drivers[fd] = driver
+            self.epoll.register(fd, select.EPOLLIN)
+
+    def run(self):
+        while True:
+            with self.lock:
+                self.connect_waiting()
+                if not self.drivers and not self.waiting:
+                    self.thread = None
+                    return
+                timeout = min([d.connection_check_sleep for d in self.waiting]) if self.waiting else -1
+            for fd, _ in self.epoll.poll(timeout):
+                if fd == self.wakeup_r:
+                    try:
+                        os.read(fd, 4096)
+                    except BlockingIOError:
+                        pass
+                    continue
+                with self.lock:
+                    driver = self.drivers.get(fd)
+                if driver is None:
+                    continue
+                if not driver.read_events():
+                    with self.lock:
+                        if fd in self.drivers:
+                            self.unregister(fd)
+                        if not driver.stop_flag:
+                            self.waiting.append(driver)
+
+reactor = None
+
+def get_reactor():
+    global reactor
+    if reactor is None:
+        reactor = HIDReactor()
+    return reactor
+
+
 class InputDevice(InputSkeleton):
     """ A driver for HID devices. As for now, supports keyboards and numpads."""
 
@@ -101,34 +227,45 @@ class InputDevice(InputSkeleton):
             logger.info("Unsuspended - grabbing device {} {}".format(self.name, self.path))
             self.device.grab()
 
+    def start_thread(self):
+        """Hands the device over to the shared HID reactor thread, instead of starting a thread for it."""
+        get_reactor().add(self)
+
     def runner(self):
-        """Blocking event loop which just calls supplied callbacks in the keymap."""
-        while not self.stop_flag:
-            if not self.check_connection():
-                # Looping while the device is not found
-                sleep(self.connection_check_sleep)
-                continue
-            if self.suspended:
-                sleep(0.01)
-                continue
-            try:
-                event = self.device.read_one()
-                self.hid_device_error_filter = False
-            except (IOError, AttributeError) as e:
-                if not self.hid_device_error_filter:
-                    logger.exception("Error while reading from the HID device {}!".format(self.path))
-                    self.hid_device_error_filter = True
-                if isinstance(e, IOError) and e.errno == 11:
-                    #raise #Uncomment only if you have nothing better to do - error seems to appear at random
-                    continue
-                else:
-                    self.connected.clear()
-            except Exception as e:
+        """Blocking event loop for this device only, for when the driver is used with ``threaded=False``."""
+        self.stop_flag = False
+        r = HIDReactor()
+        r.add(self)
+        r.thread.join()
+
+    def read_events(self):
+        """
+        Reads and processes all the events that the device has pending. Returns False
+        if the device needs to be reconnected. Events are discarded while suspended,
+        so that they don't get replayed on unsuspend.
+        """
+        if self.stop_flag:
+            return False
+        try:
+            events = list(self.device.read())
+            self.hid_device_error_filter = False
+        except BlockingIOError:
+            # woken up without any events - can happen, nothing to worry about
+            return True
+        except Exception as e:
+            if not self.hid_device_error_filter:
                 logger.exception("Error while reading from the HID device {}!".format(self.path))
-                self.connected.clear()
-            else:
+                self.hid_device_error_filter = True
+            self.connected.clear()
+            try:
+                self.device.close()
+            except:
+                pass
+            return False
+        if not self.suspended:
+            for event in events:
                 self.process_event(event)
-                sleep(0.01)
+        return True
 
     def process_event(self, event):
         if event is not None and event.type == ecodes.EV_KEY:
@@ -143,6 +280,7 @@ class InputDevice(InputSkeleton):
 
     def atexit(self):
         InputSkeleton.atexit(self)
+        get_reactor().remove(self)
         try:
             self.device.ungrab()
         except:
@@ -0,0 +1,77 @@
+import json
+from threading import Event
+from time import sleep, monotonic
+
+from input.drivers.skeleton import InputSkeleton, KEY_PRESSED, KEY_RELEASED
+
+from zpui_lib.helpers import setup_logger
+logger = setup_logger(__name__, "warning")
+
+class InputDevice(InputSkeleton):
+    """
+    Replays a timed sequence of keypresses - meant to be used together with
+    the headless output driver, for benchmarks and load tests. ``script`` is
+    a list of ``[key, delay]`` pairs (or just key names, which use ``interval``
+    as the delay), where ``delay`` is the pause before the key is pressed, in seconds.
+    It can also be loaded from a JSON file, using ``script_path``. With ``autostart``
+    disabled, the script only starts playing once ``start_script`` is called.
+    """
+
+    supports_key_states = True
+
+    default_mapping = [
+    "KEY_LEFT",
+    "KEY_UP",
+    "KEY_DOWN",
+    "KEY_RIGHT",
+    "KEY_ENTER"]
+
+    def __init__(self, script=None, script_path=None, interval=0.1, start_delay=1, repeat=1, autostart=True, **kwargs):
+        if script_path:
+            with open(script_path) as f:
+                script = json.load(f)
+        self.script = [[step, interval] if isinstance(step, basestring) else step for step in (script or [])]
+        self.start_delay = start_delay
+        self.repeat = repeat
+        # (timestamp, key) for each keypress sent
+        self.sent_keys = []
+        self.finished = Event()
+        self.started = Event()
+        if autostart:
+            self.started.set()
+        keys = [key for key, _ in self.script if key not in self.default_mapping]
+        if keys and "mapping" not in kwargs:
+            kwargs["mapping"] = self.default_mapping + sorted(set(keys))
+        InputSkeleton.__init__(self, **kwargs)
+
+    def init_hw(self):
+        return True
+
+    def start_script(self):
+        self.started.set()
+
+    def runner(self):
+        """Plays the script once started, then exits"""
+        self.stop_flag = False
+        self.started.wait()
+        sleep(self.start_delay)
+        for _ in range(self.repeat):
+            for key, delay in self.script:
+                sleep(delay)
+                while not self.enabled and not self.stop_flag:
+                    sleep(0.1)
+                if self.stop_flag:
+                    return
+                self.sent_keys.append((monotonic(), key))
+                self.map_and_send_key(key, state=KEY_PRESSED)
+                self.map_and_send_key(key, state=KEY_RELEASED)
+        logger.info("Script finished, {} keys sent".format(len(self.sent_keys)))
+        self.finished.set()
+
+    def atexit(self):
+        InputSkeleton.atexit(self)
+        self.started.set()
+
+if __name__ == "__main__":
+    id = InputDevice(script=["KEY_DOWN", "KEY_DOWN", "KEY_ENTER"], threaded=False)
+    id.runner()
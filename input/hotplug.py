@@ -1,5 +1,9 @@
-from threading import Thread
+from threading import Thread, Lock, Event
 from time import sleep
+import ctypes
+import ctypes.util
+import struct
+import os
 
 from zpui_lib.helpers import setup_logger
 
@@ -24,13 +28,158 @@ def get_input_devices():
     return devices
 
 
+class Inotify(object):
+    """A minimal ``inotify`` wrapper - the library we'd use isn't always installed, and ``ctypes`` is."""
+
+    IN_ATTRIB = 0x4
+    IN_MOVED_FROM = 0x40
+    IN_MOVED_TO = 0x80
+    IN_CREATE = 0x100
+    IN_DELETE = 0x200
+
+    event_header = struct.Struct("iIII") # wd, mask, cookie, len
+
+    def __init__(self):
+        self.libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        self.fd = self.libc.inotify_init1(os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+
+    def add_watch(self, path, mask):
+        wd = self.libc.inotify_add_watch(self.fd, path.encode(), mask)
+        if wd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_add_watch failed for {}".format(path))
+        return wd
+
+    def read(self):
+        """Blocks until there are events, returns a list of ``(mask, filename)`` tuples."""
+        data = os.read(self.fd, 4096)
+        events = []
+        offset = 0
+        while offset < len(data):
+            wd, mask, cookie, length = self.event_header.unpack_from(data, offset)
+            offset += self.event_header.size
+            name = data[offset:offset+length].rstrip(b"\x00").decode()
+            offset += length
+            events.append((mask, name))
+        return events
+
+
+class DeviceIndex(object):
+    """
+    Keeps track of the evdev devices in ``/dev/input`` - their paths, names
+    and capabilities. Each device node is only opened once, when it appears;
+    after the initial scan, changes are picked up with ``inotify``, or by
+    rescanning every ``rescan_interval`` seconds if ``inotify`` isn't available.
+    Callbacks get ``"added"`` or ``"removed"`` and the device's info dictionary.
+    """
+
+    input_dir = "/dev/input"
+    rescan_interval = 3
+
+    def __init__(self, input_dir=None):
+        if input_dir:
+            self.input_dir = input_dir
+        self.devices = {}
+        self.callbacks = []
+        self.lock = Lock()
+        self.inotify = None
+        self.thread = None
+
+    def start(self):
+        try:
+            self.inotify = Inotify()
+            self.inotify.add_watch(self.input_dir, Inotify.IN_CREATE | Inotify.IN_DELETE | \
+                                   Inotify.IN_ATTRIB | Inotify.IN_MOVED_FROM | Inotify.IN_MOVED_TO)
+        except (OSError, AttributeError):
+            logger.exception("Can't watch {} with inotify, will be rescanning it instead".format(self.input_dir))
+            self.inotify = None
+        self.rescan()
+        self.thread = Thread(target=self.run, name="Input device index thread")
+        self.thread.daemon = True
+        self.thread.start()
+
+    def register_callback(self, cb):
+        self.callbacks.append(cb)
+
+    def notify(self, event, info):
+        for cb in self.callbacks:
+            try:
+                cb(event, info)
+            except:
+                logger.exception("Device index callback {} failed!".format(cb))
+
+    def get_devices(self):
+        with self.lock:
+            return list(self.devices.values())
+
+    def rescan(self):
+        paths = set(evdev.list_devices(self.input_dir))
+        with self.lock:
+            known = set(self.devices.keys())
+        for path in known - paths:
+            self.remove_device(path)
+        for path in sorted(paths - known):
+            self.add_device(path)
+
+    def add_device(self, path):
+        try:
+            device = evdev.InputDevice(path)
+        except (OSError, IOError):
+            # not accessible yet, IN_ATTRIB will arrive once udev sets the permissions
+            return
+        try:
+            info = {"path":path, "name":device.name, "capabilities":device.capabilities()}
+        except:
+            logger.exception("Error while getting info for a HID device {}".format(path))
+            return
+        finally:
+            device.close()
+        with self.lock:
+            self.devices[path] = info
+        self.notify("added", info)
+
+    def remove_device(self, path):
+        with self.lock:
+            info = self.devices.pop(path, None)
+        if info:
+            self.notify("removed", info)
+
+    def run(self):
+        while True:
+            if self.inotify is None:
+                sleep(self.rescan_interval)
+                self.rescan()
+                continue
+            for mask, name in self.inotify.read():
+                if not name.startswith("event"):
+                    continue
+                path = os.path.join(self.input_dir, name)
+                if mask & (Inotify.IN_DELETE | Inotify.IN_MOVED_FROM):
+                    self.remove_device(path)
+                elif path not in self.devices:
+                    self.add_device(path)
+
+device_index = None
+
+def get_device_index():
+    """Returns the ``DeviceIndex``, starting it if it isn't running yet."""
+    global device_index
+    if device_index is None:
+        device_index = DeviceIndex()
+        device_index.start()
+    return device_index
+
+
 class DeviceManager():
     def __init__(self, i):
         self.i = i
         self.driver_storage = {}
         self.monitor_cbs = []
-        self.start_monitor_loops()
+        self.device_index = None
+        self.devices_changed = Event()
         self.unconnectable_keyboards = []
+        self.start_monitor_loops()
 
     def register_monitor_callback(self, cb):
         self.monitor_cbs.append(cb)
@@ -56,7 +205,10 @@ class DeviceManager():
         if dtype not in ["hid"]:
             raise ValueError("Types other than 'hid' are not supported- asked for {}!".format(dtype))
         if dtype == "hid":
-            from drivers.hid import InputDevice as HIDDriver
+            try:
+                from input.drivers.hid import InputDevice as HIDDriver
+            except ImportError:
+                from drivers.hid import InputDevice as HIDDriver
             driver = HIDDriver(path=path, name=name)
         dname = self.i.attach_driver(driver)
         self.driver_storage[dname] = driver
@@ -72,8 +224,14 @@ class DeviceManager():
         # if custom i2c devices are actually present and evdev lib is installed
         ci_drivers = self.get_custom_i2c_drivers()
         if len(ci_drivers) > 0 and evdev is not None:
+            self.device_index = get_device_index()
+            self.device_index.register_callback(self.on_device_change)
             self.start_ukouk_thread()
 
+    def on_device_change(self, event, info):
+        # wakes the monitor loop up
+        self.devices_changed.set()
+
     def start_ukouk_thread(self):
         self.ukouk_thread = Thread(target=self.connect_usb_keyboard_on_unresponsive_keypad_loop, \
                                 name="'connect USB keyboard on unresponsive keypad' monitor thread")
@@ -94,35 +252,44 @@ class DeviceManager():
                 usb_keyboard = None
                 while usb_keyboard is None and not driver.connected.is_set():
                     self.notify_event("looking_for_usb_keyboard")
+                    self.devices_changed.clear()
                     usb_keyboard = self.detect_usb_keyboard()
                     if usb_keyboard is None:
-                        sleep(self.usb_keyboard_not_detected_sleep)
+                        # returns as soon as a device appears
+                        self.devices_changed.wait(self.usb_keyboard_not_detected_sleep)
                 if driver.connected.is_set(): # Driver is active again
                     self.notify_event("custom_i2c_connected_back")
                     continue
                 else: # Driver still not active and keyboard was found
                     self.notify_event("usb_keyboard_found")
-                    driver_name = self.connect_usb_keyboard(usb_keyboard.name)
+                    driver_name = self.connect_usb_keyboard(usb_keyboard["name"], usb_keyboard["path"])
                     if driver_name:
                         self.notify_event("usb_keyboard_connected")
-                        while self.i.drivers[driver_name].connected.is_set(): # idling while driver is connected
-                            sleep(self.usb_keyboard_connected_sleep)
+                        # idling while driver is connected and the device is there
+                        while self.i.drivers[driver_name].connected.is_set() and self.device_present(usb_keyboard["path"]):
+                            self.devices_changed.clear()
+                            self.devices_changed.wait(self.usb_keyboard_connected_sleep)
                         self.notify_event("usb_keyboard_disconnected")
                         self.remove_driver(driver_name)
                     else:
                         self.notify_event("usb_keyboard_failed_to_connect")
-                        self.unconnectable_keyboards.append(usb_keyboard.name)
+                        self.unconnectable_keyboards.append(usb_keyboard["name"])
             else: # driver OK
                 sleep(self.driver_ok_sleep)
 
     def detect_usb_keyboard(self):
-        hid_devices = get_input_devices()
-        usb_keyboards = [hid_dev for hid_dev in hid_devices if hid_dev.name not in self.unconnectable_keyboards]
+        """Returns info for a device that has keys and hasn't failed to connect before, or None."""
+        hid_devices = self.device_index.get_devices()
+        usb_keyboards = [hid_dev for hid_dev in hid_devices if hid_dev["name"] not in self.unconnectable_keyboards \
+                                                            and evdev.ecodes.EV_KEY in hid_dev["capabilities"]]
         return usb_keyboards[0] if usb_keyboards else None # again, needs a better heuristic
 
-    def connect_usb_keyboard(self, usb_keyboard):
+    def device_present(self, path):
+        return path in [dev["path"] for dev in self.device_index.get_devices()]
+
+    def connect_usb_keyboard(self, usb_keyboard, path=None):
         try:
-            driver_name = self.add_driver(name=usb_keyboard, dtype="hid")
+            driver_name = self.add_driver(path=path, name=usb_keyboard, dtype="hid")
         except:
             logger.exception("Failed to attach USB keyboard {}:".format(usb_keyboard))
             return False
@@ -1,7 +1,10 @@
 from threading import Thread, Event
 from traceback import format_exc
-from time import sleep
+from collections import namedtuple, deque
+from time import monotonic
 from copy import deepcopy
+from types import MappingProxyType
+import logging
 import importlib
 import inspect
 import atexit
@@ -13,6 +16,7 @@ except ModuleNotFoundError:
 
 from zpui_lib.actions import Action
 from zpui_lib.helpers import setup_logger, KEY_RELEASED, KEY_HELD, KEY_PRESSED
+from startup_profiler import profiler
 
 try:
     from input.hotplug import DeviceManager
@@ -21,12 +25,299 @@ except ImportError:
 
 logger = setup_logger(__name__, "warning")
 
+
+class InputQueue(Queue):
+    """
+    A ``Queue`` that lets the ``InputProcessor`` event loop block until there's
+    either a key it can process or a reason to re-check its state (its stop flag
+    being set, or the current proxy changing), instead of polling.
+
+    It can also be told to keep the backlog of keys short when callbacks
+    are slow to process them:
+
+      * ``coalesce_keys``: a list of keys (or ``True`` for ``default_coalesce_keys``)
+        for which repeated events are merged, as long as they're still waiting
+        in the queue - i.e. an auto-repeated KEY_DOWN will only scroll the menu once
+        per redraw, instead of scrolling on long after the key has been released.
+      * ``held_deadline``: KEY_HELD events that waited in the queue for longer
+        than this many seconds are dropped.
+      * ``max_size``: once there's this many events in the queue, an event is
+        dropped for each new one - KEY_HELD events first, then presses of
+        ``coalesce_keys``, then presses of other keys, oldest first. When a press is
+        dropped, the matching release is dropped, too, so that callbacks never
+        get a release without a press.
+
+    KEY_HELD events that arrive once the key's press was merged or dropped, or once
+    its release is queued, are dropped, too - callbacks never get KEY_HELD after KEY_RELEASED.
+
+    ``merged`` and ``dropped`` attributes count the events that were merged or dropped.
+    """
+
+    default_coalesce_keys = ["KEY_UP", "KEY_DOWN", "KEY_F3", "KEY_F4"]
+
+    def __init__(self, coalesce_keys=None, held_deadline=None, max_size=None):
+        if coalesce_keys is True:
+            coalesce_keys = self.default_coalesce_keys
+        self.coalesce_keys = frozenset(coalesce_keys or [])
+        self.held_deadline = held_deadline
+        self.max_size = max_size
+        self.merged = 0
+        self.dropped = 0
+        # Keys for which a press was merged or dropped before its release arrived,
+        # so the release is to be merged/dropped, too ({key: "merged"/"dropped"})
+        self.orphaned_releases = {}
+        Queue.__init__(self)
+
+    # Queue internals - storing items together with the time they were received
+
+    def _init(self, maxsize):
+        self.queue = deque()
+
+    def _qsize(self):
+        return len(self.queue)
+
+    def _put(self, item):
+        key, state = self.split_item(item)
+        if state == KEY_RELEASED and key in self.orphaned_releases:
+            if self.orphaned_releases.pop(key) == "merged":
+                self.merged += 1
+            else:
+                self.dropped += 1
+            return
+        if state == KEY_HELD and self.is_released(key):
+            # The press this event belongs to was merged or dropped, or the key's already
+            # been released - a callback would get KEY_HELD after KEY_RELEASED otherwise
+            if self.orphaned_releases.get(key, "dropped") == "merged":
+                self.merged += 1
+            else:
+                self.dropped += 1
+            return
+        if self.coalesce_keys and self.coalesce(key, state, item):
+            self.merged += 1
+            return
+        if state == KEY_PRESSED:
+            # A new press that's going to be processed - whatever happened
+            # to the previous press of this key, its release is not orphaned
+            self.orphaned_releases.pop(key, None)
+        if self.max_size and len(self.queue) >= self.max_size:
+            self.make_room()
+        self.queue.append((monotonic(), item))
+
+    def _get(self):
+        return self.queue.popleft()[1]
+
+    @staticmethod
+    def split_item(item):
+        return item if isinstance(item, tuple) else (item, None)
+
+    def is_released(self, key):
+        """
+        Returns True if, as far as the queue is concerned, the key is released - that is,
+        its press was merged or dropped, or the last event for it in the queue is a release.
+        """
+        if key in self.orphaned_releases:
+            return True
+        for _, item in reversed(self.queue):
+            queued_key, queued_state = self.split_item(item)
+            if queued_key == key:
+                return queued_state == KEY_RELEASED
+        return False
+
+    def coalesce(self, key, state, item):
+        """
+        Returns True if the item should be merged into an event that's
+        already in the queue, instead of being added to the queue.
+        """
+        if key not in self.coalesce_keys:
+            return False
+        if not self.queue or state == KEY_RELEASED:
+            return False
+        last_item = self.queue[-1][1]
+        if last_item == item:
+            # Same key and state as the last event waiting - i.e. a key without states
+            # pressed again, or KEY_HELD repeated
+            return True
+        if state == KEY_PRESSED and last_item == (key, KEY_RELEASED) \
+          and len(self.queue) > 1 and self.queue[-2][1] == (key, KEY_PRESSED):
+            # A press+release of the same key is already waiting
+            self.orphaned_releases[key] = "merged"
+            return True
+        return False
+
+    def find_droppable(self):
+        """
+        Returns the index of the event that's best to drop when the queue is full.
+        """
+        first_coalescible = first_press = None
+        for index, (_, item) in enumerate(self.queue):
+            key, state = self.split_item(item)
+            if state == KEY_HELD:
+                return index
+            if state == KEY_RELEASED:
+                continue
+            if first_coalescible is None and key in self.coalesce_keys:
+                first_coalescible = index
+            if first_press is None:
+                first_press = index
+        for index in (first_coalescible, first_press):
+            if index is not None:
+                return index
+        # Only releases in the queue
+        return 0
+
+    def make_room(self):
+        """
+        Drops an event from the queue (see ``find_droppable``). If the event is
+        a press, also drops the following events for the same key, up to and including
+        the release - or, if the release isn't in the queue yet, drops it once it arrives.
+        """
+        index = self.find_droppable()
+        _, item = self.queue[index]
+        del self.queue[index]
+        self.dropped += 1
+        key, state = self.split_item(item)
+        if state != KEY_PRESSED:
+            return
+        while index < len(self.queue):
+            next_key, next_state = self.split_item(self.queue[index][1])
+            if next_key != key:
+                index += 1
+                continue
+            del self.queue[index]
+            self.dropped += 1
+            if next_state == KEY_RELEASED:
+                return
+        self.orphaned_releases[key] = "dropped"
+
+    def is_stale(self, received_at, item):
+        if self.held_deadline is None or not isinstance(item, tuple) or item[1] != KEY_HELD:
+            return False
+        return monotonic() - received_at > self.held_deadline
+
+    def wake(self):
+        """
+        Wakes up all the threads waiting in ``get_when``, so that they re-check
+        their conditions.
+        """
+        with self.not_empty:
+            self.not_empty.notify_all()
+
+    def get_when(self, should_stop, can_process):
+        """
+        Blocks until ``should_stop()`` returns True (then, returns ``None``)
+        or until there's an item in the queue and ``can_process()`` returns True
+        (then, removes the item from the queue and returns it). Both functions
+        are re-checked each time an item is put into the queue, and each time
+        ``wake`` is called.
+        """
+        with self.not_empty:
+            while True:
+                if should_stop():
+                    if self._qsize():
+                        # We might've consumed a wakeup meant for another thread
+                        self.not_empty.notify()
+                    return None
+                if self._qsize() and can_process():
+                    received_at, item = self.queue.popleft()
+                    self.not_full.notify()
+                    if self.is_stale(received_at, item):
+                        self.dropped += 1
+                        continue
+                    return item
+                self.not_empty.wait()
+
+    def get_stats(self):
+        """
+        Returns a dictionary with the amount of events currently in the queue,
+        as well as the amount of events merged and dropped so far.
+        """
+        with self.mutex:
+            return {"queued":self._qsize(), "merged":self.merged, "dropped":self.dropped}
+
+
 class CallbackException(Exception):
     def __init__(self, errno=0, message=""):
         self.errno = errno
         self.message = message
 
 
+class Keymap(dict):
+    """
+    A dictionary that calls ``on_change`` whenever its contents are changed, used for
+    keymaps that are changed in-place, so that the dispatch tables built from them
+    get invalidated.
+    """
+
+    def __init__(self, *args, **kwargs):
+        self.on_change = kwargs.pop("on_change", None)
+        dict.__init__(self, *args, **kwargs)
+
+    def changed(self):
+        if self.on_change:
+            self.on_change()
+
+    def __setitem__(self, key, value):
+        dict.__setitem__(self, key, value)
+        self.changed()
+
+    def __delitem__(self, key):
+        dict.__delitem__(self, key)
+        self.changed()
+
+    def pop(self, *args):
+        value = dict.pop(self, *args)
+        self.changed()
+        return value
+
+    def popitem(self):
+        item = dict.popitem(self)
+        self.changed()
+        return item
+
+    def setdefault(self, key, default=None):
+        value = dict.setdefault(self, key, default)
+        self.changed()
+        return value
+
+    def update(self, *args, **kwargs):
+        dict.update(self, *args, **kwargs)
+        self.changed()
+
+    def clear(self):
+        dict.clear(self)
+        self.changed()
+
+
+# A resolved keymap entry. ``invoke`` is a function accepting (key, state) that
+# calls the callback using the calling convention the callback needs (or None if
+# the key is to be ignored), ``before_backlight`` tells whether the entry is
+# processed even if the keypress turns the backlight on.
+DispatchEntry = namedtuple("DispatchEntry", ["invoke", "callback", "type", "before_backlight"])
+
+
+def snapshot(value):
+    """
+    Returns a copy of ``value`` that can be shared between proxies - dictionaries
+    become read-only ``MappingProxyType`` views, lists are copied but stay lists
+    (UI elements do things like ``sum(i.available_keys.values(), [])``).
+
+    >>> keys = snapshot({"driver-1": ["KEY_LEFT", "KEY_RIGHT"], "driver-2": None})
+    >>> keys["driver-1"]
+    ['KEY_LEFT', 'KEY_RIGHT']
+    >>> keys["driver-3"] = []
+    Traceback (most recent call last):
+    ...
+    TypeError: 'mappingproxy' object does not support item assignment
+    """
+    if isinstance(value, dict):
+        return MappingProxyType({k:snapshot(v) for k, v in value.items()})
+    elif isinstance(value, list):
+        return [snapshot(v) for v in value]
+    elif isinstance(value, tuple):
+        return tuple(snapshot(v) for v in value)
+    return value
+
+
 class InputProcessor(object):
     """A class which listens for input device events and processes the callbacks
     set in the InputProxy instance for the currently active context."""
@@ -37,13 +328,17 @@ class InputProcessor(object):
     current_proxy = None
     proxy_methods = ["listen", "stop_listen"]
     proxy_attrs = ["available_keys"]
+    proxy_attr_snapshots = None
     proxies = []
 
-    def __init__(self, init_drivers, context_manager, on_press=True):
-        self.global_keymap = {}
+    def __init__(self, init_drivers, context_manager, on_press=True, queue_policy=None):
+        self.global_keymap_version = 0
+        self.global_keymap = Keymap(on_change=self.global_keymap_changed)
+        self.no_proxy_dispatch = None
         self.cm = context_manager
         self.on_press = on_press
-        self.queue = Queue()
+        # See ``InputQueue`` for the options that can be passed in ``queue_policy``
+        self.queue = InputQueue(**(queue_policy or {}))
         self.available_keys = {}
         self.drivers = {}
         self.initial_drivers = {}
@@ -77,6 +372,13 @@ class InputProcessor(object):
         except:
             raise #Just collecting possible exceptions for now
 
+    def get_queue_stats(self):
+        """
+        Returns a dictionary with input queue counters - amount of keys waiting
+        to be processed, and amount of keys merged/dropped so far.
+        """
+        return self.queue.get_stats()
+
     def attach_driver(self, driver):
         """
         Attaches the driver to ``InputProcessor``.
@@ -140,6 +442,8 @@ class InputProcessor(object):
             raise ValueError("A proxy is already attached!")
         logger.info("Attaching proxy for context: {}".format(proxy.context_alias))
         self.current_proxy = proxy
+        # Waking up the event loop in case it's waiting for a proxy to be attached
+        self.queue.wake()
 
     def detach_current_proxy(self):
         """
@@ -162,9 +466,16 @@ class InputProcessor(object):
         logger.info("Setting a global callback for key {}".format(key))
         if key in self.global_keymap.keys():
             #Key is already used in the global keymap
-            raise CallbackException(4, "Global callback for {} can't be set because it's already in the keymap!".format(key_name))
+            raise CallbackException(4, "Global callback for {} can't be set because it's already in the keymap!".format(key))
         self.global_keymap[key] = callback
 
+    def global_keymap_changed(self):
+        """
+        Invalidates dispatch tables of all proxies, since all of them include
+        the global keymap.
+        """
+        self.global_keymap_version += 1
+
     def receive_key(self, key, state = None):
         """
         This is the method that receives keypresses from drivers and puts
@@ -176,40 +487,40 @@ class InputProcessor(object):
         else:
             self.queue.put(key)
 
-    def event_loop(self, index):
+    def event_loop(self, index, stop_flag=None):
         """
         Blocking event loop which just calls ``process_key`` once a key
         is received in the ``self.queue``. Also has some mechanisms that
         make sure the existing event_loop will exit once flag is set, even
         if other event_loop has already started (thought an event_loop can't
         exit if it's still processing a callback.)
+
+        The loop doesn't poll - it sleeps on the queue until a key arrives
+        while a proxy is attached, or until ``stop_listen`` is called.
         """
         logger.debug("Starting event loop "+str(index))
-        self.stop_flag = Event()
-        stop_flag = self.stop_flag # Saving a reference.
+        if stop_flag is None:
+            self.stop_flag = Event()
+            stop_flag = self.stop_flag # Saving a reference.
         # stop_flag is an object that will signal the current input thread to exit or not exit once it's done processing a callback.
         # It'll be called just before self.stop_flag will be overwritten. However, we've got a reference to it and now can check the exact flag this thread itself constructed.
         # Praise the holy garbage collector.
-        stop_flag.clear()
+        # Keys are only taken from the queue while a proxy is attached, so that
+        # keys pressed before the first context switch aren't lost
+        has_proxy = lambda: self.get_current_proxy() is not None
         while not stop_flag.is_set():
-            if self.get_current_proxy() is not None:
-                try:
-                    data = self.queue.get(False, 0.1)
-                except Empty:
-                    # here an active event_loop spends most of the time
-                    sleep(0.1)
-                except AttributeError:
-                    # typically happens upon program termination
-                    pass
-                else:
-                    # here event_loop is usually busy
-                    self.process_key(data)
-            else:
-                # No current proxy set yet, not processing anything
-                sleep(0.1)
+            try:
+                # here an active event_loop spends most of the time
+                data = self.queue.get_when(stop_flag.is_set, has_proxy)
+            except AttributeError:
+                # typically happens upon program termination
+                break
+            if data is not None:
+                # here event_loop is usually busy
+                self.process_key(data)
         logger.debug("Stopping event loop "+str(index))
 
-    def global_key_processed_by_proxy(self, key, state, global_cb):
+    def global_key_processed_by_proxy(self, key, state, global_cb, proxy=None):
         """
         Checks whether the global callback execution should be skipped in favor
         of a proxy callback. For example, globally, pressing the green ("ANSWER")
@@ -219,9 +530,13 @@ class InputProcessor(object):
         entered number" action from the proxy keymap!
 
         At the moment, this mechanism does involve setting non-maskable callbacks
-        in the proxy, though.
+        in the proxy, though. Also, at the moment, the key is ignored altogether
+        in such a case - neither of the callbacks is called.
+
+        This check is done in advance, when building the dispatch table,
+        with ``state`` set to ``None`` - so, the result can't depend on ``state``.
         """
-        current_proxy = self.get_current_proxy()
+        current_proxy = proxy or self.get_current_proxy()
         # Key force-processed globally
         if isinstance(global_cb, Action):
             if getattr(global_cb, "force_global_key_processing", False):
@@ -244,35 +559,32 @@ class InputProcessor(object):
             * Proxy maskable callbacks
             * Streaming callback (if set, just sends the key to it)
 
+        The lookup for all the keymaps except the proxy simple callbacks is done
+        in advance, by ``build_dispatch_table``, and redone only when one of those keymaps
+        changes. Simple callbacks are looked up on each keypress, since UI elements
+        change the dictionary they pass to ``set_keymap`` in-place.
         As soon as a match is found, processes the associated callback and returns.
         """
         if isinstance(data, (tuple, list)) and len(data) == 2:
             key, state = data
-            logger.debug("Received key: {}, state: {}".format(key, state))
         elif isinstance(data, basestring):
             key = data
             state = None
-            logger.debug("Received key: {}".format(key))
         else:
             raise ValueError("Received unsupported object in place of a key/key+state: {}".format(data))
-        # Global and nonmaskable callbacks are supposed to work
-        # even when the screen backlight is off
-        #
-        # First, checking whether the global callbacks apply.
-        if key in self.global_keymap:
-            global_cb = self.global_keymap[key]
-            if not self.global_key_processed_by_proxy(key, state, global_cb):
-                self.handle_callback(global_cb, key, state, type="global")
-            return
-        # Now, all the callbacks are either proxy callbacks or backlight-related
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Received key: {}, state: {}".format(key, state))
         # Saving a reference to current_proxy, in case it changes during the lookup
         current_proxy = self.get_current_proxy()
-        if current_proxy and key in current_proxy.nonmaskable_keymap:
-            callback = current_proxy.nonmaskable_keymap[key]
-            self.handle_callback(callback, key, state, type="nonmaskable", context_name=current_proxy.context_alias)
+        table, default_entry = self.get_dispatch_table(current_proxy)
+        entry = table.get(key)
+        # Global and nonmaskable callbacks are supposed to work
+        # even when the screen backlight is off
+        if entry is not None and entry.before_backlight:
+            self.run_entry(entry, key, state, current_proxy)
             return
-        # Checking backlight state, turning it on if necessary
         if callable(self.backlight_cb):
+            # Checking backlight state, turning it on if necessary
             try:
                 # backlight_cb turns on the backlight as an (expected) side effect
                 backlight_was_off = self.backlight_cb()
@@ -285,51 +597,132 @@ class InputProcessor(object):
         # Now, all the other callbacks of the proxy:
         # Simple callbacks
         if current_proxy and key in current_proxy.keymap:
-            callback = current_proxy.keymap[key]
-            self.handle_callback(callback, key, state, context_name=current_proxy.context_alias)
-        #Maskable callbacks
-        elif current_proxy and key in current_proxy.maskable_keymap:
-            callback = current_proxy.maskable_keymap[key]
-            self.handle_callback(callback, key, state, type="maskable", context_name=current_proxy.context_alias)
-        #Keycode streaming
-        elif current_proxy and callable(current_proxy.streaming):
-            self.handle_callback(current_proxy.streaming, key, state, pass_key=True, type="streaming", context_name=current_proxy.context_alias)
-        else:
-            logger.debug("Key {} has no handlers - ignored!".format(key))
-            pass #No handler for the key
+            entry = self.get_keymap_entry(current_proxy, key)
+        # Maskable callbacks, or keycode streaming
+        elif entry is None:
+            entry = default_entry
+        self.run_entry(entry, key, state, current_proxy)
 
-    def handle_callback(self, callback, key, state, pass_key=False, type="simple", context_name=None):
-        try:
-            if context_name:
-                logger.info("Processing a {} callback for key {} with state {}, context {}".format(type, key, state, context_name))
-            else:
-                logger.info("Processing a {} callback for key {}".format(type, key))
-            logger.debug("pass_key = {}".format(pass_key))
-            logger.debug("callback name: {}".format(callback.__name__))
-            # Checking whether the callback wants key state
-            if isinstance(callback, Action):
-                callback = callback.cb
-            keystate_cb_name = "zpui_icb_pass_key_state"
-            if hasattr(callback, "__func__"):
-                cb_needs_state = getattr(callback.__func__, keystate_cb_name, False)
+    def run_entry(self, entry, key, state, current_proxy):
+        if entry.invoke is None:
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("Key {} has no handlers - ignored!".format(key))
+            return
+        context_name = current_proxy.context_alias if current_proxy and entry.type != "global" else None
+        self.run_callback(entry.invoke, entry.callback, key, state, entry.type, context_name)
+
+    def get_keymap_entry(self, proxy, key):
+        """
+        Returns a dispatch entry for a callback from the proxy's simple keymap,
+        reusing the previously made one if the callback didn't change.
+        """
+        callback = proxy.keymap[key]
+        entry = proxy.keymap_entries.get(key)
+        if entry is None or entry.callback is not callback:
+            entry = self.make_dispatch_entry(callback)
+            proxy.keymap_entries[key] = entry
+        return entry
+
+    def get_dispatch_table(self, proxy):
+        """
+        Returns the dispatch table for a proxy (or for when there's no proxy attached,
+        if ``proxy`` is ``None``), together with the entry for keys that aren't
+        in the table. Rebuilds the table if the proxy's keymaps (except the simple
+        callback keymap) or the global keymap changed since it's been built.
+        """
+        global_version = self.global_keymap_version
+        if proxy is None:
+            cache = self.no_proxy_dispatch
+            if cache is None or cache[0] != global_version:
+                cache = (global_version, ) + self.build_dispatch_table(None)
+                self.no_proxy_dispatch = cache
+            return cache[1], cache[2]
+        # Getting versions before building, so that changes made while building
+        # the table cause it to be rebuilt on the next keypress
+        versions = (proxy.keymap_version, global_version)
+        cache = proxy.dispatch_cache
+        if cache is None or cache[0] != versions:
+            cache = (versions, ) + self.build_dispatch_table(proxy)
+            proxy.dispatch_cache = cache
+        return cache[1], cache[2]
+
+    def build_dispatch_table(self, proxy):
+        """
+        Resolves the global keymap and the proxy's nonmaskable/maskable keymaps into
+        a single ``{key: DispatchEntry}`` dictionary, following the lookup order described
+        in ``process_key``, and picking the calling convention for each callback in advance.
+        Simple callbacks (``proxy.keymap``) are looked up separately, in ``process_key``.
+        Returns the table and the entry to be used for keys that aren't in the table.
+        """
+        table = {}
+        context_name = getattr(proxy, "context_alias", None)
+        logger.debug("Building dispatch table for context {}".format(context_name))
+        if proxy:
+            # Lowest priority first, so that higher priority keymaps override the entries
+            for key, callback in proxy.maskable_keymap.items():
+                table[key] = self.make_dispatch_entry(callback, type="maskable")
+            for key, callback in proxy.nonmaskable_keymap.items():
+                table[key] = self.make_dispatch_entry(callback, type="nonmaskable", before_backlight=True)
+        for key, callback in self.global_keymap.items():
+            if proxy and self.global_key_processed_by_proxy(key, None, callback, proxy=proxy):
+                # Processed by the proxy - for now, not calling anything
+                table[key] = DispatchEntry(None, callback, "global", True)
             else:
-                cb_needs_state = getattr(callback, keystate_cb_name, False)
-            # 4 calling conventions - need to pick the right one
-            if cb_needs_state is True:
-                if pass_key:
-                    callback(key, state)
-                else:
-                    callback(state)
+                table[key] = self.make_dispatch_entry(callback, type="global", before_backlight=True)
+        if proxy and callable(proxy.streaming):
+            default_entry = self.make_dispatch_entry(proxy.streaming, pass_key=True, type="streaming")
+        else:
+            default_entry = DispatchEntry(None, None, None, False)
+        return table, default_entry
+
+    def make_dispatch_entry(self, callback, pass_key=False, type="simple", before_backlight=False):
+        return DispatchEntry(self.get_callback_invoker(callback, pass_key=pass_key), callback, type, before_backlight)
+
+    def get_callback_invoker(self, callback, pass_key=False):
+        """
+        Returns a function accepting (key, state) that calls the callback
+        using the calling convention it expects.
+        """
+        # Checking whether the callback wants key state
+        if isinstance(callback, Action):
+            callback = getattr(callback, "cb", callback)
+        keystate_cb_name = "zpui_icb_pass_key_state"
+        if hasattr(callback, "__func__"):
+            cb_needs_state = getattr(callback.__func__, keystate_cb_name, False)
+        else:
+            cb_needs_state = getattr(callback, keystate_cb_name, False)
+        # 4 calling conventions - need to pick the right one
+        if cb_needs_state is True:
+            if pass_key:
+                return callback
             else:
-                callback_trigger_state = KEY_PRESSED if self.on_press else KEY_RELEASED
-                # We might also get None for a state if an input driver doesn't support states
+                return lambda key, state: callback(state)
+        callback_trigger_state = KEY_PRESSED if self.on_press else KEY_RELEASED
+        # We might also get None for a state if an input driver doesn't support states
+        # Not calling the callback if the key is held or released
+        if pass_key:
+            def invoke(key, state):
+                if state == callback_trigger_state or state is None:
+                    callback(key)
+        else:
+            def invoke(key, state):
                 if state == callback_trigger_state or state is None:
-                    if pass_key:
-                        callback(key)
-                    else:
-                        callback()
+                    callback()
+        return invoke
+
+    def handle_callback(self, callback, key, state, pass_key=False, type="simple", context_name=None):
+        invoke = self.get_callback_invoker(callback, pass_key=pass_key)
+        self.run_callback(invoke, callback, key, state, type, context_name)
+
+    def run_callback(self, invoke, callback, key, state, type, context_name):
+        try:
+            if logger.isEnabledFor(logging.INFO):
+                if context_name:
+                    logger.info("Processing a {} callback for key {} with state {}, context {}".format(type, key, state, context_name))
                 else:
-                    pass # Not calling the callback if the key is held or released
+                    logger.info("Processing a {} callback for key {}".format(type, key))
+                logger.debug("callback name: {}".format(getattr(callback, "__name__", callback)))
+            invoke(key, state)
         except Exception as e:
             locals = inspect.trace()[-1][0].f_locals
             context_alias = getattr(self.get_current_proxy(), "context_alias", None)
@@ -342,7 +735,10 @@ class InputProcessor(object):
 
     def listen(self):
         """Start event_loop in a thread. Nonblocking."""
-        self.processor_thread = Thread(target = self.event_loop, name="InputThread-"+str(self.thread_index), args=(self.thread_index, ))
+        # Creating the stop flag before the thread starts, so that ``stop_listen``
+        # called right after ``listen`` reaches the new event loop
+        self.stop_flag = Event()
+        self.processor_thread = Thread(target = self.event_loop, name="InputThread-"+str(self.thread_index), args=(self.thread_index, self.stop_flag))
         self.thread_index += 1
         self.processor_thread.daemon = True
         self.processor_thread.start()
@@ -353,10 +749,13 @@ class InputProcessor(object):
         finish executing."""
         if self.stop_flag is not None:
             self.stop_flag.set()
+            # The event loop might be waiting for keys - waking it up so that it exits
+            self.queue.wake()
 
     def atexit(self):
         """Exits driver (if necessary) if something wrong happened or ZPUI exits. Also, stops the InputProcessor, and all the associated drivers."""
         self.stop_listen()
+        logger.debug("Input queue stats: {}".format(self.get_queue_stats()))
         for driver in self.drivers.values():
             driver.stop()
             if hasattr(driver, "atexit"):
@@ -385,14 +784,18 @@ class InputProcessor(object):
             setattr(proxy, method_name, lambda x=method_name, y=alias, *a, **k: self.proxy_method(x, y, *a, **k))
 
     def set_proxy_attrs(self, proxy):
-        for attr_name in self.proxy_attrs:
-            setattr(proxy, attr_name, deepcopy(getattr(self, attr_name)))
+        if self.proxy_attr_snapshots is None:
+            self.proxy_attr_snapshots = {attr_name:snapshot(getattr(self, attr_name)) for attr_name in self.proxy_attrs}
+        for attr_name, value in self.proxy_attr_snapshots.items():
+            setattr(proxy, attr_name, value)
 
     def update_all_proxy_attrs(self):
         """
         Updates all the proxied attributes for proxies, to be triggered when
-        one of the attributes is changed.
+        one of the attributes is changed. Proxies all share one read-only
+        snapshot of each attribute, which is only made once per change.
         """
+        self.proxy_attr_snapshots = None
         for proxy in self.proxies:
             self.set_proxy_attrs(proxy)
 
@@ -402,12 +805,56 @@ class InputProxy(object):
     deprecated_keys = ["KEY_PAGEUP", "KEY_PAGEDOWN"]
 
     def __init__(self, context_alias):
+        # Incremented each time a keymap changes, so that InputProcessor knows
+        # when to rebuild the dispatch table it caches in ``dispatch_cache``
+        self.keymap_version = 0
+        self.dispatch_cache = None
+        # Dispatch entries for simple callbacks, reused while the callback for a key stays the same
+        self.keymap_entries = {}
         self.keymap = {}
         self.streaming = None
         self.maskable_keymap = {}
         self.nonmaskable_keymap = {}
         self.context_alias = context_alias
 
+    def keymap_changed(self):
+        """
+        Invalidates the dispatch table built from this proxy's nonmaskable/maskable
+        keymaps and the streaming callback. Called automatically when those change.
+        """
+        self.keymap_version += 1
+
+    @property
+    def maskable_keymap(self):
+        return self._maskable_keymap
+
+    @maskable_keymap.setter
+    def maskable_keymap(self, keymap):
+        if not isinstance(keymap, Keymap):
+            keymap = Keymap(keymap, on_change=self.keymap_changed)
+        self._maskable_keymap = keymap
+        self.keymap_changed()
+
+    @property
+    def nonmaskable_keymap(self):
+        return self._nonmaskable_keymap
+
+    @nonmaskable_keymap.setter
+    def nonmaskable_keymap(self, keymap):
+        if not isinstance(keymap, Keymap):
+            keymap = Keymap(keymap, on_change=self.keymap_changed)
+        self._nonmaskable_keymap = keymap
+        self.keymap_changed()
+
+    @property
+    def streaming(self):
+        return self._streaming
+
+    @streaming.setter
+    def streaming(self, callback):
+        self._streaming = callback
+        self.keymap_changed()
+
     def set_streaming(self, callback):
         """
         Sets a callback for streaming key events. This callback will be called
@@ -547,7 +994,11 @@ class InputProxy(object):
 def init(driver_configs, context_manager, **ip_kwargs):
     """ This function is called by main.py to read the input configuration,
     pick the corresponding drivers and initialize InputProcessor. Returns
-    the InputProcessor instance created.`"""
+    the InputProcessor instance created.
+
+    ``ip_kwargs`` are passed to the ``InputProcessor`` - ``on_press`` (whether
+    callbacks are triggered on press or on release) and ``queue_policy``
+    (a dictionary with ``InputQueue`` coalescing/backpressure options).`"""
     # allow providing a dict instead of a list if there's only one driver
     driver_configs = deepcopy(driver_configs)
     if not isinstance(driver_configs, list):
@@ -557,7 +1008,8 @@ def init(driver_configs, context_manager, **ip_kwargs):
         if isinstance(driver_config, str):
             driver_config = {"driver":driver_config}
         driver_name = driver_config["driver"]
-        driver_module = importlib.import_module("input.drivers."+driver_name)
+        with profiler.span("import input.drivers."+driver_name):
+            driver_module = importlib.import_module("input.drivers."+driver_name)
         args = driver_config.get("args", [])
         if "kwargs" not in driver_config:
             # a shortening letting us avoid building yaml or json staircases with magic words
@@ -566,7 +1018,8 @@ def init(driver_configs, context_manager, **ip_kwargs):
             # that's our kwargs now
         else:
             kwargs = driver_config["kwargs"]
-        driver = driver_module.InputDevice(*args, **kwargs)
+        with profiler.span("init input driver "+driver_name):
+            driver = driver_module.InputDevice(*args, **kwargs)
         drivers.append(driver)
     i = InputProcessor(drivers, context_manager, **ip_kwargs)
     dm = DeviceManager(i)
@@ -10,6 +10,9 @@ import threading
 import traceback
 from copy import deepcopy
 from logging.handlers import RotatingFileHandler
+from time import monotonic
+# for --profile-startup, ZPUI imports take a noticeable part of the startup time
+import_start = monotonic()
 
 from zpui_lib.helpers import read_config, local_path_gen, logger, env, read_or_create_config, \
                     zpui_running_as_service, is_emulator, pidcheck
@@ -25,6 +28,7 @@ from context_manager import ContextManager
 from input import input
 from output import output
 import hw_combos
+from startup_profiler import profiler
 
 rconsole_port = 9377
 
@@ -115,7 +119,8 @@ def init():
     """Initialize input and output objects"""
 
     if not getattr(zpui, "config", None):
-        zpui.config, zpui.config_path = load_config()
+        with profiler.span("load_config"):
+            zpui.config, zpui.config_path = load_config()
     else:
         zpui.config_path = "pre-supplied"
     logging.info("Loaded config: {}".format(zpui.config))
@@ -133,19 +138,27 @@ def init():
 
     # input subsystem can receive kwargs just like the app manager. their names are hardcoded ofc
     # for now it's just one, but now it's easy to add more :3
+    # (the other one, queue_policy, comes from the top-level input_queue section, see below)
     input_kwargs = {}
     for name in ["on_press"]:
         if name in zpui.config.get("input", {}):
             input_kwargs[name] = zpui.config["input"][name]
             zpui.config["input"].pop(name)
     # Get hardware manager
-    zpui.input_config, zpui.output_config, zpui.device = hw_combos.get_io_configs(zpui.config)
+    with profiler.span("get_io_configs"):
+        zpui.input_config, zpui.output_config, zpui.device = hw_combos.get_io_configs(zpui.config)
     if zpui.device != None:
         add_platform_device(zpui.device)
+    # input queue coalescing/backpressure settings (see InputQueue in input/input.py),
+    # can be set by the device config in hw_combos
+    if "input_queue" in zpui.config:
+        input_kwargs["queue_policy"] = zpui.config["input_queue"]
 
     # Initialize output
     try:
-        zpui.screen = output.init(zpui.output_config)
+        # max_fps moves screen writes into a separate thread, see RenderThread in output/output.py
+        with profiler.span("output.init"):
+            zpui.screen = output.init(zpui.output_config, max_fps=zpui.config.get("max_fps", None))
         zpui.screen.default_font = canvas.get_default_font()
         if "color" in zpui.screen.type: # screen can do color output - let's see if there's a color in config
             # either of the two parameters are possible - ui-color or ui_color; both are the same thing obvi
@@ -171,7 +184,8 @@ def init():
     # Initialize input
     try:
         # Now we can show errors on the display
-        zpui.input_processor, zpui.input_device_manager = input.init(zpui.input_config, zpui.cm, **input_kwargs)
+        with profiler.span("input.init"):
+            zpui.input_processor, zpui.input_device_manager = input.init(zpui.input_config, zpui.cm, **input_kwargs)
     except:
         logging.exception('Failed to initialize the input object')
         logging.exception(traceback.format_exc())
@@ -187,7 +201,8 @@ def init():
                 # tying the screen's reattach callback into the input device
                 driver.reattach_cbs.append(zpui.screen.reattach_callback)
                 logging.info("attached screen reattach callback to driver {}".format(dname))
-    zpui.cm.init_io(zpui.input_processor, zpui.screen)
+    with profiler.span("init_io"):
+        zpui.cm.init_io(zpui.input_processor, zpui.screen)
     # ZeroMenu hook
     c = zpui.cm.contexts["main"]
     c.register_action(ContextSwitchAction("switch_main_menu", None, menu_name="Main menu"))
@@ -198,26 +213,35 @@ def init():
     return i, o
 
 
-def launch(name=None, all=False, **kwargs):
+def launch(name=None, all=False, profile_startup=None, **kwargs):
     """
     Launches ZPUI, either in full mode or in
     single-app mode (if ``name`` kwarg is passed).
+    If ``profile_startup`` is a path, a startup timeline
+    is saved there once ZPUI is ready, see ``startup_profiler.py``.
     """
 
-    i, o = init()
+    if profile_startup:
+        profiler.enable(import_start)
+        profiler.add_span("imports", import_start, monotonic())
+    with profiler.span("init"):
+        i, o = init()
     zpui.appman_config = zpui.config.get("app_manager", {})
     zpui.app_man = AppManager('apps', zpui.cm, zpui, config=zpui.appman_config)
 
     if name is None:
         try:
             from splash import splash
-            splash(i, o, color=canvas.global_default_color)
+            with profiler.span("splash"):
+                splash(i, o, color=canvas.global_default_color)
         except:
             logging.exception('Failed to load the splash screen')
 
         # Load all apps
-        zpui.app_menu = zpui.app_man.load_all_apps()
-        zpui.app_man.after_load()
+        with profiler.span("load_all_apps"):
+            zpui.app_menu = zpui.app_man.load_all_apps()
+        with profiler.span("after_load"):
+            zpui.app_man.after_load()
         runner = zpui.app_menu.activate
         if "switch_to" in zpui.config:
             start_context = zpui.config.get("switch_to", "main")
@@ -234,11 +258,14 @@ def launch(name=None, all=False, **kwargs):
         name = name.rstrip('/')
         # did the user ask to load all apps?
         if all:
-            zpui.app_menu = zpui.app_man.load_all_apps()
-            zpui.app_man.after_load()
+            with profiler.span("load_all_apps"):
+                zpui.app_menu = zpui.app_man.load_all_apps()
+            with profiler.span("after_load"):
+                zpui.app_man.after_load()
         # Now, load and switch to the single app that's been summoned
         try:
-            context_name, app = zpui.app_man.load_single_app_by_path(name, threaded=False)
+            with profiler.span("load_single_app", app=name):
+                context_name, app = zpui.app_man.load_single_app_by_path(name, threaded=False)
         except:
             logging.exception('Failed to load the app: {0}'.format(name))
             zpui.input_processor.atexit()
@@ -246,6 +273,8 @@ def launch(name=None, all=False, **kwargs):
         zpui.cm.switch_to_context(context_name)
         runner = app.on_start if hasattr(app, "on_start") else app.callback
 
+    if profile_startup:
+        profiler.finish(profile_startup)
     exception_wrapper(runner)
 
 
@@ -283,6 +312,10 @@ def dump_threads(*args):
     logging.critical('\nSIGUSR received, dumping threads!\n')
     for i, th in enumerate(threading.enumerate()):
         logging.critical("{} - {}".format(i, th))
+    if hasattr(zpui, "input_processor"):
+        logging.critical("Input queue stats: {}".format(zpui.input_processor.get_queue_stats()))
+    if getattr(getattr(zpui, "screen", None), "render_thread", None):
+        logging.critical("Render thread stats: {}".format(zpui.screen.render_thread.get_stats()))
     for th in threading.enumerate():
         try:
             logging.critical(th)
@@ -400,6 +433,13 @@ if __name__ == '__main__':
         '--ignore-pid',
         help='Skips PID check on startup (not applicable for emulator as it doesn\'t do PID check)',
         action='store_true')
+    parser.add_argument(
+        '--profile-startup',
+        help='Saves a startup timeline (Chrome trace format) to the given path, logs a summary',
+        nargs='?',
+        const=os.path.join(logging_dir, "startup_trace.json"),
+        metavar='PATH',
+        default=None)
     args = parser.parse_args()
 
     # Setup logging
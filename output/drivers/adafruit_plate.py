@@ -51,6 +51,8 @@ class Screen(HD44780, BacklightManager, OutputDevice):
         
     def i2c_init(self):
         """Inits the MCP23017 expander."""
+        # IOCON: SEQOP set, so that block writes to GPIOB don't move on to the next register
+        self.setMCPreg(0x0a, 0x20)
         self.setMCPreg(0x00, 0x00)
         self.setMCPreg(0x01, 0x00)
 
@@ -78,8 +80,18 @@ class Screen(HD44780, BacklightManager, OutputDevice):
         else:
             self.setMCPreg(0x15, 0x01)
 
-    def write4bits(self, data, char_mode=False):
-        """Writes a nibble to the display. If ``char_mode`` is set, holds the RS line high."""
+    @activate_backlight_wrapper
+    def write_chars(self, data):
+        """Writes a list of bytes to the display RAM, sending all the nibble strobes to GPIOB in block writes."""
+        values = []
+        for byte in data:
+            for nibble in (byte >> 4 & 0x0F, byte & 0x0F):
+                value = self.get_port_value(nibble, True)
+                values += [value, value ^ 0x20, value]
+        for i in range(0, len(values), 32):
+            self.bus.write_i2c_block_data(self.addr, 0x15, values[i:i+32])
+
+    def get_port_value(self, data, char_mode=False):
         data = int('{:04b}'.format(data)[::-1], 2) #Reversing data since on Adafruit shields DB7=GP1, DB6=GP2 and so on
         data = data << 1 #Need to also shift it to one bit
         if char_mode:
@@ -87,6 +99,11 @@ class Screen(HD44780, BacklightManager, OutputDevice):
         if self.chinese or not self._backlight_enabled:
                 data |= 0x01 #Chinese boards have a blue LED instead of Adafruit backlight pin, this turns blue LED off =)
                 #Adafruit boards have blue backlight at GP0, and we set the bit to turn the backlight off
+        return data
+
+    def write4bits(self, data, char_mode=False):
+        """Writes a nibble to the display. If ``char_mode`` is set, holds the RS line high."""
+        data = self.get_port_value(data, char_mode)
         self.setMCPreg(0x15, data)
         data ^= 0x20
         self.setMCPreg(0x15, data)
@@ -1,27 +1,26 @@
-from threading import Thread, Event
-from time import sleep
-from datetime import datetime
+from threading import Thread, Lock
+from time import sleep, monotonic
 
 def activate_backlight_wrapper(func):
     def wrapper(display, *args, **kwargs):
-        if "backlight_only_on_new" in kwargs:
-           b = kwargs.pop("backlight_only_on_new")
-           if b:
-               if not hasattr(display, "trigger_backlight_on_change"):
-                   print("Backlight only on change requested but display driver doesn't have a change check hook!")
-               elif not display.trigger_backlight_on_change(display, func.__name__, *args, **kwargs):
-                   # No need to re-trigger backlight at the moment, return
-                   # if the image keeps being the same, it will just timeout
-                   # Also, assuming that trigger_backlight_on_change implies
-                   # the display state actually won't be changed by this call
-                   # if it were to be executed => we don't need to update
-                   # current_image and so on
-                   return
+        if kwargs.pop("backlight_only_on_new", None):
+            if not hasattr(display, "get_fingerprint"):
+                print("Backlight only on change requested but display driver doesn't have a change check hook!")
+            else:
+                fingerprint = display.get_fingerprint(func.__name__, *args)
+                if fingerprint is not None and fingerprint == display.current_fingerprint:
+                    # No need to re-trigger backlight at the moment, return
+                    # if the image keeps being the same, it will just timeout
+                    # Also, the display state won't be changed by this call
+                    # if it were to be executed => we don't need to update
+                    # current_image and so on
+                    return
+                # so that the driver doesn't have to calculate it again
+                kwargs["fingerprint"] = fingerprint
         display.enable_backlight()
-        display._backlight_active.set()
         result = func(display, *args, **kwargs)
-        if display._backlight_interval and display._bl_thread is None:
-            display.start_backlight_thread()
+        if display._backlight_interval:
+            display.postpone_backlight_timeout()
         return result
     return wrapper
 
@@ -52,9 +51,9 @@ def disable_backlight_wrapper(func):
     return wrapper
 
 class BacklightManager(object):
-    _last_active = datetime.now()
     _backlight_enabled = False
-    _backlight_active = Event()
+    _backlight_deadline = 0
+    _bl_thread = None
 
     def init_backlight(self, backlight_active_level=True, backlight_pin = None, backlight_interval = 10, **kwargs):
         self._backlight_active_level = backlight_active_level
@@ -66,8 +65,9 @@ class BacklightManager(object):
             self._bl_gpio.setwarnings(False)
             self._bl_gpio.setup(self._backlight_pin, self._bl_gpio.OUT)
         self._backlight_interval = backlight_interval
+        self._bl_lock = Lock()
         if self._backlight_interval:
-            self.start_backlight_thread()
+            self.postpone_backlight_timeout()
 
     def set_backlight_callback(self, obj):
         obj.backlight_cb = self.activate_backlight
@@ -88,6 +88,14 @@ class BacklightManager(object):
         if self._backlight_pin:
             self._bl_gpio.output(self._backlight_pin, not self._backlight_active_level)
 
+    def postpone_backlight_timeout(self):
+        """Moves the backlight timeout to ``backlight_interval`` seconds from now,
+        starting the backlight thread if it isn't running."""
+        with self._bl_lock:
+            self._backlight_deadline = monotonic() + self._backlight_interval
+            if self._bl_thread is None:
+                self.start_backlight_thread()
+
     def start_backlight_thread(self):
         self._bl_thread = Thread(target=self.backlight_manager, name="Screen backlight manager thread")
         self._bl_thread.daemon = True
@@ -95,11 +103,14 @@ class BacklightManager(object):
 
     def backlight_manager(self):
         while True:
-            if self._backlight_active.is_set():
-                self._backlight_active.clear()
-                self._last_active = datetime.now()
-            elif (datetime.now() - self._last_active).total_seconds() >self._backlight_interval and self._backlight_enabled:
-                self.disable_backlight()
-                self._bl_thread = None
-                return
-            sleep(float(self._backlight_interval)/2) #Doesn't need to be done much often unless you need your backlight to be super precise. /2 is minimum though. 1 cycle to clear the flag and 1 cycle to disable backlight
+            # activity only ever moves the deadline further, so we can just
+            # sleep until the deadline we know of, then check if it has moved
+            with self._bl_lock:
+                delay = self._backlight_deadline - monotonic()
+                if delay <= 0:
+                    # holding the lock so that activity can't sneak in between these two
+                    if self._backlight_enabled:
+                        self.disable_backlight()
+                    self._bl_thread = None
+                    return
+            sleep(delay)
@@ -45,6 +45,8 @@ class Screen(GraphicalOutputDevice, CharacterOutputDevice):
 
     direct_write = False
     paste_coords = (0, 0)
+    # reused between frames
+    buffer = None
 
     def __init__(self, fb_num=1, width=None, height=None, color=True, default_color="white", mul_x=1, mul_y=1, direct_write=False, out_mode="RGBA", disable_cursor=True, **kwargs):
         self.fb_num = fb_num
@@ -135,12 +137,9 @@ class Screen(GraphicalOutputDevice, CharacterOutputDevice):
     def _display_image(self, image):
         try:
             if not self.direct_write:
-                if self.out_mode: # buffer mode overridden
-                    buffer = Image.new(mode=self.out_mode, size=self.fb.size)
-                else: # using the same mode that ZPUI uses for displaying to this screen
-                    buffer = Image.new(mode=self.device_mode, size=self.fb.size)
                 if self.multiply_x > 1 or self.multiply_y > 1:
                     image = image.resize((self.width*self.multiply_x, self.height*self.multiply_y), Image.Resampling.NEAREST)
+                buffer = self.get_buffer(image)
                 buffer.paste(image, box=self.paste_coords)
                 self.fb.show(buffer)
             else:
@@ -156,6 +155,22 @@ class Screen(GraphicalOutputDevice, CharacterOutputDevice):
             logger.exception("Couldn't write to the display, fb {}".format(self.fb_num))
             traceback.print_exception()
 
+    def get_buffer(self, image):
+        """
+        Returns an image to paste the frame onto before sending it to the framebuffer,
+        reusing the one from the previous frame. It's only cleared if the frame won't
+        cover all of it.
+        """
+        # buffer mode can be overridden, otherwise using the same mode that ZPUI uses for displaying to this screen
+        mode = self.out_mode if self.out_mode else self.device_mode
+        if self.buffer is None or self.buffer.mode != mode:
+            self.buffer = Image.new(mode=mode, size=self.fb.size)
+        else:
+            x, y = self.paste_coords
+            if x > 0 or y > 0 or image.size[0] + x < self.fb.size[0] or image.size[1] + y < self.fb.size[1]:
+                self.buffer.paste(0, box=(0, 0) + self.fb.size)
+        return self.buffer
+
     def display_data_onto_image(self, *args, **kwargs):
         """
         This method takes lines of text and draws them onto an image,
@@ -170,7 +185,7 @@ class Screen(GraphicalOutputDevice, CharacterOutputDevice):
         font, font_size = get_default_font() if getattr(self, "default_font", None) else (self.default_font, (self.char_height, self.char_width))
         char_height, char_width = font_size
         lines_to_image(d, args, font, char_height, char_width, self.default_color, \
-                       self.cursor_pos, cursor_position)
+                       self.cursor_pos, cursor_position, image=draw.image)
         return draw.image
 
     #@activate_backlight_wrapper
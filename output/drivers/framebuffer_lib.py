@@ -12,6 +12,8 @@ bits_per_pixel    assumed memory layout
 
 """
 
+import mmap
+
 from PIL import Image
 import numpy
 
@@ -30,51 +32,60 @@ def _read_str(filename):
         return content
 
 
+# Converters take a PIL image and return a numpy array in the framebuffer's
+# memory layout, which Framebuffer.show() then views as rows of bytes.
+
+def _mono_pixels(image: Image):
+    # mode "1" images come out as booleans
+    return numpy.asarray(image, dtype=numpy.uint8) * numpy.uint8(255)
+
+
+def _pack_rgb565(r, g, b):
+    # the framebuffer expects little endian 16-bit pixels
+    pixels = ((r & 0xf8).astype(numpy.uint16) << 8) | ((g & 0xfc).astype(numpy.uint16) << 3) | (b >> 3)
+    return pixels.astype("<u2")
+
+
 def _converter_argb(image: Image):
-    return bytes([x for r, g, b in image.getdata() for x in (255, r, g, b)])
+    pixels = numpy.asarray(image)
+    out = numpy.empty(pixels.shape[:2] + (4,), dtype=numpy.uint8)
+    out[..., 0] = 255
+    out[..., 1:] = pixels[..., :3]
+    return out
 
 
 def _converter_rgb565(image: Image):
-    return bytes([x for r, g, b in image.getdata()
-                  for x in ((g & 0x1c) << 3 | (b >> 3), r & 0xf8 | (g >> 3))])
+    # works for both RGB and RGBA, alpha is dropped
+    pixels = numpy.asarray(image)
+    return _pack_rgb565(pixels[..., 0], pixels[..., 1], pixels[..., 2])
 
 
 def _converter_1_argb(image: Image):
-    return bytes([x for p in image.getdata()
-                  for x in (255, p, p, p)])
+    pixels = _mono_pixels(image)
+    out = numpy.empty(pixels.shape + (4,), dtype=numpy.uint8)
+    out[..., 0] = 255
+    out[..., 1:] = pixels[..., None]
+    return out
 
 
 def _converter_1_rgb(image: Image):
-    return bytes([x for p in image.getdata()
-                  for x in (p, p, p)])
+    return numpy.repeat(_mono_pixels(image)[..., None], 3, axis=2)
 
 
 def _converter_1_rgb565(image: Image):
-    return bytes([(255 if x else 0) for p in image.getdata()
-                  for x in (p, p)])
-
-
-def _converter_rgba_rgb565_numpy(image: Image):
-    flat = numpy.frombuffer(image.tobytes(), dtype=numpy.uint32)
-    # note,  this is assumes little endian byteorder and results in
-    # the following packing of an integer:
-    # bits 0-7: red, 8-15: green, 16-23: blue, 24-31: alpha
-    flat = ((flat & 0xf8) << 8) | ((flat & 0xfc00) >> 5) | ((flat & 0xf80000) >> 19)
-    return flat.astype(numpy.uint16).tobytes()
+    return numpy.where(numpy.asarray(image), 0xffff, 0).astype("<u2")
 
 
 def _converter_no_change(image: Image):
-    return image.tobytes()
+    return numpy.asarray(image)
+
 
-# anything that does not use numpy is hopelessly slow
 _CONVERTER = {
-    ("RGBA", 16): _converter_rgba_rgb565_numpy,
+    ("RGBA", 16): _converter_rgb565,
     ("RGB", 16): _converter_rgb565,
     ("RGB", 24): _converter_no_change,
     ("RGB", 32): _converter_argb,
     ("RGBA", 32): _converter_no_change,
-    # note numpy does not work well with mode="1" images as
-    # image.tobytes() loses pixel color info
     ("1", 16): _converter_1_rgb565,
     ("1", 24): _converter_1_rgb,
     ("1", 32): _converter_1_argb,
@@ -93,18 +104,45 @@ class Framebuffer(object):
             config_dir + "/bits_per_pixel")[0]
         self.name = _read_str(config_dir+"/name")
         assert self.stride == self.bits_per_pixel // 8 * self.size[0]
+        # framebuffer memory as a (height, stride) array of bytes
+        self.pixels = None
+        self.map()
+
+    def map(self):
+        """Maps the framebuffer into memory. If that fails, show() falls back
+        to writing whole frames into the device file."""
+        try:
+            with open(self.path, "r+b") as fp:
+                self.mmap = mmap.mmap(fp.fileno(), self.stride * self.size[1])
+        except (OSError, ValueError):
+            self.mmap = None
+            self.pixels = None
+        else:
+            self.pixels = numpy.frombuffer(self.mmap, dtype=numpy.uint8).reshape(self.size[1], self.stride)
 
     def __str__(self):
         args = (self.path, self.size, self.stride, self.bits_per_pixel)
         return "%s  size:%s  stride:%s  bits_per_pixel:%s" % args
 
-    # Note: performance is terrible even for medium resolutions
-    def show(self, image: Image):
+    def convert(self, image: Image):
+        """Returns the image converted to a (height, stride) array of bytes."""
         converter = _CONVERTER[(image.mode, self.bits_per_pixel)]
         assert image.size == self.size
-        out = converter(image)
-        with open(self.path, "wb") as fp:
-            fp.write(out)
+        return numpy.frombuffer(converter(image), dtype=numpy.uint8).reshape(self.size[1], self.stride)
+
+    def show(self, image: Image):
+        frame = self.convert(image)
+        if self.pixels is None:
+            with open(self.path, "wb") as fp:
+                fp.write(frame)
+            return
+        # only touching the rows that changed - comparing against the framebuffer
+        # itself, so that whatever else draws on it gets painted over, too
+        changed = numpy.flatnonzero((frame != self.pixels).any(axis=1))
+        if len(changed) == len(frame):
+            self.pixels[:] = frame
+        elif len(changed):
+            self.pixels[changed] = frame[changed]
 
     def on(self):
         pass
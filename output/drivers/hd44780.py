@@ -71,6 +71,7 @@ class HD44780(object):
 
     busy_flag = False
     buffer = " "
+    cgram = None # contents of custom characters, so that they're not re-sent needlessly
 
     redraw_coefficient = 0.5
     type = ["char"] #Variable for future compatibility with graphical displays
@@ -90,6 +91,7 @@ class HD44780(object):
         self.buffering = buffering
         if self.buffering: #Init the buffer
             self.buffer = [" "*self.cols for i in range(self.rows)]
+        self.cgram = {}
         if do_init:
             self.init_display(**kwargs)
 
@@ -100,6 +102,7 @@ class HD44780(object):
         
         * ``autoscroll``: Controls whether autoscroll-on-char-print is enabled upon initialization. 
         """
+        self.cgram = {}
         self.write_byte(0x30)  # initialization
         delay(20)
         self.write_byte(0x30)  # initialization
@@ -117,7 +120,7 @@ class HD44780(object):
         self.display()
 
     def display_data(self, *args):
-        """Displays data on display. This function checks if the display contents can be redrawn faster by buffering them and checking the output, then either changes characters one-by-one or redraws the screen completely.
+        """Displays data on display. This function checks if the display contents can be redrawn faster by buffering them and checking the output, then either rewrites the changed parts of each row or redraws the screen completely.
         
         ``*args`` is a list of strings, where each string corresponds to a row of the display, starting with 0."""
         #Formatting the args list to simplify the processing
@@ -127,21 +130,31 @@ class HD44780(object):
         if len(args) < self.rows: #Pad with empty strings if it's not yet padded
             for i in range(self.rows-len(args)): 
                 args.append(" "*self.cols)
-        diffs = [[] for i in range(self.rows)]
-        for i, string in enumerate(args):
-            for j, char in enumerate(string):
-                if self.buffer[i][j] != char:
-                    diffs[i].append(j)
-        if float(sum([len(diff) for diff in diffs]))/(self.rows*self.cols) > self.redraw_coefficient:
+        diffs = [self.get_changed_spans(self.buffer[i], string) for i, string in enumerate(args)]
+        changed = sum([end-start for row_diffs in diffs for start, end in row_diffs])
+        if float(changed)/(self.rows*self.cols) > self.redraw_coefficient:
             self._display_data(*args) #Redrawing the display
             self.buffer = args
         else:
             for row_num, row_diffs in enumerate(diffs):
-                for i, char_cpos in enumerate(row_diffs):
-                    self.setCursor(row_num, char_cpos)
-                    self.write_byte(ord(args[row_num][char_cpos]), char_mode=True)
+                for start, end in row_diffs:
+                    # setting DDRAM address once per span, it auto-increments as we write
+                    self.setCursor(row_num, start)
+                    self.write_chars([ord(char) for char in args[row_num][start:end]])
             self.buffer = args
 
+    def get_changed_spans(self, old, new):
+        """Returns a list of ``[start, end)`` spans where two rows differ. Spans separated by a single
+        unchanged character are merged, since rewriting it costs as much as moving the cursor past it."""
+        spans = []
+        for i, (old_char, new_char) in enumerate(zip(old, new)):
+            if old_char != new_char:
+                if spans and i - spans[-1][1] <= 1:
+                    spans[-1][1] = i + 1
+                else:
+                    spans.append([i, i + 1])
+        return spans
+
     def _display_data(self, *args):
         """Displays data on display. This function does the actual work of printing things to display.
         
@@ -158,8 +171,13 @@ class HD44780(object):
 
     def println(self, line):
         """Prints a line on the screen (assumes position is set as intended)"""
-        for char in line:
-            self.write_byte(ord(char), char_mode=True)     
+        self.write_chars([ord(char) for char in line])
+
+    def write_chars(self, data):
+        """Writes a list of bytes to the display RAM, starting from the current address.
+        Drivers that can send multiple bytes in one bus transaction override this."""
+        for byte in data:
+            self.write_byte(byte, char_mode=True)
 
     def home(self):
         """Returns cursor to home position. If the display is being scrolled, reverts scrolled data to initial position.."""
@@ -181,14 +199,18 @@ class HD44780(object):
         char_contents is a list of 8 bytes (only 5 LSBs are used)"""
         if type(char_num) != int or not char_num in range(8):
             raise ValueError("Invalid char_num!")
+        if len(char_contents) < 8:
+            raise ValueError("Invalid char_contents!")
+        char_contents = tuple(char_contents[:8])
+        if self.cgram is not None and self.cgram.get(char_num) == char_contents:
+            return # already there
         self.write_byte(self.LCD_SETCGRAMADDR | (char_num << 3))
         try:
-            for i in range(8):
-                self.write_byte(char_contents[i], char_mode=True)
-        except IndexError:
-            raise ValueError("Invalid char_contents!")
+            self.write_chars(char_contents)
         finally:
             self.setCursor(0, 0)
+        if self.cgram is not None:
+            self.cgram[char_num] = char_contents
 
     def noDisplay(self):
         """ Turn the display off (quickly) """
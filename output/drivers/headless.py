@@ -0,0 +1,70 @@
+#!/usr/bin/python
+
+"""
+Headless output driver - behaves like a 128x64 (or any other size) screen,
+but only keeps the frames it receives, in a ring buffer and, optionally,
+as PNG files in a folder. Useful for running ZPUI without a display,
+i.e. for benchmarks (see ``benchmarks/headless_app.py``) and load tests.
+"""
+
+import os
+from collections import deque
+from threading import Event
+from time import monotonic
+
+from luma.core.device import dummy
+
+from output.output import OutputDevice
+from output.drivers.luma_driver import LumaScreen
+
+
+class Screen(LumaScreen, OutputDevice):
+    """An object that provides high-level functions for interaction with display. It contains all the high-level logic and exposes an interface for system and applications to use."""
+
+    default_mode = "1"
+    default_buffer_size = 64
+
+    def __init__(self, hw="dummy", mode=None, buffer_size=None, record_dir=None, **kwargs):
+        self.mode = mode if mode else self.default_mode
+        self.frames = deque(maxlen=buffer_size if buffer_size else self.default_buffer_size)
+        # timestamps are cheap, so there's more of them than frames
+        self.frame_times = deque(maxlen=10000)
+        self.frame_count = 0
+        self.skipped_frame_count = 0
+        self.bytes_rendered = 0
+        self.new_frame = Event()
+        self.record_dir = record_dir
+        if self.record_dir:
+            os.makedirs(self.record_dir, exist_ok=True)
+        # there's no panel to protect from burn-in
+        kwargs.setdefault("clear_on_bl_off", False)
+        LumaScreen.__init__(self, hw=hw, **kwargs)
+
+    def init_display(self, **kwargs):
+        """Creates a dummy luma.core device, which keeps the last image it's shown. """
+        self.device = dummy(width=self.width, height=self.height, mode=self.mode)
+        self.device.real = True
+
+    def _display_image(self, image, fingerprint=None):
+        if fingerprint is not None and fingerprint == self.panel_fingerprint:
+            # a real panel wouldn't get this frame
+            self.skipped_frame_count += 1
+            return
+        self.panel_fingerprint = fingerprint
+        self.device.display(image)
+        self.record_frame(image)
+
+    def record_frame(self, image):
+        timestamp = monotonic()
+        self.frames.append((timestamp, image))
+        self.frame_times.append(timestamp)
+        self.frame_count += 1
+        self.bytes_rendered += len(image.tobytes())
+        if self.record_dir:
+            image.save(os.path.join(self.record_dir, "{:06d}.png".format(self.frame_count)))
+        self.new_frame.set()
+
+    def get_stats(self):
+        """Returns the frame counters, for benchmarks and such."""
+        return {"frames":self.frame_count, "skipped_frames":self.skipped_frame_count,
+                "bytes_rendered":self.bytes_rendered}
@@ -12,16 +12,25 @@ except ImportError:
     from luma.core.serial import spi, i2c
 from luma.core.render import canvas
 from luma.core.error import DeviceNotFoundError as DNFError
-from PIL import ImageChops
+from PIL import Image, ImageChops
 
 from zpui_lib.helpers import setup_logger
 logger = setup_logger(__name__, "info")
 
 from output.drivers.backlight import *
 try:
-    from ..output import GraphicalOutputDevice, CharacterOutputDevice, get_default_font, lines_to_image
+    from ..output import GraphicalOutputDevice, CharacterOutputDevice, get_default_font, lines_to_image, frame_fingerprint
 except ModuleNotFoundError:
-    from output import GraphicalOutputDevice, CharacterOutputDevice, get_default_font, lines_to_image
+    from output import GraphicalOutputDevice, CharacterOutputDevice, get_default_font, lines_to_image, frame_fingerprint
+
+
+def get_page_data(image, x0, x1, page):
+    """
+    Packs columns ``x0:x1`` of an 8-pixel-high page of a mode "1" image into bytes,
+    one byte per column with the topmost pixel in the LSB - the GDDRAM layout
+    that SSD1306/SH1106-class controllers use.
+    """
+    return image.crop((x0, page*8, x1, page*8+8)).transpose(Image.ROTATE_270).tobytes()
 
 
 class LumaScreen(GraphicalOutputDevice, CharacterOutputDevice, BacklightManager):
@@ -30,7 +39,13 @@ class LumaScreen(GraphicalOutputDevice, CharacterOutputDevice, BacklightManager)
     #buffer = " "
     #redraw_coefficient = 0.5
     current_image = None
+    current_fingerprint = None
     clear_image = None
+    # last frame sent to the panel, after device.preprocess()
+    panel_image = None
+    panel_fingerprint = None
+    # only used by drivers that implement write_region()
+    partial_updates = True
 
     default_font = None
 
@@ -108,6 +123,7 @@ class LumaScreen(GraphicalOutputDevice, CharacterOutputDevice, BacklightManager)
         if self.device_mode.lower().startswith("rgb"):
             if "color" not in self.type:
                 self.type.append("color")
+        self.partial_updates = kwargs.get("partial_updates", self.partial_updates)
         self.clear_on_bl_off = kwargs.get("clear_on_bl_off", True) # anti-ghosting feature
         if self.clear_on_bl_off:
             draw = canvas(self.device)
@@ -134,13 +150,25 @@ class LumaScreen(GraphicalOutputDevice, CharacterOutputDevice, BacklightManager)
                 logger.warning("couldn't write to the display")
 
     @activate_backlight_wrapper
-    def display_image(self, image):
+    def display_image(self, image, fingerprint=None):
         """Displays a PIL Image object onto the display
         Also saves it for the case where display needs to be refreshed"""
         if self.suspended: return
+        if fingerprint is None:
+            fingerprint = self.get_fingerprint("display_image", image)
         with self.busy_flag:
             self.current_image = image
-            self._display_image(image)
+            self.current_fingerprint = fingerprint
+            self._display_image(image, fingerprint)
+
+    def shows_image(self, image):
+        """
+        The image is on the panel if it's the last one displayed and nothing else
+        (say, a cleared screen because the backlight went off) has been sent since.
+        """
+        return image is not None and image is self.current_image and not self.suspended \
+               and self._backlight_enabled and self.current_fingerprint is not None \
+               and self.panel_fingerprint == self.current_fingerprint
 
     def suspend(self):
         logger.info("Suspended display {}".format(self))
@@ -150,29 +178,75 @@ class LumaScreen(GraphicalOutputDevice, CharacterOutputDevice, BacklightManager)
         logger.info("Unsuspended display {}".format(self))
         self.suspended = False
 
-    def trigger_backlight_on_change(self, func_name, *args, **kwargs):
+    def get_fingerprint(self, func_name, *args):
         """
-        Hook that allows the backlight driver to determine whether the image has changed.
+        Returns a fingerprint of what ``display_image`` or ``display_data`` would
+        show if called with these arguments, so that redundant redraws can be
+        detected without comparing images. For ``display_data``, the text and
+        the cursor are hashed, so that the image doesn't need to be drawn.
+        Returns None if there's no way to make a fingerprint.
         """
         if func_name == "display_image":
-            image = args[0]
-            is_new_image = ImageChops.difference(image, self.current_image).getbbox() is None
-            return is_new_image
+            return frame_fingerprint(args[0])
         elif func_name == "display_data":
-            # Redundant, sorry =(
-            image = self.display_data_onto_image(*args)
-            is_new_image = ImageChops.difference(image, self.current_image).getbbox() is None
-            return is_new_image
+            cursor_pos = self.cursor_pos if self.cursor_enabled else None
+            try:
+                return hash((func_name, args, cursor_pos, self.default_color))
+            except TypeError: # something unhashable passed
+                return None
         else:
             raise ValueError("Unknown function wrapped, wtf?")
 
-    def _display_image(self, image):
+    def _display_image(self, image, fingerprint=None):
         if self.device.real: # has the actual device been created yet?
             try:
-                self.device.display(image)
+                self.update_panel(image, fingerprint)
             except (DNFError, OSError):
+                self.forget_panel_contents()
                 logger.warning("couldn't write to the display")
 
+    def forget_panel_contents(self):
+        # we don't know what the panel shows now, next frame has to be sent in full
+        self.panel_image = None
+        self.panel_fingerprint = None
+
+    def update_panel(self, image, fingerprint=None):
+        """
+        Sends an image to the panel, unless its fingerprint matches the one of the
+        frame that was sent last. If the driver implements ``write_region``,
+        only the part that changed since the last frame is sent, and nothing is
+        sent if the frame hasn't changed at all.
+        """
+        if fingerprint is not None and fingerprint == self.panel_fingerprint:
+            return
+        self.panel_fingerprint = fingerprint
+        if not self.partial_updates or not self.has_partial_updates() or image.mode != self.device.mode:
+            self.device.display(image)
+            return
+        panel_image = self.device.preprocess(image)
+        last_image = self.panel_image
+        if last_image is None or last_image.size != panel_image.size:
+            self.device.display(image)
+        else:
+            bbox = ImageChops.difference(panel_image, last_image).getbbox()
+            if bbox is None:
+                return
+            x0, y0, x1, y1 = bbox
+            self.write_region(panel_image, x0, y0//8, x1, (y1+7)//8)
+        # preprocess() returns the same image if there's no rotation
+        self.panel_image = panel_image.copy()
+
+    def has_partial_updates(self):
+        return type(self).write_region is not LumaScreen.write_region
+
+    def write_region(self, image, x0, page0, x1, page1):
+        """
+        Sends columns ``x0:x1`` of pages ``page0:page1`` of an already preprocessed
+        image to the panel. Not implemented by default - drivers that don't have it
+        always send full frames.
+        """
+        raise NotImplementedError
+
     def display_data_onto_image(self, *args, **kwargs):
         """
         This method takes lines of text and draws them onto an image,
@@ -187,7 +261,7 @@ class LumaScreen(GraphicalOutputDevice, CharacterOutputDevice, BacklightManager)
         font, font_size = get_default_font() if getattr(self, "default_font", None) else (self.default_font, (self.char_height, self.char_width))
         char_height, char_width = font_size
         lines_to_image(d, args, font, char_height, char_width, self.default_color, \
-                       self.cursor_pos, cursor_position)
+                       self.cursor_pos, cursor_position, image=draw.image)
         """
         if cursor_position:
             dims = (self.cursor_pos[0] - 1 + 2, self.cursor_pos[1] - 1, self.cursor_pos[0] + self.char_width + 2,
@@ -200,15 +274,18 @@ class LumaScreen(GraphicalOutputDevice, CharacterOutputDevice, BacklightManager)
         return draw.image
 
     @activate_backlight_wrapper
-    def display_data(self, *args):
+    def display_data(self, *args, fingerprint=None):
         """Displays data on display. This function does the actual work of printing things to display.
 
         ``*args`` is a list of strings, where each string corresponds to a row of the display, starting with 0."""
         if self.suspended: return # do not output to screen if suspended
+        if fingerprint is None:
+            fingerprint = self.get_fingerprint("display_data", *args)
         image = self.display_data_onto_image(*args)
         with self.busy_flag:
             self.current_image = image
-            self._display_image(image)
+            self.current_fingerprint = fingerprint
+            self._display_image(image, fingerprint)
 
     def home(self):
         """Returns cursor to home position. If the display is being scrolled, reverts scrolled data to initial position.."""
@@ -41,7 +41,8 @@ class Screen(HD44780, OutputDevice):
         
     def i2c_init(self):
         """Inits the MCP23017 IC for desired operation."""
-        self.setMCPreg(0x05, 0x0c)
+        # SEQOP set, so that block writes to the GPIO register don't move on to the next register
+        self.setMCPreg(0x05, 0x2c)
         self.setMCPreg(0x00, 0x00)
 
     def write_byte(self, byte, char_mode=False):
@@ -64,6 +65,18 @@ class Screen(HD44780, OutputDevice):
         self.setMCPreg(0x0a, data)
         delay(1.0)
         
+    def write_chars(self, data):
+        """Writes a list of bytes to the display RAM, sending all the nibble strobes
+        to the GPIO register in block writes. I2C is slow enough that the display
+        doesn't need extra delays between characters."""
+        values = []
+        for byte in data:
+            for nibble in (byte >> 4 & 0x0F, byte & 0x0F):
+                value = nibble | 0x10
+                values += [value, value ^ 0x80, value]
+        for i in range(0, len(values), 32):
+            self.bus.write_i2c_block_data(self.addr, 0x0a, values[i:i+32])
+
     def setMCPreg(self, reg, val):
         """Sets the MCP23017 register."""
         self.bus.write_byte_data(self.addr, reg, val)
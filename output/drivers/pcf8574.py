@@ -73,6 +73,19 @@ class Screen(HD44780, OutputDevice):
         """Sends data to PCF8574."""
         self.bus.write_byte_data(self.addr, 0, data|self.data_mask)
 
+    def write_chars(self, data):
+        """Writes a list of bytes to the display RAM. PCF8574 latches every byte it receives
+        onto its pins, so all the nibble strobes can go out in a few block writes."""
+        values = []
+        for byte in data:
+            for nibble in (byte & 0xF0, (byte << 4) & 0xF0):
+                value = (nibble | self.rs_mask | self.data_mask) & ~self.enable_mask
+                values += [value, value | self.enable_mask, value]
+        # SMBus block writes are limited to 32 bytes after the "command" byte
+        for i in range(0, len(values), 33):
+            chunk = values[i:i+33]
+            self.bus.write_i2c_block_data(self.addr, chunk[0], chunk[1:])
+
 
 if __name__ == "__main__":
     screen = Screen(bus=1, addr=0x26, cols=16, rows=2, autoscroll=False)
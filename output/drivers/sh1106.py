@@ -3,7 +3,7 @@
 from luma.oled.device import sh1106
 
 from output.output import OutputDevice
-from output.drivers.luma_driver import LumaScreen
+from output.drivers.luma_driver import LumaScreen, get_page_data
 
 
 function_mock = lambda *a, **k: True
@@ -24,7 +24,15 @@ class Screen(LumaScreen, OutputDevice):
             self.device = device_mock
         self.reattach_callback = self.reinit_display
 
+    def write_region(self, image, x0, page0, x1, page1):
+        # page addressing mode - the column address has to be set for each page
+        col = self.device._page_address_offset + x0
+        for page in range(page0, page1):
+            self.device.command(0xB0 + page, col & 0x0F, 0x10 | (col >> 4))
+            self.device.data(list(get_page_data(image, x0, x1, page)))
+
     def reinit_display(self):
+        self.forget_panel_contents()
         try:
             self.device = sh1106(self.serial, width=self.width, height=self.height, rotate=self.rotate)
             self.device_mode = self.device.mode
@@ -2,7 +2,7 @@
 
 from luma.oled.device import ssd1306
 
-from output.drivers.luma_driver import LumaScreen
+from output.drivers.luma_driver import LumaScreen, get_page_data
 from output.output import OutputDevice
 
 
@@ -16,3 +16,13 @@ class Screen(LumaScreen, OutputDevice):
         """Initializes SSD1306 controller. """
         self.rotate = kwargs.pop("rotate", self.default_rotate)
         self.device = ssd1306(self.serial, width=self.width, height=self.height, rotate=self.rotate)
+        self.device.real = True
+
+    def write_region(self, image, x0, page0, x1, page1):
+        # horizontal addressing mode - the controller wraps to the next page by itself
+        const = self.device._const
+        colstart = self.device._colstart
+        self.device.command(const.COLUMNADDR, colstart + x0, colstart + x1 - 1, \
+                            const.PAGEADDR, page0, page1 - 1)
+        data = b"".join(get_page_data(image, x0, x1, page) for page in range(page0, page1))
+        self.device.data(list(data))
@@ -1,12 +1,15 @@
-from functools import wraps
+from functools import wraps, lru_cache
 from copy import deepcopy
+from threading import Thread, Condition
+from time import sleep, monotonic
 import importlib
 import os
 
-from PIL import ImageFont
+from PIL import Image, ImageDraw, ImageFont
 
 from zpui_lib.ui.canvas import get_default_font as gdf, fonts_dir
 from zpui_lib.helpers import setup_logger
+from startup_profiler import profiler
 
 logger = setup_logger(__name__)
 
@@ -31,9 +34,27 @@ def get_default_font(width=None, height=None):
     current_font = font; current_font_size = font_size
     return font, font_size
 
-def lines_to_image(d, args, font, cheight, cwidth, color, cpos, cposition):
+@lru_cache(maxsize=256)
+def get_line_mask(font, fontmode, line):
+    """
+    Renders a line of text onto a mask, the same way ``ImageDraw.text`` would.
+    Returns the mask and its offset from the text's origin, or ``(None, None)``
+    if there's nothing to draw. Cached, since char-mode UIs keep redrawing the
+    same lines over and over, and rasterizing text is the expensive part.
+    """
+    left, top, right, bottom = font.getbbox(line)
+    if right <= left or bottom <= top:
+        return None, None
+    mask = Image.new("L", (right - left, bottom - top))
+    draw = ImageDraw.Draw(mask)
+    draw.fontmode = fontmode
+    draw.text((-left, -top), line, fill=255, font=font)
+    return mask, (left, top)
+
+def lines_to_image(d, args, font, cheight, cwidth, color, cpos, cposition, image=None):
     # unified interface teehee
     #print("lti", repr(args), font, cheight, cwidth, color, cpos, cposition)
+    # if the image ``d`` draws on is passed, lines are pasted from the line cache
     if cposition:
         dims = (cpos[0] - 1 + 2,
                 cpos[1] - 1,
@@ -42,7 +63,49 @@ def lines_to_image(d, args, font, cheight, cwidth, color, cpos, cposition):
         d.rectangle(dims, outline=color)
     for i, line in enumerate(args):
         y = (i * cheight - 1) if i != 0 else 0
-        d.text((2, y), line, fill=color, font=font)
+        if image is None or "\n" in line:
+            d.text((2, y), line, fill=color, font=font)
+            continue
+        mask, offset = get_line_mask(font, d.fontmode, line)
+        if mask is not None:
+            image.paste(color, (2 + offset[0], y + offset[1]), mask)
+
+def frame_fingerprint(image):
+    """
+    Returns a value that's only equal for two images with the same contents.
+    Hashing the raw image data is a lot cheaper than comparing images
+    pixel-by-pixel, say, with ``ImageChops.difference``.
+    """
+    return hash((image.mode, image.size, image.tobytes()))
+
+# methods that change what's on the display, see OutputDevice.add_frame_listener
+frame_methods = ("display_image", "display_data", "clear")
+
+def make_proxied_method(method_name, method, sideeffect=None):
+    """
+    Makes a method for a proxy class that calls ``method_name`` on the output device
+    if the proxy is the current one. ``method`` is only used for the name and docstring.
+    """
+    @wraps(method)
+    def wrapper(proxy, *args, **kwargs):
+        if sideeffect:
+            sideeffect(proxy, *args, **kwargs)
+        o = proxy._device
+        if o.current_proxy.context_alias == proxy.context_alias:
+            if o.render_thread and method_name in o.render_thread.deferred_methods:
+                o.render_thread.submit(proxy, method_name, *args, **kwargs)
+            else:
+                getattr(o, method_name)(*args, **kwargs)
+            if o.frame_listeners and method_name in frame_methods:
+                o.notify_frame_listeners(proxy.get_current_image())
+    return wrapper
+
+def make_direct_method(method_name, method):
+    """Makes a method for a proxy class that calls ``method_name`` on the output device, no matter what."""
+    @wraps(method)
+    def wrapper(proxy, *args, **kwargs):
+        return getattr(proxy._device, method_name)(*args, **kwargs)
+    return wrapper
 
 # These base classes document functions that
 # different output devices are expected to have.
@@ -51,76 +114,182 @@ class OutputDevice(object):
     """Common class for all OutputDevices, no matter if they're graphical or character-based."""
 
     current_proxy = None
+    render_thread = None
+    skipped_redraws = 0
+    frame_listeners = ()
 
     def attach_new_proxy(self, proxy):
         self.detach_current_proxy()
-        self.attach_proxy(proxy)
+        return self.attach_proxy(proxy)
 
     def detach_current_proxy(self):
         self.current_proxy = None
 
     def attach_proxy(self, proxy):
+        """
+        Makes the proxy the current one, and redraws whatever it has on it -
+        unless that image is already on the display. Returns True if redrawn.
+        """
         self.current_proxy = proxy
+        if self.shows_image(proxy.get_current_image()):
+            self.skipped_redraws += 1
+            return False
         proxy.on_attach()
+        return True
+
+    def add_frame_listener(self, callback):
+        """
+        Makes ``callback(image)`` be called with each new frame the current proxy shows
+        (``None`` if the screen is cleared). It's called from whichever thread draws
+        the frame, so it has to be quick.
+        """
+        self.frame_listeners = self.frame_listeners + (callback,)
+
+    def remove_frame_listener(self, callback):
+        self.frame_listeners = tuple(l for l in self.frame_listeners if l != callback)
+
+    def notify_frame_listeners(self, image):
+        for callback in self.frame_listeners:
+            try:
+                callback(image)
+            except:
+                logger.exception("Frame listener {} failed".format(callback))
+
+    def shows_image(self, image):
+        """
+        Tells whether the display is currently showing this exact image,
+        so that redrawing it can be skipped. Drivers that can tell override this.
+        """
+        return False
 
     def init_proxy(self, proxy):
+        """
+        Makes the proxy pass its calls on to this device. The proxy's class is swapped
+        for a subclass that has wrappers for this device's methods and snapshots of its
+        public attributes - that subclass is only made once per proxy class (see
+        ``get_proxy_class``), so nothing is generated or copied for each proxy.
+        """
+        proxy.__class__ = self.get_proxy_class(proxy.__class__)
+        proxy._device = self
+
+    def get_proxy_class(self, proxy_class):
+        if getattr(proxy_class, "_proxied_device", None) is self:
+            return proxy_class # proxy's been initialized already
+        proxy_classes = self.__dict__.setdefault("_proxy_classes", {})
+        if proxy_class not in proxy_classes:
+            proxy_classes[proxy_class] = self.make_proxy_class(proxy_class)
+        return proxy_classes[proxy_class]
+
+    def make_proxy_class(self, proxy_class):
         base_classes = self.__base_classes__
         base_classes_items = sum([list(cls.__dict__.items()) for cls in base_classes], [])
-        #print(base_classes_items)
         public_attributes = [ (k, v) for (k, v) in base_classes_items if not k.startswith("_") ]
-        hidden_attributes = ["current_proxy", "current_image"]
-        hidden_methods = ["init_proxy", "proxify_method", "detach_current_proxy", "attach_proxy", "get_proxied_method", "proxify_method"]
+        hidden_attributes = ["current_proxy", "current_image", "render_thread"]
+        hidden_methods = ["init_proxy", "get_proxy_class", "make_proxy_class", "detach_current_proxy", "attach_proxy", "start_render_thread"]
         attribute_names = [ k for (k, v) in public_attributes if not callable(v) and k not in hidden_attributes]
         method_names = [ k for (k, v) in public_attributes if callable(v) and k not in hidden_methods]
         direct_methods = ["display_data_onto_image"]
 
+        namespace = {"_proxied_device":self}
         for attribute_name in attribute_names:
-            #print("attribute: {}".format(attribute_name))
-            # Setting attributes of the proxy object to the same values
-            # as the current output device has them
+            # Proxies get the same attribute values as the output device has - as class
+            # attributes, so a proxy setting its own value doesn't change anything for others,
+            # and lists are turned into tuples so that they can't be changed in-place
             value = getattr(self, attribute_name)
-            # Making sure that changing the proxy object's attributes
-            # won't change the attributes of the original object
-            copied_value = deepcopy(value)
-            setattr(proxy, attribute_name, copied_value)
-            #print("Setting to value {}".format(copied_value))
+            namespace[attribute_name] = tuple(value) if isinstance(value, list) else value
         for method_name in method_names:
-            #print("method: {}".format(method_name))
-            # Setting functions to proxy the current object's
-            self.proxify_method(proxy, method_name)
+            # If a proxy defines a side effect to happen when the function is called,
+            # we call it with same arguments and kwargs as the function received
+            sideeffect = getattr(proxy_class, "_"+method_name, None)
+            namespace[method_name] = make_proxied_method(method_name, getattr(self, method_name), sideeffect)
         for method_name in direct_methods:
             # Methods that are proxied directly
-            setattr(proxy, method_name, getattr(self, method_name))
-        # Proxies have no use for hidden methods
-        # Unless
-        #for attribute_name in hidden_attributes+hidden_methods:
-        #    if hasattr(proxy, attribute_name):
-        #        delattr(proxy, attribute_name)
-
-    def get_proxied_method(o, proxy, method_name, sideeffect):
-        method = getattr(o, method_name)
-        @wraps(method)
-        def wrapper(*args, **kwargs):
-            #print("Method: "+method_name)
-            sideeffect(*args, **kwargs)
-            #print("Current: "+o.current_proxy.context_alias)
-            #print("Called from: "+proxy.context_alias)
-            if o.current_proxy.context_alias == proxy.context_alias:
-                #print("Calling the method directly!")
-                #print(args)
-                method(*args, **kwargs)
-            else:
-                pass #print("Not calling the method directly!")
-            #print("")
-        return wrapper
+            namespace[method_name] = make_direct_method(method_name, getattr(self, method_name))
+        return type(proxy_class.__name__, (proxy_class,), namespace)
 
-    def proxify_method(self, proxy, method_name):
-        # If a proxy defines a side effect to happen when the function is called,
-        # we call it with same arguments and kwargs as the function received
-        # (and we make a small empty lambda if there's no side effect)
-        sideeffect = getattr(proxy, "_"+method_name, lambda *a, **k: None)
-        proxied_method = self.get_proxied_method(proxy, method_name, sideeffect)
-        setattr(proxy, method_name, proxied_method)
+    def start_render_thread(self, max_fps):
+        """
+        Makes proxies hand their frames over to a separate thread instead
+        of writing them to the display themselves. See ``RenderThread``.
+        Only graphical devices get a render thread - character displays don't
+        have ``display_image``, and their frames are cheap to write anyway.
+        """
+        if "b&w" not in self.type and "color" not in self.type:
+            logger.info("{} is not a graphical device, not starting a render thread".format(self.__class__.__module__))
+            return
+        self.render_thread = RenderThread(self, max_fps)
+
+
+class RenderThread(object):
+    """
+    Writes frames to a graphical output device from a separate thread, so that
+    whoever draws (usually, the input thread running an UI element's callback)
+    doesn't have to wait for the display to be written. Only the latest frame
+    is kept - if a new frame comes in before the previous one was written, the
+    previous one is dropped. Frames are written at most ``max_fps`` times a second.
+
+    Frames from a context that's no longer the current one are dropped, too.
+    """
+
+    deferred_methods = ("display_image", "display_data", "clear")
+
+    def __init__(self, device, max_fps):
+        self.device = device
+        self.interval = 1.0/max_fps
+        self.condition = Condition()
+        self.pending = None
+        self.busy = False
+        self.last_write = 0
+        self.written = 0
+        self.dropped = 0
+        self.thread = Thread(target=self.run, name="Render thread for {}".format(device.__class__.__module__))
+        self.thread.daemon = True
+        self.thread.start()
+
+    def submit(self, proxy, method_name, *args, **kwargs):
+        if method_name == "display_data":
+            # the proxy has already drawn the text onto an image, no need to do it twice
+            method_name, args = "display_image", (proxy.get_current_image(),)
+        with self.condition:
+            if self.pending is not None:
+                self.dropped += 1
+            self.pending = (proxy.context_alias, method_name, args, kwargs)
+            self.condition.notify_all()
+
+    def flush(self, timeout=None):
+        """Waits until the pending frame, if any, is written. Returns False on timeout."""
+        with self.condition:
+            return self.condition.wait_for(lambda: self.pending is None and not self.busy, timeout)
+
+    def get_stats(self):
+        return {"written":self.written, "dropped":self.dropped}
+
+    def run(self):
+        while True:
+            with self.condition:
+                self.condition.wait_for(lambda: self.pending is not None)
+            # frames that come in while we're waiting replace the pending one
+            delay = self.last_write + self.interval - monotonic()
+            if delay > 0:
+                sleep(delay)
+            with self.condition:
+                context_alias, method_name, args, kwargs = self.pending
+                self.pending = None
+                self.busy = True
+            try:
+                current_proxy = self.device.current_proxy
+                if current_proxy and current_proxy.context_alias == context_alias:
+                    getattr(self.device, method_name)(*args, **kwargs)
+                    self.written += 1
+                else:
+                    self.dropped += 1
+            except:
+                logger.exception("Failed to write a frame to {}".format(self.device))
+            finally:
+                self.last_write = monotonic()
+                with self.condition:
+                    self.busy = False
+                    self.condition.notify_all()
 
 
 class CharacterOutputDevice(OutputDevice):
@@ -189,6 +358,8 @@ class GraphicalOutputDevice(OutputDevice):
 class OutputProxy(CharacterOutputDevice, GraphicalOutputDevice):
 
     current_image = None
+    # called (once) on the next frame the proxy gets, see ContextManager.unsafe_switch_to_context
+    first_frame_callback = None
     __cursor_enabled = False
     __cursor_position = (0, 0)
 
@@ -201,13 +372,22 @@ class OutputProxy(CharacterOutputDevice, GraphicalOutputDevice):
         can be passed other arguments
         """
         self.current_image = image
+        self._frame_drawn()
 
     def _clear(self):
         self.current_image = None
+        self._frame_drawn()
 
     def _display_data(self, *data):
         cursor_position = self.__cursor_position if self.__cursor_enabled else None
         self.current_image = self.display_data_onto_image(*data, cursor_position=cursor_position)
+        self._frame_drawn()
+
+    def _frame_drawn(self):
+        callback = self.first_frame_callback
+        if callback:
+            self.first_frame_callback = None
+            callback()
 
     def _cursor(self):
         self.__cursor_enabled = True
@@ -225,9 +405,11 @@ class OutputProxy(CharacterOutputDevice, GraphicalOutputDevice):
         if self.current_image:
             self.display_image(self.current_image)
 
-def init(driver_configs):
+def init(driver_configs, max_fps=None):
     # type: (list) -> None
-    """ This function is called by main.py to read the output configuration, pick the corresponding drivers and initialize a Screen object. Returns the screen object created. """
+    """ This function is called by main.py to read the output configuration, pick the corresponding drivers and initialize a Screen object. Returns the screen object created.
+
+    If ``max_fps`` is passed (or set in the driver config), the screen gets a ``RenderThread`` that writes at most that many frames per second. """
     driver_configs = deepcopy(driver_configs)
     if isinstance(driver_configs, str):
         # just a driver name provided, good, we can do that
@@ -239,7 +421,9 @@ def init(driver_configs):
     try:
         driver_config = driver_configs[0]
         driver_name = driver_config["driver"]
-        driver_module = importlib.import_module("output.drivers." + driver_name)
+        with profiler.span("import output.drivers." + driver_name):
+            driver_module = importlib.import_module("output.drivers." + driver_name)
+        max_fps = driver_config.pop("max_fps", max_fps)
         args = driver_config["args"] if "args" in driver_config else []
         if "kwargs" not in driver_config:
             # a shortening letting us avoid building yaml or json staircases with magic words
@@ -251,7 +435,11 @@ def init(driver_configs):
     except:
         logger.exception(driver_configs)
         raise
-    return driver_module.Screen(*args, **kwargs)
+    with profiler.span("init output driver " + driver_name):
+        screen = driver_module.Screen(*args, **kwargs)
+    if max_fps:
+        screen.start_render_thread(max_fps)
+    return screen
 
 if __name__ == "__main__":
     o = type("OD", (GraphicalOutputDevice, CharacterOutputDevice), {})()
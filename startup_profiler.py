@@ -0,0 +1,125 @@
+"""
+Startup profiler - records how long each part of ZPUI's startup takes, as a timeline
+that can be opened in ``chrome://tracing`` (or https://ui.perfetto.dev), and logs a short
+summary. Enabled by ``main.py --profile-startup``; when it's not enabled, spans cost
+next to nothing, so they can stay in the code.
+"""
+
+import json
+import os
+import threading
+from contextlib import contextmanager
+from time import monotonic
+
+from zpui_lib.helpers import setup_logger
+logger = setup_logger(__name__, "info")
+
+
+class StartupProfiler(object):
+    """
+    Keeps a list of timed spans. Spans from the same thread that are inside
+    one another are shown as a hierarchy, both in the trace and in the summary.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.start_time = None
+        self.spans = []
+        self.thread_names = {}
+        self.lock = threading.Lock()
+
+    def enable(self, start_time=None):
+        """Starts recording spans. ``start_time`` (a ``monotonic()`` value) is where the timeline starts."""
+        with self.lock:
+            self.spans = []
+            self.thread_names = {}
+            self.start_time = start_time if start_time is not None else monotonic()
+            self.enabled = True
+
+    @contextmanager
+    def span(self, name, category="startup", **args):
+        """Records how long the code inside the ``with`` block takes."""
+        if not self.enabled:
+            yield
+            return
+        start = monotonic()
+        try:
+            yield
+        finally:
+            self.add_span(name, start, monotonic(), category, **args)
+
+    def add_span(self, name, start, end, category="startup", **args):
+        """Records a span that's already been timed elsewhere (with ``monotonic()``)."""
+        if not self.enabled:
+            return
+        thread = threading.current_thread()
+        with self.lock:
+            self.thread_names[thread.ident] = thread.name
+            self.spans.append((name, category, start, end, thread.ident, args))
+
+    def get_trace(self):
+        """Returns the spans in the Chrome trace event format, as a dictionary."""
+        pid = os.getpid()
+        with self.lock:
+            spans = list(self.spans)
+            thread_names = dict(self.thread_names)
+        events = []
+        for tid, thread_name in thread_names.items():
+            events.append({"name":"thread_name", "ph":"M", "pid":pid, "tid":tid, "args":{"name":thread_name}})
+        for name, category, start, end, tid, args in spans:
+            events.append({"name":name, "cat":category, "ph":"X", "pid":pid, "tid":tid, "args":args,
+                           "ts":round((start - self.start_time) * 1000000), "dur":round((end - start) * 1000000)})
+        return {"traceEvents":events, "displayTimeUnit":"ms"}
+
+    def write_trace(self, path):
+        dir = os.path.dirname(path)
+        if dir:
+            os.makedirs(dir, exist_ok=True)
+        with open(path, 'w') as f:
+            json.dump(self.get_trace(), f)
+
+    def get_summary(self, min_duration=0.01):
+        """
+        Returns the spans as lines of text, indented by nesting level. Spans shorter
+        than ``min_duration`` (in seconds) are counted, but not listed.
+        """
+        with self.lock:
+            spans = list(self.spans)
+            thread_names = dict(self.thread_names)
+        main_thread = threading.main_thread().ident
+        threads = sorted(set(span[4] for span in spans), key=lambda tid: (tid != main_thread, thread_names[tid]))
+        lines = []
+        for tid in threads:
+            # parents start earlier, or at the same time and last longer
+            thread_spans = sorted([s for s in spans if s[4] == tid], key=lambda s: (s[2], -s[3]))
+            if len(threads) > 1:
+                lines.append("{}:".format(thread_names[tid]))
+            stack = []
+            hidden = 0
+            for name, _, start, end, _, _ in thread_spans:
+                while stack and stack[-1] <= start:
+                    stack.pop()
+                if end - start >= min_duration:
+                    lines.append("{}{}: {:.1f} ms (at {:.1f} ms)".format("  "*(len(stack)+1), name, \
+                                 (end - start) * 1000, (start - self.start_time) * 1000))
+                else:
+                    hidden += 1
+                stack.append(end)
+            if hidden:
+                lines.append("  ({} spans shorter than {:.0f} ms not shown)".format(hidden, min_duration * 1000))
+        return lines
+
+    def finish(self, path):
+        """Stops recording, writes the trace to ``path`` and logs the summary."""
+        self.add_span("startup", self.start_time, monotonic())
+        self.enabled = False
+        try:
+            self.write_trace(path)
+        except:
+            logger.exception("Failed to write the startup trace to {}".format(path))
+        else:
+            logger.info("Startup trace written to {}".format(path))
+        logger.info("Startup timeline:\n{}".format("\n".join(self.get_summary())))
+
+
+profiler = StartupProfiler()
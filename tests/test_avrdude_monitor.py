@@ -0,0 +1,88 @@
+"""tests for the avrdude app's output parser and process monitor, using recorded output"""
+import os
+import sys
+import json
+import random
+import unittest
+
+try:
+    from apps.hardware_apps.avrdude.avrdude_monitor import OutputParser, AvrdudeMonitor
+except ImportError:
+    print("Absolute imports failed, trying relative imports")
+    os.sys.path.append(os.path.dirname(os.path.abspath('.')))
+    from apps.hardware_apps.avrdude.avrdude_monitor import OutputParser, AvrdudeMonitor
+
+app_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "apps", "hardware_apps", "avrdude")
+monitor_path = os.path.join(app_dir, "avrdude_monitor.py")
+fixture_path = os.path.join(app_dir, "fixtures", "write_flash.json")
+
+
+def get_fixture_output():
+    with open(fixture_path) as f:
+        return "".join(data for _, data in json.load(f))
+
+
+class TestOutputParser(unittest.TestCase):
+    """tests the avrdude output parser"""
+
+    def test_chunk_boundaries(self):
+        """Output is parsed the same way no matter how it's split into chunks"""
+        output = get_fixture_output()
+        parser = OutputParser()
+        expected = parser.feed(output)
+        random.seed(0)
+        parser = OutputParser()
+        statuses = []
+        position = 0
+        while position < len(output):
+            size = random.randint(1, 50)
+            statuses += parser.feed(output[position:position+size])
+            position += size
+        self.assertEqual(statuses, expected)
+        self.assertEqual(parser.get_full_output(), output)
+        operations = []
+        for status in statuses:
+            if status.get("operation") not in operations:
+                operations.append(status.get("operation"))
+        self.assertEqual(operations, ["reading", "erasing", "writing", "verifying"])
+        self.assertEqual(statuses[-1], {"status":"in progress", "operation":"verifying", "progress":100, "time":"8.01s"})
+
+    def test_fuse_changeback(self):
+        """Fuse changeback requests are answered, other questions get a 'n'"""
+        responses = []
+        parser = OutputParser(respond=responses.append, fuse_changeback_response='y')
+        statuses = parser.feed("avrdude: safemode: lfuse changed! Was ff, and is now 0\nWould you like this fuse to be changed back? [y/n] ")
+        self.assertEqual(responses, ["y\n"])
+        self.assertEqual(statuses, [{"status":"in progress", "operation":"restoring fuses"}])
+        parser.feed("Continue anyway? [y/n]")
+        self.assertEqual(responses, ["y\n", "n\n"])
+
+    def test_failure(self):
+        parser = OutputParser()
+        statuses = parser.feed("\rReading | ###                | 12% 0.11s ***failed;  \n")
+        self.assertEqual(statuses, [{"status":"failure"}])
+
+
+class TestAvrdudeMonitor(unittest.TestCase):
+    """tests the avrdude monitor on a replayed process"""
+
+    def test_replay(self):
+        """Progress updates are rate-limited, but operation changes and the result aren't lost"""
+        statuses = []
+        command = [sys.executable, monitor_path, "--replay", fixture_path, "--speed", "20"]
+        monitor = AvrdudeMonitor(command, callback=statuses.append, min_interval=0.1)
+        self.assertEqual(monitor.run(), 0)
+        self.assertEqual(statuses[0], {"status":"started"})
+        self.assertEqual(statuses[-1], {"status":"success"})
+        operations = [s.get("operation") for s in statuses]
+        for operation in ["reading", "erasing", "writing", "verifying"]:
+            self.assertIn(operation, operations)
+        # ~1s of replayed output, with a progress line every ~20ms
+        self.assertLess(len(statuses), 40)
+        status = monitor.get_status()
+        self.assertEqual(status["result"], "success")
+        self.assertIn("32670 bytes of flash verified", status["output"])
+
+
+if __name__ == '__main__':
+    unittest.main()
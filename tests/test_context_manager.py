@@ -106,6 +106,41 @@ class TestContextManager(unittest.TestCase):
         e1.set()
         e2.set()
 
+    def test_switch_timings(self):
+        """Tests context switch timings, and that redraws are skipped if the image is already shown"""
+        from PIL import Image
+        from output import output
+        screen = output.init({"driver":"headless", "kwargs":{"backlight_interval":0}})
+        cm = ContextManager()
+        cm.initial_contexts = [cm.fallback_context, "test1", "test2"]
+        cm.init_io(Mock(), screen)
+        cm.switch_to_context(cm.fallback_context)
+        image = Image.new(screen.device_mode, (screen.width, screen.height), "white")
+        drawn = Event()
+        e = Event()
+        def target():
+            cm.contexts["test1"].o.display_image(image)
+            drawn.set()
+            e.wait()
+        cm.register_context_target("test1", target)
+        cm.contexts["test1"].threaded = True
+        cm.switch_to_context("test1")
+        assert drawn.wait(1)
+        timings = cm.get_switch_timings()["switches"][-1]
+        assert timings["to"] == "test1" and timings["from"] == cm.fallback_context
+        assert timings["first_frame"] is not None
+        for key in ("io_attach", "redraw", "thread_start", "total"):
+            assert timings[key] >= 0
+        frame_count = screen.frame_count
+        # test2 doesn't draw anything, so the image from test1 stays on the screen
+        cm.switch_to_context("test2")
+        cm.switch_to_context("test1")
+        assert cm.get_switch_timings()["switches"][-1]["redraw_skipped"]
+        assert cm.get_switch_timings()["skipped_redraws"] == 1
+        assert screen.frame_count == frame_count
+        assert cm.get_provider("contextmanager_switch_timings") == cm.get_switch_timings
+        e.set()
+
     def test_context_switching_on_context_finish(self):
         """Tests whether basic context switching works"""
         cm = ContextManager()
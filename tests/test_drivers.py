@@ -4,7 +4,7 @@ import json
 import unittest
 import traceback
 from copy import deepcopy
-from threading import Event
+from threading import Event, Thread
 from mock import patch, Mock
 
 from PIL.Image import Image as PIL_Image
@@ -177,6 +177,103 @@ class TestDrivers(unittest.TestCase):
         image = main_py.zpui.screen.display_data_onto_image("Test1", "Test2")
         assert(isinstance(image, PIL_Image))
 
+    def test_sh1106_partial_updates(self):
+        """Only changed pages/columns are sent to the panel, and nothing if the frame is the same"""
+        from output.drivers import sh1106
+        screen = sh1106.Screen(hw="dummy")
+        screen.device.command = Mock()
+        screen.device.data = Mock()
+        image = screen.clear_image.copy()
+        screen.display_image(image)
+        assert screen.device.data.call_count == 8 # full frame
+        screen.device.command.reset_mock(); screen.device.data.reset_mock()
+        screen.display_image(image.copy())
+        screen.device.command.assert_not_called()
+        screen.device.data.assert_not_called()
+        image = image.copy()
+        image.putpixel((10, 20), 1)
+        screen.display_image(image)
+        col = screen.device._page_address_offset + 10
+        screen.device.command.assert_called_once_with(0xB2, col & 0x0F, 0x10 | (col >> 4))
+        screen.device.data.assert_called_once_with([1 << 4])
+
+    def test_ssd1306_partial_updates(self):
+        from output.drivers import ssd1306
+        screen = ssd1306.Screen(hw="dummy")
+        screen.device.command = Mock()
+        screen.device.data = Mock()
+        image = screen.clear_image.copy()
+        screen.display_image(image)
+        screen.device.command.reset_mock(); screen.device.data.reset_mock()
+        image = image.copy()
+        image.putpixel((3, 7), 1)
+        image.putpixel((4, 8), 1)
+        screen.display_image(image)
+        const = screen.device._const
+        screen.device.command.assert_called_once_with(const.COLUMNADDR, 3, 4, const.PAGEADDR, 0, 1)
+        screen.device.data.assert_called_once_with([0x80, 0, 0, 0x01])
+
+    def test_sh1106_backlight_only_on_new(self):
+        from time import sleep
+        from output.drivers import sh1106
+        screen = sh1106.Screen(hw="dummy", backlight_interval=0.1)
+        image = screen.clear_image.copy()
+        image.putpixel((0, 0), 1)
+        screen.display_image(image)
+        assert screen._backlight_enabled
+        for i in range(20):
+            if not screen._backlight_enabled: break
+            sleep(0.05)
+        assert not screen._backlight_enabled
+        screen.device.data = Mock()
+        # same frame - backlight stays off and nothing is written
+        screen.display_image(image.copy(), backlight_only_on_new=True)
+        assert not screen._backlight_enabled
+        screen.device.data.assert_not_called()
+        image = image.copy()
+        image.putpixel((1, 0), 1)
+        screen.display_image(image, backlight_only_on_new=True)
+        assert screen._backlight_enabled
+        assert screen.current_image is image
+
+    def test_universal_input_on_proxy(self):
+        """UI elements can use the ``available_keys`` proxies get"""
+        from zpui_lib.ui import UniversalInput
+        output_config = {"driver":"headless", "kwargs":{"backlight_interval":0}}
+        input_config = {"driver":"scripted", "kwargs":{"script":["KEY_DOWN"], "autostart":False}}
+        main_py.zpui = main_py.ZPUI()
+        main_py.zpui.config = {"input":[input_config], "output":[output_config]}
+        i, o = main_py.init()
+        assert isinstance(list(i.available_keys.values())[0], list)
+        assert UniversalInput(i, o, message="Test:", name="Test input") is not None
+        main_py.zpui.input_processor.atexit()
+
+    def test_headless_scripted(self):
+        output_config = {"driver":"headless", "kwargs":{"backlight_interval":0, "buffer_size":2}}
+        input_config = {"driver":"scripted", "kwargs":{"script":[["KEY_DOWN", 0], "KEY_F1"], "interval":0, "start_delay":0, "autostart":False}}
+        config = {"input":[input_config], "output":[output_config]}
+        main_py.zpui = main_py.ZPUI()
+        main_py.zpui.config = config
+        i, o = main_py.init()
+        screen = main_py.zpui.screen
+        driver = list(main_py.zpui.input_processor.initial_drivers.values())[0]
+        assert "KEY_F1" in driver.available_keys
+        screen.display_data("a", "b")
+        screen.display_data("a", "b")
+        screen.display_data("c")
+        screen.display_data("d")
+        # the repeated frame is skipped, and only the last two frames are kept
+        assert screen.get_stats()["frames"] == 3
+        assert screen.get_stats()["skipped_frames"] == 1
+        assert len(screen.frames) == 2
+        sent = []
+        driver.send_key = lambda key, state=None: sent.append((key, state))
+        driver.start_script()
+        assert driver.finished.wait(1)
+        assert [key for key, state in sent] == ["KEY_DOWN"]*2 + ["KEY_F1"]*2
+        assert [key for _, key in driver.sent_keys] == ["KEY_DOWN", "KEY_F1"]
+        main_py.zpui.input_processor.atexit()
+
     #####################
     # Codependent drivers
     #####################
@@ -209,6 +306,35 @@ class TestDrivers(unittest.TestCase):
         # so that no ugly exception is raised when the test finishes
         main_py.zpui.input_processor.atexit()
 
+    def test_emulator_shared_frames(self):
+        """Tests the shared memory frame store (a seqlock) used by the emulator"""
+        with patch.dict('sys.modules', {"luma.emulator.device":Mock(), "luma.emulator":Mock()}):
+            import emulator as emulator_py
+        writer = emulator_py.SharedFrameBuffer(4)
+        try:
+            reader = emulator_py.SharedFrameBuffer(4, name=writer.name)
+            assert reader.read() == (0, b"\x00"*4)
+            assert writer.write(b"\x01"*4) == 1
+            assert writer.write(b"\x02"*4) == 2
+            # only the latest frame is available
+            assert reader.read() == (2, b"\x02"*4)
+            # a frame that's being written isn't read until the write is finished
+            writer.header.pack_into(writer.shm.buf, 0, 5)
+            writer.shm.buf[writer.data] = b"\x03\x03\x00\x00"
+            frames = []
+            t = Thread(target=lambda: frames.append(reader.read()))
+            t.daemon = True
+            t.start()
+            t.join(0.1)
+            assert frames == []
+            writer.shm.buf[writer.data] = b"\x03"*4
+            writer.header.pack_into(writer.shm.buf, 0, 6)
+            t.join(2)
+            assert frames == [(3, b"\x03"*4)]
+            reader.close()
+        finally:
+            writer.close(unlink=True)
+
     ###############
     # Input drivers
     ###############
@@ -240,6 +366,60 @@ class TestDrivers(unittest.TestCase):
 
     #@unittest.skip("broken test, can't properly patch the imports =(")
 
+    def test_hid_reactor(self):
+        from time import sleep
+        with patch.dict('sys.modules', {"evdev":Mock()}):
+            from input.drivers import hid
+        r, w = os.pipe()
+        os.set_blocking(r, False)
+        received = []
+        got_events = Event()
+        class Device(object):
+            closed = False
+            def fileno(self):
+                return r
+            def read(self):
+                data = os.read(r, 16)
+                if data == b"x":
+                    raise OSError(19, "No such device")
+                return list(data)
+            def close(self):
+                self.closed = True
+            def capabilities(self):
+                return {hid.ecodes.EV_KEY:[]}
+        device = Device()
+        def init_hw(driver):
+            driver.device = device
+            return True
+        def process_event(event):
+            received.append(event)
+            got_events.set()
+        with patch.object(hid.InputDevice, 'init_hw', init_hw):
+            driver = hid.InputDevice(path="/dev/input/event0", threaded=False)
+        driver.process_event = process_event
+        reactor = hid.HIDReactor()
+        try:
+            reactor.add(driver)
+            os.write(w, b"\x01\x02")
+            assert got_events.wait(1)
+            assert received == [1, 2]
+            # device gone - it's closed and the driver waits to be reconnected
+            driver.check_connection = lambda: False
+            os.write(w, b"x")
+            for i in range(20):
+                if driver in reactor.waiting: break
+                sleep(0.05)
+            assert driver in reactor.waiting
+            assert not reactor.drivers
+            assert device.closed
+            assert not driver.connected.is_set()
+            thread = reactor.thread
+            reactor.remove(driver)
+            thread.join(1)
+            assert reactor.thread is None
+        finally:
+            os.close(r); os.close(w)
+
     def test_pi_gpio_driver(self):
         input_config = {"driver":"pi_gpio"}
         config = deepcopy(base_config)
@@ -296,6 +476,23 @@ class TestDrivers(unittest.TestCase):
         main_py.zpui.input_processor.atexit()
         module_patch.stop()
 
+    def test_custom_i2c_read_keys(self):
+        module_patch = patch.dict('sys.modules', {"smbus":Mock()})
+        module_patch.start()
+        from input.drivers import custom_i2c
+        with patch.object(custom_i2c.InputDevice, 'init_hw'):
+            d = custom_i2c.InputDevice(threaded=False, block_size=4)
+        d.bus = Mock()
+        d.send_key = Mock()
+        # two full blocks, then an empty buffer
+        d.bus.read_i2c_block_data.side_effect = [[0x01, 0x21, 0x41, 0x02], [0x42, 0, 0, 0]]
+        assert d.read_keys() == 5
+        assert d.bus.read_i2c_block_data.call_count == 2
+        assert [c[0][0] for c in d.send_key.call_args_list] == ["KEY_LEFT"]*3 + ["KEY_UP"]*2
+        d.bus.read_i2c_block_data.side_effect = IOError
+        assert d.read_keys() is None
+        module_patch.stop()
+
     def test_input_driver_attach_detach(self):
         config = deepcopy(base_config)
         assert(config["output"][0]["driver"] == "test_output")
@@ -311,5 +508,217 @@ class TestDrivers(unittest.TestCase):
         # so that no ugly exception is raised when the test finishes
         main_py.zpui.input_processor.atexit()
 
+class TestRenderThread(unittest.TestCase):
+    """Tests the optional render thread for output devices"""
+
+    def make_screen(self):
+        from output.output import OutputProxy, GraphicalOutputDevice, CharacterOutputDevice
+        test_case = self
+        class Screen(GraphicalOutputDevice, CharacterOutputDevice):
+            __base_classes__ = (GraphicalOutputDevice, CharacterOutputDevice)
+            def __init__(self):
+                self.written = []
+                self.unblock = Event(); self.unblock.set()
+                self.writing = Event()
+            def display_image(self, image):
+                self.writing.set()
+                test_case.assertTrue(self.unblock.wait(2))
+                self.written.append(image)
+            def display_data_onto_image(self, *data, **kwargs):
+                return data
+        screen = Screen()
+        proxies = []
+        for alias in ("a", "b"):
+            proxy = OutputProxy(alias)
+            screen.init_proxy(proxy)
+            proxies.append(proxy)
+        screen.start_render_thread(1000)
+        return screen, proxies
+
+    def test_frames_dropped(self):
+        screen, (a, b) = self.make_screen()
+        screen.attach_proxy(a)
+        screen.unblock.clear()
+        a.display_image(0)
+        assert screen.writing.wait(1)
+        # the display is busy writing frame 0, only the latest of the rest gets written
+        for i in range(1, 10):
+            a.display_image(i)
+        a.display_data("line1", "line2")
+        assert a.current_image == ("line1", "line2")
+        screen.unblock.set()
+        assert screen.render_thread.flush(2)
+        assert screen.written == [0, ("line1", "line2")]
+
+    def test_old_context_frame_dropped(self):
+        screen, (a, b) = self.make_screen()
+        screen.attach_proxy(a)
+        screen.unblock.clear()
+        a.display_image(0)
+        assert screen.writing.wait(1)
+        a.display_image(1)
+        screen.attach_new_proxy(b) # no current_image, nothing to display
+        screen.unblock.set()
+        assert screen.render_thread.flush(2)
+        assert screen.written == [0]
+        assert a.current_image == 1
+
+    def test_proxy_class_shared(self):
+        screen, (a, b) = self.make_screen()
+        # wrappers and attributes live on one generated class, not on each proxy
+        assert type(a) is type(b)
+        assert "display_image" not in a.__dict__
+        assert a.type == ("b&w",)
+        a.width = 10
+        assert b.width is None and screen.width is None
+        screen.attach_proxy(a)
+        a.display_image(0)
+        b.display_image(1)
+        assert screen.render_thread.flush(2)
+        assert screen.written == [0]
+        assert b.current_image == 1
+
+    def test_character_device(self):
+        from output.output import OutputProxy, CharacterOutputDevice
+        class Screen(CharacterOutputDevice):
+            __base_classes__ = (CharacterOutputDevice,)
+            def __init__(self):
+                self.written = []
+            def display_data(self, *data):
+                self.written.append(data)
+            def display_data_onto_image(self, *data, **kwargs):
+                return data
+        screen = Screen()
+        proxy = OutputProxy("a")
+        screen.init_proxy(proxy)
+        # character displays can't show images, so they don't get a render thread
+        screen.start_render_thread(1000)
+        assert screen.render_thread is None
+        screen.attach_proxy(proxy)
+        proxy.display_data("line1", "line2")
+        assert screen.written == [("line1", "line2")]
+
+    def test_frame_listener(self):
+        screen, (a, b) = self.make_screen()
+        frames = []
+        screen.add_frame_listener(frames.append)
+        screen.attach_proxy(a)
+        a.display_image(0)
+        b.display_image(1) # not current, not shown
+        a.clear()
+        screen.remove_frame_listener(frames.append)
+        a.display_image(2)
+        assert frames == [0, None]
+
+    def test_screen_recording(self):
+        import tempfile
+        from PIL import Image, ImageDraw
+        from apps.utils.screenshot.screen_recording import Recorder, read_recording
+        images = []
+        for i in range(5):
+            image = Image.new("1", (128, 64))
+            ImageDraw.Draw(image).text((i, 10), "frame {}".format(i), fill="white")
+            images.append(image)
+        images.append(Image.new("RGB", (240, 240), "green"))
+        with tempfile.TemporaryDirectory() as d:
+            path = os.path.join(d, "recording.zrec")
+            recorder = Recorder(path, keyframe_interval=2)
+            # a clear before any frames is skipped, later clears are recorded as blank frames
+            recorder.push(None)
+            for image in images[:3] + [images[2]] + images[3:]:
+                recorder.push(image)
+            recorder.push(None)
+            images.append(Image.new("RGB", (240, 240)))
+            recorder.stop()
+            assert recorder.frames == len(images) # the repeated frame is skipped
+            frames = list(read_recording(path))
+            # a partially written record is ignored
+            with open(path, "ab") as f:
+                f.write(b"\x00"*10)
+            assert len(list(read_recording(path))) == len(images)
+        assert [image.tobytes() for _, image in frames] == [image.tobytes() for image in images]
+        assert [image.mode for _, image in frames] == [image.mode for image in images]
+        timestamps = [t for t, _ in frames]
+        assert timestamps == sorted(timestamps)
+
+class TestLinesToImage(unittest.TestCase):
+    """Tests that text pasted from the line cache looks the same as text drawn with ImageDraw"""
+
+    def test_line_cache(self):
+        from PIL import Image, ImageDraw, ImageFont
+        from output.output import lines_to_image
+        from zpui_lib.ui.canvas import fonts_dir
+        lines = ["Main menu", "> Settings jgq_", "", "   ", "a"*40]
+        fonts = [(ImageFont.load(os.path.join(fonts_dir, "courB08.pil")), (8, 6), (128, 64)),
+                 (ImageFont.truetype(os.path.join(fonts_dir, "Fixedsys62.ttf"), 16), (16, 8), (240, 240))]
+        for font, (cheight, cwidth), size in fonts:
+            for mode, color in (("1", "white"), ("RGB", "#00cafe")):
+                drawn = Image.new(mode, size)
+                lines_to_image(ImageDraw.Draw(drawn), lines, font, cheight, cwidth, color, (6, 8), True)
+                for i in range(2): # second time, from the cache
+                    pasted = Image.new(mode, size)
+                    lines_to_image(ImageDraw.Draw(pasted), lines, font, cheight, cwidth, color, (6, 8), True, image=pasted)
+                    assert drawn.tobytes() == pasted.tobytes(), (size, mode)
+
+class TestHD44780(unittest.TestCase):
+    """Tests the character display diffing logic"""
+
+    def make_screen(self):
+        from output.drivers.hd44780 import HD44780
+        class Screen(HD44780):
+            def __init__(self, **kwargs):
+                self.log = []
+                HD44780.__init__(self, do_init=False, **kwargs)
+            def write_byte(self, byte, char_mode=False):
+                self.log.append(("byte", byte, char_mode))
+            def write_chars(self, data):
+                self.log.append(("chars", bytes(data)))
+        return Screen(cols=20, rows=4)
+
+    def test_changed_spans(self):
+        screen = self.make_screen()
+        screen.buffer = ["Main menu".ljust(20), " Settings".ljust(20), " Wireless".ljust(20), " Apps".ljust(20)]
+        screen.display_data("Main menu", ">Settings", " Wireless", " Apes")
+        assert screen.log == [("byte", screen.LCD_SETDDRAMADDR | 0x40, False), ("chars", b">"),
+                              ("byte", screen.LCD_SETDDRAMADDR | 0x54 + 3, False), ("chars", b"e")]
+        screen.log = []
+        # spans separated by one char are sent together
+        assert screen.get_changed_spans("abcdef", "xbydeZ") == [[0, 3], [5, 6]]
+        screen.display_data("Main menu", ">Settings", " Wireless", " Apes")
+        assert screen.log == []
+
+    def test_cgram_cache(self):
+        screen = self.make_screen()
+        char = [0x1f, 0x11, 0x11, 0x11, 0x11, 0x11, 0x11, 0x1f]
+        screen.createChar(0, char)
+        assert ("chars", bytes(char)) in screen.log
+        screen.log = []
+        screen.createChar(0, list(char))
+        assert screen.log == []
+        screen.createChar(1, char)
+        assert ("chars", bytes(char)) in screen.log
+
+class TestFramebufferLib(unittest.TestCase):
+    """Tests the framebuffer pixel format converters"""
+
+    def test_converters(self):
+        from PIL import Image
+        from output.drivers.framebuffer_lib import _CONVERTER
+        image = Image.new("RGB", (2, 1))
+        image.putpixel((0, 0), (0x12, 0x34, 0x56))
+        image.putpixel((1, 0), (255, 255, 255))
+        expected = {
+            ("RGB", 16): bytes([0xaa, 0x11, 0xff, 0xff]),
+            ("RGB", 24): bytes([0x12, 0x34, 0x56, 255, 255, 255]),
+            ("RGB", 32): bytes([255, 0x12, 0x34, 0x56, 255, 255, 255, 255]),
+            ("1", 16): bytes([0, 0, 0xff, 0xff]),
+            ("1", 24): bytes([0, 0, 0, 255, 255, 255]),
+            ("1", 32): bytes([255, 0, 0, 0, 255, 255, 255, 255]),
+        }
+        for (mode, bpp), data in expected.items():
+            converted = _CONVERTER[(mode, bpp)](image.convert(mode, dither=Image.Dither.NONE))
+            assert bytes(converted) == data, (mode, bpp, bytes(converted))
+        assert bytes(_CONVERTER[("RGBA", 16)](image.convert("RGBA"))) == expected[("RGB", 16)]
+
 if __name__ == '__main__':
     unittest.main()
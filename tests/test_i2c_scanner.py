@@ -0,0 +1,107 @@
+"""tests for the i2ctools app's bus scanner, using fake buses"""
+import os
+import errno
+import unittest
+from time import sleep, monotonic
+
+try:
+    from apps.hardware_apps.i2ctools.i2c_scanner import I2CScanner
+except ImportError:
+    print("Absolute imports failed, trying relative imports")
+    os.sys.path.append(os.path.dirname(os.path.abspath('.')))
+    from apps.hardware_apps.i2ctools.i2c_scanner import I2CScanner
+
+# bus number: {address: errno the probe fails with, or None if the device answers}
+fake_buses = {
+    1: {0x1f: None, 0x22: errno.EBUSY, 0x50: None},
+    2: {0x3c: None},
+    3: {0x10: errno.ETIMEDOUT},
+}
+
+
+class FakeBus(object):
+    probe_delay = 0.002
+
+    def __init__(self, num):
+        if num not in fake_buses:
+            raise FileNotFoundError(errno.ENOENT, "No such file or directory")
+        self.num = num
+        self.devices = fake_buses[num]
+        self.probes = []
+
+    def probe(self, method, address):
+        self.probes.append((method, address))
+        sleep(self.probe_delay)
+        if address not in self.devices:
+            raise OSError(errno.EREMOTEIO, "Remote I/O error")
+        if self.devices[address] is not None:
+            raise OSError(self.devices[address], os.strerror(self.devices[address]))
+
+    def read_byte(self, address):
+        self.probe("read_byte", address)
+
+    def write_quick(self, address):
+        self.probe("write_quick", address)
+
+    def close(self):
+        pass
+
+
+class TestI2CScanner(unittest.TestCase):
+    """tests the I2CScanner class"""
+
+    def test_parallel_scan(self):
+        """Buses are scanned at the same time, results are streamed as they're found"""
+        found = []
+        probe_times = {}
+        class TimedBus(FakeBus):
+            def probe(self, method, address):
+                probe_times.setdefault(self.num, []).append(monotonic())
+                FakeBus.probe(self, method, address)
+        scanner = I2CScanner(bus_class=TimedBus)
+        results = scanner.scan([1, 2], (0x03, 0x77), callback=lambda r, a, s: found.append((r.bus, a, s)))
+        for result in results.values():
+            result.wait(5)
+        # each bus started being scanned before the other one was finished
+        self.assertLess(min(probe_times[1]), max(probe_times[2]))
+        self.assertLess(min(probe_times[2]), max(probe_times[1]))
+        self.assertEqual(results[1].to_dict(), {0x1f:"ok", 0x22:"busy", 0x50:"ok"})
+        self.assertEqual(results[2].to_dict(), {0x3c:"ok"})
+        self.assertIn((1, 0x22, "busy"), found)
+        self.assertIn((2, None, None), found)
+        self.assertIs(scanner.get_cached(1), results[1])
+        self.assertIsNone(scanner.get_cached(1, max_age=-1))
+
+    def test_probe_modes(self):
+        """Like i2cdetect, EEPROM addresses are read, others are probed with a quick write"""
+        buses = []
+        class RecordingBus(FakeBus):
+            def __init__(self, num):
+                FakeBus.__init__(self, num)
+                buses.append(self)
+        scanner = I2CScanner(bus_class=RecordingBus)
+        scanner.scan_and_wait([1], (0x03, 0x77))
+        methods = dict((address, method) for method, address in buses[0].probes)
+        self.assertEqual(methods[0x50], "read_byte")
+        self.assertEqual(methods[0x33], "read_byte")
+        self.assertEqual(methods[0x1f], "write_quick")
+        scanner.scan_and_wait([1], (0x03, 0x77), mode="read")
+        self.assertEqual(set(method for method, _ in buses[1].probes), {"read_byte"})
+
+    def test_errors(self):
+        """A stuck or missing bus doesn't affect the others"""
+        scanner = I2CScanner(bus_class=FakeBus)
+        results = scanner.scan_and_wait([1, 3, 4], (0x03, 0x77))
+        self.assertEqual(results[3].to_dict(), "bus stuck")
+        self.assertEqual(results[4].to_dict(), "no such bus")
+        self.assertEqual(results[1].status, "ok")
+
+    def test_timeout(self):
+        scanner = I2CScanner(bus_class=FakeBus)
+        result = scanner.scan_and_wait([1], (0x03, 0x77), timeout=0.01)[1]
+        self.assertEqual(result.status, "timeout")
+        self.assertEqual(result.to_dict()["status"], "timeout")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -5,12 +5,12 @@ from threading import Event
 from mock import patch, Mock
 
 try:
-    from input.input import InputProcessor
+    from input.input import InputProcessor, InputProxy, InputQueue
     from zpui_lib.helpers import cb_needs_key_state, KEY_PRESSED, KEY_RELEASED, KEY_HELD
 except (ValueError, ImportError) as e:
     print("Absolute imports failed, trying relative imports")
     os.sys.path.append(os.path.dirname(os.path.abspath('.')))
-    from input.input import InputProcessor
+    from input.input import InputProcessor, InputProxy, InputQueue
     from zpui_lib.helpers import cb_needs_key_state, KEY_PRESSED, KEY_RELEASED, KEY_HELD
 
 def get_mock_callback(**kwargs):
@@ -94,6 +94,254 @@ class TestInputProcessor(unittest.TestCase):
         assert(cb.call_args[0] == (dk, KEY_HELD))
         assert(cb.call_count == 4)
 
+    def test_dispatch_table_lookup_order(self):
+        """Keymaps are looked up in the right order, and changes to them are picked up"""
+        i = InputProcessor({}, None)
+        p = InputProxy("test")
+        i.attach_proxy(p)
+        simple_cb, maskable_cb, nonmaskable_cb, streaming_cb, global_cb = [get_mock_callback() for _ in range(5)]
+        p.set_maskable_callback("KEY_F1", maskable_cb)
+        i.process_key(("KEY_F1", KEY_PRESSED))
+        assert(maskable_cb.call_count == 1)
+        # Simple callbacks mask maskable callbacks
+        p.set_callback("KEY_F1", simple_cb)
+        i.process_key(("KEY_F1", KEY_PRESSED))
+        assert(maskable_cb.call_count == 1)
+        assert(simple_cb.call_count == 1)
+        p.clear_keymap()
+        i.process_key(("KEY_F1", KEY_PRESSED))
+        assert(maskable_cb.call_count == 2)
+        # Streaming callback gets the keys that aren't in the keymaps
+        p.set_streaming(streaming_cb)
+        i.process_key(("KEY_F2", KEY_PRESSED))
+        assert(streaming_cb.call_args[0] == ("KEY_F2",))
+        # Backlight callback only swallows keys that aren't nonmaskable/global
+        i.backlight_cb = lambda: True
+        p.set_nonmaskable_callback("KEY_F3", nonmaskable_cb)
+        i.set_global_callback("KEY_F4", global_cb)
+        for key in ("KEY_F1", "KEY_F2", "KEY_F3", "KEY_F4"):
+            i.process_key((key, KEY_PRESSED))
+        assert(maskable_cb.call_count == 2)
+        assert(streaming_cb.call_count == 1)
+        assert(nonmaskable_cb.call_count == 1)
+        assert(global_cb.call_count == 1)
+        # In-place changes to proxy-owned keymaps are picked up, too
+        i.backlight_cb = None
+        p.maskable_keymap.pop("KEY_F1")
+        i.process_key(("KEY_F1", KEY_PRESSED))
+        assert(maskable_cb.call_count == 2)
+        assert(streaming_cb.call_count == 2)
+
+    def test_dispatch_keymap_changed_in_place(self):
+        """Changes to the dictionary passed to set_keymap are picked up after the dispatch table is built"""
+        i = InputProcessor({}, None)
+        p = InputProxy("test")
+        i.attach_proxy(p)
+        cb1, cb2, cb3 = [get_mock_callback() for _ in range(3)]
+        keymap = {"KEY_ENTER":cb1}
+        p.set_keymap(keymap)
+        i.process_key(("KEY_ENTER", KEY_PRESSED))
+        assert(cb1.call_count == 1)
+        # Like BaseUIElement.update_keymap does
+        keymap.update({"KEY_ENTER":cb2, "KEY_DOWN":cb3})
+        i.process_key(("KEY_ENTER", KEY_PRESSED))
+        i.process_key(("KEY_DOWN", KEY_PRESSED))
+        assert(cb1.call_count == 1)
+        assert(cb2.call_count == 1)
+        assert(cb3.call_count == 1)
+        keymap.pop("KEY_DOWN")
+        i.process_key(("KEY_DOWN", KEY_PRESSED))
+        assert(cb3.call_count == 1)
+
+    def test_global_key_in_nonmaskable_keymap(self):
+        """A global key that's also in the proxy's nonmaskable keymap is ignored, unless force-processed globally"""
+        i = InputProcessor({}, None)
+        p = InputProxy("test")
+        i.attach_proxy(p)
+        global_cb, nonmaskable_cb = get_mock_callback(), get_mock_callback()
+        i.set_global_callback("KEY_F1", global_cb)
+        p.set_nonmaskable_callback("KEY_F1", nonmaskable_cb)
+        i.process_key(("KEY_F1", KEY_PRESSED))
+        assert(global_cb.call_count == 0)
+        assert(nonmaskable_cb.call_count == 0)
+        # Without the nonmaskable callback, the global callback is called
+        p.nonmaskable_keymap.pop("KEY_F1")
+        i.process_key(("KEY_F1", KEY_PRESSED))
+        assert(global_cb.call_count == 1)
+
+    def test_event_loop_wakes_on_key(self):
+        """Event loop processes a key as soon as it's received, and exits as soon as it's stopped"""
+        i = InputProcessor({}, None)
+        p = InputProxy("test")
+        e = Event()
+        p.set_callback("KEY_ENTER", e.set)
+        i.listen()
+        # A key received before a proxy is attached is kept in the queue
+        i.receive_key("KEY_ENTER", KEY_PRESSED)
+        assert(not e.wait(0.05))
+        i.attach_proxy(p)
+        assert(e.wait(1))
+        e.clear()
+        i.receive_key("KEY_ENTER", KEY_PRESSED)
+        assert(e.wait(1))
+        i.stop_listen()
+        i.processor_thread.join(1)
+        assert(not i.processor_thread.is_alive())
+
+    def test_event_loop_handoff(self):
+        """A new event loop takes over keys once the old one is stopped"""
+        i = InputProcessor({}, None)
+        p = InputProxy("test")
+        e = Event()
+        p.set_callback("KEY_ENTER", e.set)
+        i.attach_proxy(p)
+        i.listen()
+        old_thread = i.processor_thread
+        i.stop_listen()
+        old_thread.join(1)
+        assert(not old_thread.is_alive())
+        i.listen()
+        i.receive_key("KEY_ENTER", KEY_PRESSED)
+        assert(e.wait(1))
+        i.atexit()
+
+
+class TestInputQueue(unittest.TestCase):
+    """Tests InputQueue coalescing and backpressure"""
+
+    def get_all(self, q):
+        items = []
+        while True:
+            item = q.get_when(lambda: not q._qsize(), lambda: True)
+            if item is None:
+                return items
+            items.append(item)
+
+    def test_no_policy(self):
+        q = InputQueue()
+        for i in range(3):
+            q.put(("KEY_DOWN", KEY_PRESSED))
+        assert(len(self.get_all(q)) == 3)
+
+    def test_coalescing(self):
+        q = InputQueue(coalesce_keys=["KEY_DOWN"])
+        for i in range(3):
+            q.put(("KEY_DOWN", KEY_PRESSED))
+            q.put(("KEY_DOWN", KEY_RELEASED))
+        q.put("KEY_DOWN")
+        q.put("KEY_DOWN")
+        # Not coalescing other keys
+        q.put(("KEY_UP", KEY_HELD))
+        q.put(("KEY_UP", KEY_HELD))
+        assert(self.get_all(q) == [("KEY_DOWN", KEY_PRESSED), ("KEY_DOWN", KEY_RELEASED), "KEY_DOWN", ("KEY_UP", KEY_HELD), ("KEY_UP", KEY_HELD)])
+        assert(q.get_stats() == {"queued":0, "merged":5, "dropped":0})
+
+    def test_held_deadline(self):
+        q = InputQueue(held_deadline=0)
+        q.put(("KEY_DOWN", KEY_PRESSED))
+        q.put(("KEY_DOWN", KEY_HELD))
+        q.put(("KEY_DOWN", KEY_RELEASED))
+        assert(self.get_all(q) == [("KEY_DOWN", KEY_PRESSED), ("KEY_DOWN", KEY_RELEASED)])
+        assert(q.get_stats()["dropped"] == 1)
+
+    def test_max_size_drop_order(self):
+        """Held events are dropped first, then coalescible keys, and presses are dropped together with releases"""
+        q = InputQueue(coalesce_keys=["KEY_DOWN"], max_size=4)
+        q.put(("KEY_ENTER", KEY_PRESSED))
+        q.put(("KEY_DOWN", KEY_PRESSED))
+        q.put(("KEY_DOWN", KEY_HELD))
+        q.put(("KEY_ENTER", KEY_RELEASED))
+        # Queue full - KEY_HELD goes first
+        q.put(("KEY_UP", KEY_PRESSED))
+        # Then, KEY_DOWN press - and its release, once it arrives
+        q.put(("KEY_UP", KEY_RELEASED))
+        q.put(("KEY_DOWN", KEY_RELEASED))
+        assert(self.get_all(q) == [("KEY_ENTER", KEY_PRESSED), ("KEY_ENTER", KEY_RELEASED), ("KEY_UP", KEY_PRESSED), ("KEY_UP", KEY_RELEASED)])
+        assert(q.get_stats()["dropped"] == 3)
+        # A press dropped with its release already queued
+        q.put(("KEY_ENTER", KEY_PRESSED))
+        q.put(("KEY_ENTER", KEY_RELEASED))
+        q.put(("KEY_UP", KEY_PRESSED))
+        q.put(("KEY_UP", KEY_RELEASED))
+        q.put(("KEY_F1", KEY_PRESSED))
+        assert(self.get_all(q) == [("KEY_UP", KEY_PRESSED), ("KEY_UP", KEY_RELEASED), ("KEY_F1", KEY_PRESSED)])
+        assert(q.get_stats()["dropped"] == 5)
+
+    def test_held_after_release(self):
+        """KEY_HELD events never come after the key's release"""
+        q = InputQueue(coalesce_keys=["KEY_DOWN"])
+        q.put(("KEY_DOWN", KEY_PRESSED))
+        q.put(("KEY_DOWN", KEY_RELEASED))
+        # merged into the press+release that's already waiting, so is the release
+        q.put(("KEY_DOWN", KEY_PRESSED))
+        q.put(("KEY_DOWN", KEY_HELD))
+        q.put(("KEY_DOWN", KEY_RELEASED))
+        assert(self.get_all(q) == [("KEY_DOWN", KEY_PRESSED), ("KEY_DOWN", KEY_RELEASED)])
+        assert(q.get_stats()["merged"] == 3)
+        # the press is dropped to make room, and so are the events that follow it
+        q = InputQueue(max_size=2)
+        q.put(("KEY_ENTER", KEY_PRESSED))
+        q.put(("KEY_ENTER", KEY_HELD))
+        q.put(("KEY_UP", KEY_PRESSED))
+        q.put(("KEY_UP", KEY_RELEASED))
+        q.put(("KEY_UP", KEY_HELD))
+        q.put(("KEY_ENTER", KEY_HELD))
+        q.put(("KEY_ENTER", KEY_RELEASED))
+        assert(self.get_all(q) == [("KEY_UP", KEY_PRESSED), ("KEY_UP", KEY_RELEASED)])
+        assert(q.get_stats()["dropped"] == 5)
+
+    def test_orphaned_release_cleared_by_press(self):
+        """A release isn't swallowed if a press that wasn't merged came after the merged one"""
+        q = InputQueue(coalesce_keys=["KEY_DOWN"])
+        q.put(("KEY_DOWN", KEY_PRESSED))
+        q.put(("KEY_DOWN", KEY_RELEASED))
+        q.put(("KEY_DOWN", KEY_PRESSED)) # merged, no release coming from the driver
+        assert(len(self.get_all(q)) == 2)
+        q.put(("KEY_DOWN", KEY_PRESSED))
+        q.put(("KEY_DOWN", KEY_RELEASED))
+        assert(self.get_all(q) == [("KEY_DOWN", KEY_PRESSED), ("KEY_DOWN", KEY_RELEASED)])
+
+
+class TestDeviceIndex(unittest.TestCase):
+    """Tests the inotify-based input device index used for hotplug"""
+
+    def test_add_remove(self):
+        import tempfile
+        from input import hotplug
+        opened = []
+        def open_device(path):
+            opened.append(path)
+            device = Mock(capabilities=Mock(return_value={1:[28]}))
+            device.name = os.path.basename(path)
+            return device
+        fake_evdev = Mock()
+        fake_evdev.InputDevice = open_device
+        fake_evdev.list_devices = lambda d: [os.path.join(d, f) for f in os.listdir(d) if f.startswith("event")]
+        with tempfile.TemporaryDirectory() as input_dir, patch.object(hotplug, "evdev", fake_evdev):
+            open(os.path.join(input_dir, "event0"), "w").close()
+            index = hotplug.DeviceIndex(input_dir=input_dir)
+            events = []
+            changed = Event()
+            def cb(event, info):
+                events.append((event, info["path"]))
+                changed.set()
+            index.register_callback(cb)
+            index.start()
+            assert index.inotify is not None
+            assert [(d["path"], d["name"]) for d in index.get_devices()] == [(os.path.join(input_dir, "event0"), "event0")]
+            changed.clear()
+            path = os.path.join(input_dir, "event1")
+            open(path, "w").close()
+            assert changed.wait(1)
+            assert events[-1] == ("added", path)
+            changed.clear()
+            os.remove(path)
+            assert changed.wait(1)
+            assert events[-1] == ("removed", path)
+            # files that aren't event devices are ignored, and every device was only opened once
+            open(os.path.join(input_dir, "mice"), "w").close()
+            assert opened == [os.path.join(input_dir, "event0"), path]
+            assert len(index.get_devices()) == 1
 
 if __name__ == '__main__':
     unittest.main()
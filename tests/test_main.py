@@ -30,6 +30,17 @@ class TestMainPy(unittest.TestCase):
     """tests main.py launcher"""
     test_config_paths = ["tests/test_config.json", "test_config.json"]
 
+    def setUp(self):
+        # keeping the app manifest out of the repository
+        import tempfile
+        from apps.app_manager import AppManager
+        self.manifest_dir = tempfile.TemporaryDirectory()
+        manifest_path = os.path.join(self.manifest_dir.name, "app_manifest.json")
+        patcher = patch.object(AppManager, 'get_default_manifest_path', return_value=manifest_path)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(self.manifest_dir.cleanup)
+
     @patch.object(main_py, 'config_paths', test_config_paths)
     def test_load_config(self):
         """Tests whether main.py=>load_config loads test config files"""
@@ -67,6 +78,78 @@ class TestMainPy(unittest.TestCase):
             main_py.launch()
         assert(e_wrapper_called.is_set())
 
+    def test_launch_lazy(self):
+        main_py.zpui = main_py.ZPUI()
+        main_py.zpui.config = {"input":[{"driver":"test_input"}], "output":[{"driver":"test_output"}], \
+                               "app_manager":{"lazy_load":True}}
+        with patch.object(main_py, 'exception_wrapper'):
+            main_py.launch()
+        from apps.app_manager import LazyApp
+        app_man = main_py.zpui.app_man
+        # apps with a set_context hook are loaded at boot, others aren't
+        assert not isinstance(app_man.app_list["apps/service_apps/zeromenu"], LazyApp)
+        lazy_app = app_man.app_list["apps/utils/stopwatch"]
+        assert isinstance(lazy_app, LazyApp)
+        context = main_py.zpui.cm.contexts["apps.utils.stopwatch"]
+        assert context.target == lazy_app.callback
+        # menu name comes from the app class, without importing the app
+        assert context.menu_name == "Stopwatch"
+        app = app_man.load_lazy_app("apps/utils/stopwatch")
+        assert app_man.app_list["apps/utils/stopwatch"] is app
+        assert context.target == app.on_start
+        main_py.zpui.input_processor.atexit()
+
+    def test_launch_sequential(self):
+        main_py.zpui = main_py.ZPUI()
+        main_py.zpui.config = {"input":[{"driver":"test_input"}], "output":[{"driver":"test_output"}], \
+                               "app_manager":{"load_threads":1}}
+        with patch.object(main_py, 'exception_wrapper'):
+            main_py.launch()
+        app_man = main_py.zpui.app_man
+        assert "apps/utils/stopwatch" in app_man.app_list
+        assert set(app_man.load_times["apps/utils/stopwatch"]) == {"import", "init", "can_load"}
+        main_py.zpui.input_processor.atexit()
+
+    def test_profile_startup(self):
+        import json, tempfile
+        main_py.zpui = main_py.ZPUI()
+        main_py.zpui.config = {"input":[{"driver":"test_input"}], "output":[{"driver":"test_output"}]}
+        with tempfile.TemporaryDirectory() as d:
+            path = os.path.join(d, "trace.json")
+            with patch.object(main_py, 'exception_wrapper'):
+                main_py.launch(profile_startup=path)
+            with open(path) as f:
+                trace = json.load(f)
+        assert not main_py.profiler.enabled
+        names = [event["name"] for event in trace["traceEvents"]]
+        for name in ("startup", "init", "output.init", "init input driver test_input", "load_all_apps", \
+                     "import apps/utils/stopwatch", "init apps/utils/stopwatch"):
+            assert name in names, name
+        main_py.zpui.input_processor.atexit()
+
+    def test_app_manifest(self):
+        import tempfile
+        from apps.app_manager import AppManifest
+        with tempfile.TemporaryDirectory() as d:
+            dep = os.path.join(d, "__init__.py")
+            open(dep, "w").close()
+            manifest = AppManifest(os.path.join(d, "manifest.json"))
+            assert not manifest.load()
+            compute = Mock(return_value=["a", "b"])
+            assert manifest.get_or_compute("ordering", compute, [dep]) == ["a", "b"]
+            manifest.save()
+            # cached - compute isn't called again
+            manifest = AppManifest(manifest.path)
+            assert manifest.load()
+            assert manifest.get_or_compute("ordering", compute, [dep]) == ["a", "b"]
+            assert compute.call_count == 1
+            # a dependency changed - cache is discarded
+            os.utime(dep, ns=(0, 0))
+            manifest = AppManifest(manifest.path)
+            assert not manifest.load()
+            manifest.get_or_compute("ordering", compute, [dep])
+            assert compute.call_count == 2
+
 
 if __name__ == '__main__':
     unittest.main()
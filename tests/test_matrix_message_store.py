@@ -0,0 +1,83 @@
+"""tests for the Matrix app's message storage"""
+import os
+import shutil
+import tempfile
+import unittest
+
+try:
+    from apps.messaging_apps.matrix.message_store import RoomMessages, MessageCache
+except ImportError:
+    print("Absolute imports failed, trying relative imports")
+    os.sys.path.append(os.path.dirname(os.path.abspath('.')))
+    from apps.messaging_apps.matrix.message_store import RoomMessages, MessageCache
+
+
+def make_message(num, timestamp=None):
+    return {"id":"$event{}".format(num), "timestamp":timestamp if timestamp is not None else num*1000,
+            "type":"m.room.message", "sender":"@user:matrix.org", "content":"message {}".format(num)}
+
+
+class TestRoomMessages(unittest.TestCase):
+    """tests the RoomMessages class"""
+
+    def test_order(self):
+        """Messages are kept sorted, no matter the order they're added in"""
+        messages = RoomMessages()
+        self.assertEqual(messages.add(make_message(5)), 0)
+        self.assertEqual(messages.add(make_message(7)), 1)
+        # a backfilled message
+        self.assertEqual(messages.add(make_message(1)), 0)
+        self.assertEqual(messages.add(make_message(6)), 2)
+        self.assertEqual([m["id"] for m in messages.get_messages()], ["$event1", "$event5", "$event6", "$event7"])
+
+    def test_bounded(self):
+        messages = RoomMessages(max_messages=3)
+        for num in range(10, 15):
+            messages.add(make_message(num))
+        self.assertEqual([m["id"] for m in messages.get_messages()], ["$event12", "$event13", "$event14"])
+        # older than the whole history
+        self.assertIsNone(messages.add(make_message(1)))
+        # unless the history isn't trimmed
+        self.assertEqual(messages.add(make_message(1), trim=False), 0)
+        self.assertEqual(len(messages.get_messages()), 4)
+        messages.trim()
+        self.assertEqual(len(messages.get_messages()), 3)
+
+    def test_seen(self):
+        messages = RoomMessages(max_seen=2)
+        self.assertFalse(messages.check_seen("$a"))
+        self.assertTrue(messages.check_seen("$a"))
+        self.assertFalse(messages.check_seen("$b"))
+        self.assertFalse(messages.check_seen("$c"))
+        # the least recently seen event is forgotten
+        self.assertFalse(messages.check_seen("$a"))
+
+
+class TestMessageCache(unittest.TestCase):
+    """tests the MessageCache class"""
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, "messages.db")
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_persistence(self):
+        cache = MessageCache(self.path, max_messages=5)
+        for num in range(8):
+            cache.add("!room:matrix.org", make_message(num))
+        cache.add("!room:matrix.org", make_message(3)) # duplicates are ignored
+        member = dict(make_message(10), type="m.room.member", membership="join")
+        cache.add("!other:matrix.org", member)
+        cache = MessageCache(self.path, max_messages=5)
+        messages = cache.load("!room:matrix.org")
+        self.assertEqual([m["id"] for m in messages], ["$event{}".format(num) for num in range(3, 8)])
+        self.assertEqual(messages[0], make_message(3))
+        self.assertEqual(cache.load("!other:matrix.org"), [member])
+        cache.clear()
+        self.assertEqual(cache.load("!room:matrix.org"), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,79 @@
+"""tests for the scripts app's streaming command runner"""
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+from time import sleep, monotonic
+
+try:
+    from apps.scripts.script_runner import ScriptRunner
+except ImportError:
+    print("Absolute imports failed, trying relative imports")
+    os.sys.path.append(os.path.dirname(os.path.abspath('.')))
+    from apps.scripts.script_runner import ScriptRunner
+
+
+class TestScriptRunner(unittest.TestCase):
+    """tests the ScriptRunner class"""
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_output(self):
+        """Only the last lines are kept in memory, all of them are written into the file"""
+        path = os.path.join(self.dir, "output")
+        runner = ScriptRunner("for i in $(seq 1 100); do echo line $i; done; echo error >&2; printf end", \
+                              shell=True, max_lines=10, output_path=path)
+        runner.start()
+        self.assertEqual(runner.wait(5), 0)
+        self.assertEqual(runner.get_tail(2), ["error", "end"])
+        self.assertEqual(runner.get_output().split("\n"), ["(91 lines not shown)"] + ["line {}".format(i) for i in range(92, 101)] + ["error", "end"])
+        with open(path) as f:
+            lines = f.read().split("\n")
+        self.assertEqual(len(lines), 102)
+        self.assertEqual(lines[-1], "end")
+
+    def test_output_file_error(self):
+        """Output is still read if the output file can't be created"""
+        path = os.path.join(self.dir, "nonexistent", "output")
+        runner = ScriptRunner("echo line", shell=True, output_path=path)
+        runner.start()
+        self.assertEqual(runner.wait(5), 0)
+        self.assertEqual(runner.get_output(), "line")
+        self.assertFalse(os.path.exists(path))
+
+    def test_streaming(self):
+        """Output is available while the command is still running"""
+        runner = ScriptRunner([sys.executable, "-u", "-c", "import time; print('started'); time.sleep(5)"])
+        runner.start()
+        start = monotonic()
+        while not runner.get_tail(1) and monotonic() - start < 5:
+            sleep(0.05)
+        self.assertEqual(runner.get_tail(1), ["started"])
+        self.assertTrue(runner.is_running())
+        runner.cancel()
+        self.assertFalse(runner.is_running())
+        self.assertTrue(runner.cancelled)
+
+    def test_cancel_kill(self):
+        """Commands that ignore SIGTERM get killed, along with the commands they've started"""
+        runner = ScriptRunner("trap '' TERM; sleep 10 & wait", shell=True)
+        runner.start()
+        sleep(0.2)
+        start = monotonic()
+        runner.cancel(timeout=0.5)
+        self.assertEqual(runner.wait(2), -9)
+        self.assertLess(monotonic() - start, 2)
+
+    def test_not_found(self):
+        runner = ScriptRunner([os.path.join(self.dir, "nonexistent")])
+        with self.assertRaises(OSError):
+            runner.start()
+
+
+if __name__ == '__main__':
+    unittest.main()